@@ -33,6 +33,7 @@ class Category(object):
             self._logger.critical('', exc_info=True)
 
         self.xxx_filter = XXXFilter(install_dir)
+        self._compile_rules()
 
         self._logger.debug("category: Categories defined by user: %s", self.getCategoryNames())
 
@@ -85,6 +86,14 @@ class Category(object):
         comment = torrent_dict.get('comment')
         return self.calculateCategoryNonDict(files_list, display_name, tracker, comment)
 
+    def calculateCategories(self, torrents):
+        """
+        Calculates the categories of a batch of torrents.
+        @param torrents An iterable of (torrent_dict, display_name) tuples.
+        @return A list of category names, in the same order as torrents.
+        """
+        return [self.calculateCategory(torrent_dict, display_name) for torrent_dict, display_name in torrents]
+
     def calculateCategoryNonDict(self, files_list, display_name, tracker, comment):
         # Check xxx
         try:
@@ -95,11 +104,15 @@ class Category(object):
             self._logger.critical(
                 'Category: Exception in explicit terms filter in torrent: %s', display_name, exc_info=True)
 
+        # the keywords and suffixes of the torrent are looked up once for all categories
+        name_keywords = self._getKeywords(display_name.lower())
+        files = [_CategoryFile(self, name, length) for name, length in files_list]
+
         torrent_category = None
         # filename_list ready
         strongest_cat = 0.0
-        for category in self.category_info:  # for each category
-            (decision, strength) = self.judge(category, files_list, display_name)
+        for index, category in enumerate(self.category_info):  # for each category
+            (decision, strength) = self._judge(index, category, files, name_keywords)
             if decision and (strength > strongest_cat):
                 torrent_category = category['name']
                 strongest_cat = strength
@@ -112,18 +125,15 @@ class Category(object):
     # judge whether a torrent file belongs to a certain category
     # return bool
     def judge(self, category, files_list, display_name=''):
+        index = self.category_info.index(category)
+        files = [_CategoryFile(self, name, length) for name, length in files_list]
+        return self._judge(index, category, files, self._getKeywords(display_name.lower()))
 
+    def _judge(self, index, category, files, name_keywords):
         # judge file keywords
-        display_name = display_name.lower()
         factor = 1.0
-        fileKeywords = self._getWords(display_name)
-
-        for ikeywords in category['keywords'].keys():
-            try:
-                fileKeywords.index(ikeywords)
-                factor *= 1 - category['keywords'][ikeywords]
-            except:
-                pass
+        for ikeywords in name_keywords:
+            factor *= 1 - category['keywords'].get(ikeywords, 0.0)
         if (1 - factor) > 0.5:
             if 'strength' in category:
                 return (True, category['strength'])
@@ -133,33 +143,22 @@ class Category(object):
         # judge each file
         matchSize = 0
         totalSize = 1e-19
-        for name, length in files_list:
+        for category_file in files:
+            length = category_file.length
             totalSize += length
             # judge file size
             if length < category['minfilesize'] or 0 < category['maxfilesize'] < length:
                 continue
 
             # judge file suffix
-            OK = False
-            for isuffix in category['suffix']:
-                if name.lower().endswith(isuffix):
-                    OK = True
-                    break
-            if OK:
+            if index in category_file.suffix_categories:
                 matchSize += length
                 continue
 
             # judge file keywords
             factor = 1.0
-            fileKeywords = self._getWords(name.lower())
-
-            for ikeywords in category['keywords'].keys():
-                try:
-                    fileKeywords.index(ikeywords)
-                    # print ikeywords
-                    factor *= 1 - category['keywords'][ikeywords]
-                except:
-                    pass
+            for ikeywords in category_file.keywords:
+                factor *= 1 - category['keywords'].get(ikeywords, 0.0)
             if factor < 0.5:
                 matchSize += length
 
@@ -177,6 +176,51 @@ class Category(object):
     def _getWords(self, string):
         return self.WORDS_REGEXP.findall(string)
 
+    def _compile_rules(self):
+        """
+        Compiles the category rules for classification: a single regular expression that finds the
+        keywords of all categories, and a dictionary that maps file suffixes to the categories that
+        contain them.
+        """
+        # keywords only ever match a complete word, so keywords that are not a word never match
+        keywords = set(keyword for category in self.category_info for keyword in category['keywords']
+                       if self._getWords(keyword) == [keyword])
+        if keywords:
+            self._keywords_regexp = re.compile('(?<![a-zA-Z0-9])(%s)(?![a-zA-Z0-9])' %
+                                               '|'.join(re.escape(keyword) for keyword in sorted(keywords)))
+        else:
+            self._keywords_regexp = None
+
+        self._suffix_categories = {}
+        self._any_suffix_categories = set()
+        for index, category in enumerate(self.category_info):
+            for suffix in category['suffix']:
+                if suffix:
+                    self._suffix_categories.setdefault(suffix, set()).add(index)
+                else:
+                    # every name ends with the empty suffix
+                    self._any_suffix_categories.add(index)
+        self._suffix_lengths = sorted(set(len(suffix) for suffix in self._suffix_categories))
+
+    def _getKeywords(self, string):
+        """
+        Returns the set of category keywords that occur as a word in a lowercase string.
+        """
+        if self._keywords_regexp is None:
+            return set()
+        return set(self._keywords_regexp.findall(string))
+
+    def _getSuffixCategories(self, name):
+        """
+        Returns the indices of the categories having a suffix that a lowercase name ends with.
+        """
+        categories = set(self._any_suffix_categories)
+        for length in self._suffix_lengths:
+            if length > len(name):
+                break
+            categories.update(self._suffix_categories.get(name[-length:], ()))
+        return categories
+
     def family_filter_enabled(self):
         """
         Return is xxx filtering is enabled in this client
@@ -225,3 +269,26 @@ def cmp_rank(a, b):
         return -1
     else:
         return 1
+
+
+class _CategoryFile(object):
+
+    """
+    A file of a torrent that is being classified. The suffix and keyword lookups are shared
+    between all categories and the keywords are only looked up when a category needs them.
+    """
+
+    __slots__ = ('_category', '_lower_name', '_keywords', 'length', 'suffix_categories')
+
+    def __init__(self, category, name, length):
+        self._category = category
+        self._lower_name = name.lower()
+        self._keywords = None
+        self.length = length
+        self.suffix_categories = category._getSuffixCategories(self._lower_name)
+
+    @property
+    def keywords(self):
+        if self._keywords is None:
+            self._keywords = self._category._getKeywords(self._lower_name)
+        return self._keywords
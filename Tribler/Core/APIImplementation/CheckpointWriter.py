@@ -0,0 +1,235 @@
+import binascii
+import codecs
+import ctypes
+import logging
+import os
+import sys
+from copy import deepcopy
+from io import StringIO
+from threading import RLock
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadable import isInIOThread
+
+
+DEFAULT_WRITE_DELAY = 1.0
+
+MOVEFILE_REPLACE_EXISTING = 0x1
+MOVEFILE_WRITE_THROUGH = 0x8
+
+
+class CheckpointWriter(object):
+
+    """
+    Writes the persistent state of downloads to the pstate directory.
+
+    Saved pstates are collected for write_delay seconds and then written in one batch on the reactor threadpool.
+    Only the last pstate saved for a download is written, and only if its values differ from the last one written
+    for it. The values are compared as Python objects, which is much cheaper than formatting the pstate. Every file
+    is written to a temporary file first and renamed over the checkpoint, so a crash never leaves a partially
+    written checkpoint behind.
+    """
+
+    _reactor = reactor
+
+    def __init__(self, pstate_dir, write_delay=DEFAULT_WRITE_DELAY):
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self.pstate_dir = pstate_dir
+        self.write_delay = write_delay
+
+        self._lock = RLock()
+        self._pending = {}
+        self._written = {}
+        self._discarded = set()
+        self._write_call = None
+        self._write_requested = False
+        self._writing = False
+        self._flush_deferreds = []
+
+        self.num_saved = 0
+        self.num_written = 0
+        self.num_unchanged = 0
+
+    def get_filename(self, infohash):
+        return os.path.join(self.pstate_dir, binascii.hexlify(infohash) + '.state')
+
+    def save(self, infohash, pstate):
+        """
+        Queue the pstate of a download to be written. Can be called from any thread.
+        """
+        with self._lock:
+            self._pending[infohash] = pstate
+            self._discarded.discard(infohash)
+            self.num_saved += 1
+
+            if self._write_call is not None or self._write_requested or self._writing:
+                return
+            self._write_requested = True
+
+        self._call_on_reactor(self._schedule_write)
+
+    def set_written(self, infohash, pstate):
+        """
+        Record that pstate is already on disk, e.g. because it has just been loaded from its checkpoint, so that
+        it does not have to be written again until it changes.
+        """
+        values = self.get_values(pstate)
+        with self._lock:
+            self._written[infohash] = values
+
+    def discard(self, infohash):
+        """
+        Forget a download, e.g. because its checkpoint is being removed. A pending pstate will not be written and
+        one that is being written right now is removed again afterwards.
+        """
+        with self._lock:
+            self._pending.pop(infohash, None)
+            self._written.pop(infohash, None)
+            self._discarded.add(infohash)
+
+    def get_pending_count(self):
+        return len(self._pending)
+
+    def flush(self):
+        """
+        Write all pending pstates right away.
+        @return: a Deferred that fires once everything that was saved before this call has been written.
+        """
+        with self._lock:
+            if not self._pending and not self._writing:
+                return succeed(None)
+
+            deferred = Deferred()
+            self._flush_deferreds.append(deferred)
+            self._write_requested = True
+
+        self._call_on_reactor(self._schedule_write, 0)
+        return deferred
+
+    def _call_on_reactor(self, func, *args):
+        if isInIOThread():
+            func(*args)
+        else:
+            self._reactor.callFromThread(func, *args)
+
+    def _schedule_write(self, delay=None):
+        """
+        Schedule the next batch, unless one is already scheduled or being written. Runs on the reactor thread.
+        """
+        with self._lock:
+            self._write_requested = False
+            if self._writing or not self._pending:
+                return
+
+            if self._write_call is not None:
+                if delay is None or not self._write_call.active():
+                    return
+                self._write_call.cancel()
+            self._write_call = self._reactor.callLater(self.write_delay if delay is None else delay, self._write)
+
+    def _write(self):
+        with self._lock:
+            self._write_call = None
+            self._writing = True
+            batch, self._pending = self._pending, {}
+            flush_deferreds, self._flush_deferreds = self._flush_deferreds, []
+
+        deferred = deferToThreadPool(self._reactor, self._reactor.getThreadPool(), self.write_batch, batch)
+        deferred.addErrback(lambda failure: self._logger.error("Failed to write checkpoints: %s",
+                                                               failure.getErrorMessage()))
+        deferred.addCallback(self._on_written, flush_deferreds)
+
+    def _on_written(self, _, flush_deferreds):
+        with self._lock:
+            self._writing = False
+            if self._flush_deferreds:
+                # flush was called while writing, write what has been saved since then right away
+                delay = 0
+            elif self._pending:
+                delay = None
+            else:
+                delay = False
+
+        if delay is not False:
+            self._schedule_write(delay)
+
+        for deferred in flush_deferreds:
+            deferred.callback(None)
+
+    def write_batch(self, batch):
+        """
+        Write a dictionary of infohash: pstate to disk, skipping those that did not change. Called on a threadpool
+        thread.
+        @return: the number of files written.
+        """
+        written = 0
+        for infohash, pstate in batch.iteritems():
+            try:
+                values = self.get_values(pstate)
+                with self._lock:
+                    if infohash in self._discarded:
+                        continue
+                    if self._written.get(infohash) == values:
+                        self.num_unchanged += 1
+                        continue
+
+                filename = self.get_filename(infohash)
+                self.write_atomic(filename, self.serialize(pstate))
+
+                with self._lock:
+                    if infohash in self._discarded:
+                        # the checkpoint was removed while we were writing it
+                        os.remove(filename)
+                        continue
+                    self._written[infohash] = values
+                    self.num_written += 1
+                written += 1
+            except Exception:
+                self._logger.exception("Failed to write checkpoint for %s", binascii.hexlify(infohash))
+
+        self._logger.debug("Wrote %d out of %d checkpoints", written, len(batch))
+        return written
+
+    @staticmethod
+    def get_values(pstate):
+        # copy the values, the metainfo in particular may be modified in place after it has been written. Its info
+        # dictionary holds most of the data, but it determines the infohash so it never changes and is not copied.
+        with pstate.lock:
+            values = []
+            for section in pstate.sections():
+                items = []
+                for option, value in pstate.items(section):
+                    if section == 'state' and option == 'metainfo' and isinstance(value, dict):
+                        value = dict((key, item) for key, item in value.iteritems() if key != 'info')
+                    items.append((option, deepcopy(value)))
+                values.append((section, items))
+            return values
+
+    @staticmethod
+    def serialize(pstate):
+        output = StringIO()
+        pstate.write(output)
+        return codecs.encode(output.getvalue(), 'utf-8')
+
+    @staticmethod
+    def write_atomic(filename, data):
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'wb') as fp:
+            fp.write(data)
+            # make sure the data is on disk before the rename is, otherwise a crash can leave an empty checkpoint
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        if sys.platform == 'win32':
+            # os.rename does not overwrite existing files on Windows, MoveFileEx replaces them atomically
+            if isinstance(tmp_filename, str):
+                tmp_filename = tmp_filename.decode(sys.getfilesystemencoding())
+                filename = filename.decode(sys.getfilesystemencoding())
+            if not ctypes.windll.kernel32.MoveFileExW(tmp_filename, filename,
+                                                      MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+                raise ctypes.WinError()
+        else:
+            os.rename(tmp_filename, filename)
@@ -7,22 +7,28 @@ import logging
 import os
 import sys
 import time as timemod
+from collections import deque
 from threading import Event, Thread, enumerate as enumerate_threads, currentThread
 from traceback import print_exc
 from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
 
 from Tribler.Core.Modules.search_manager import SearchManager
+from Tribler.Core.Modules.startup import ComponentInitializer, StartupProfiler
 from Tribler.Core.CacheDB.sqlitecachedb import forceDBThread
 from Tribler.Core.DownloadConfig import DownloadStartupConfig
+from Tribler.Core.DownloadState import DownloadStateList
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.Video.VideoPlayer import VideoPlayer
 from Tribler.Core.exceptions import DuplicateDownloadException
 from Tribler.Core.simpledefs import (NTFY_DISPERSY, NTFY_STARTED, NTFY_TORRENTS, NTFY_UPDATE, NTFY_INSERT,
-                                     NTFY_ACTIVITIES, NTFY_REACHABLE, NTFY_ACT_UPNP)
+                                     NTFY_ACTIVITIES, NTFY_REACHABLE, NTFY_ACT_UPNP, DLSTATUS_STOPPED,
+                                     DLSTATUS_SEEDING, DLSTATUS_HASHCHECKING, DLSTATUS_WAITING4HASHCHECK)
 from Tribler.Core.torrentstore import TorrentStore
 from Tribler.Main.globals import DefaultDownloadStartupConfig
 from Tribler.dispersy.util import blockingCallFromThread, blocking_call_on_reactor_thread
+from Tribler.Core.APIImplementation.CheckpointWriter import CheckpointWriter
 from Tribler.Core.APIImplementation.TwistedRawServer import TwistedRawServer
 
 
@@ -42,6 +48,17 @@ SPECIAL_VALUE = 481
 
 PROFILE = False
 
+# Resuming downloads at startup: the number of downloads with fast resume data that are added at once, and
+# the bounds of the delay between these steps, which grows while RESUME_MAX_CHECKING downloads are being checked
+RESUME_BATCH_SIZE = 20
+RESUME_DELAY_MIN = 0.01
+RESUME_DELAY_MAX = 2.0
+RESUME_MAX_CHECKING = 2
+
+# components that are not needed to use the core are initialized this many seconds after it has started
+DEFERRED_INIT_DELAY = 5.0
+STARTUP_REPORT_FILENAME = 'startup_profile.json'
+
 # Internal classes
 #
 
@@ -63,6 +80,16 @@ class TriblerLaunchMany(Thread):
 
         self.downloads = {}
         self.upnp_ports = []
+        self.incremental_states_callbacks = set()
+
+        # checkpoints waiting to be resumed, downloads that have not been added to libtorrent yet and resumed
+        # downloads without fast resume data that libtorrent has not reported on yet
+        self.resume_queue = deque()
+        self.resume_pending = set()
+        self.resume_checking = set()
+        self.resume_delay = RESUME_DELAY_MIN
+        self.resume_start = None
+        self.resume_time = None
 
         self.session = None
         self.sesslock = None
@@ -70,8 +97,11 @@ class TriblerLaunchMany(Thread):
 
         self.shutdownstarttime = None
 
+        self.startup_profiler = None
+
         # modules
         self.rawserver = None
+        self.checkpoint_writer = None
         self.torrent_store = None
         self.rtorrent_handler = None
         self.tftp_handler = None
@@ -93,6 +123,8 @@ class TriblerLaunchMany(Thread):
         self.ltmgr = None
         self.tracker_manager = None
         self.torrent_checker = None
+        # torrents to check once the torrent checker has been started
+        self.torrent_health_requests = []
         self.tunnel_community = None
 
     def register(self, session, sesslock, autoload_discovery=True):
@@ -102,128 +134,202 @@ class TriblerLaunchMany(Thread):
             self.session = session
             self.sesslock = sesslock
 
+            self.startup_profiler = StartupProfiler()
+
             self.rawserver = TwistedRawServer()
+            self.checkpoint_writer = CheckpointWriter(self.session.get_downloads_pstate_dir())
 
+            # Dispersy
+            self.session.dispersy_member = None
+            self.tftp_handler = None
+
+            # Only components that keep to themselves during init and call into the reactor in a thread safe way
+            # are initialized on their own thread: the megacache only uses its own database and starts its looping
+            # calls on the reactor thread, the video player starts its own HTTP server thread. The others are
+            # initialized one after the other on this thread.
+            initializer = ComponentInitializer(self.startup_profiler)
             if self.session.get_torrent_store():
-                self.torrent_store = TorrentStore(self.session.get_torrent_store_dir())
+                initializer.add(u"torrent_store", self.init_torrent_store)
 
             # torrent collecting: RemoteTorrentHandler
             if self.session.get_torrent_collecting():
-                from Tribler.Core.RemoteTorrentHandler import RemoteTorrentHandler
-                self.rtorrent_handler = RemoteTorrentHandler(self.session)
+                initializer.add(u"remote_torrent_handler", self.init_remote_torrent_handler)
 
-            # TODO(emilon): move this to a megacache component or smth
             if self.session.get_megacache():
-                from Tribler.Core.CacheDB.SqliteCacheDBHandler import (PeerDBHandler, TorrentDBHandler,
-                                                                       MyPreferenceDBHandler, VoteCastDBHandler,
-                                                                       ChannelCastDBHandler, MetadataDBHandler)
-                from Tribler.Category.Category import Category
-
-                self._logger.debug('tlm: Reading Session state from %s', self.session.get_state_dir())
-
-                self.cat = Category.getInstance(self.session.get_install_dir())
-
-                # create DBHandlers
-                self.metadata_db = MetadataDBHandler(self.session)
-                self.peer_db = PeerDBHandler(self.session)
-                self.torrent_db = TorrentDBHandler(self.session)
-                self.mypref_db = MyPreferenceDBHandler(self.session)
-                self.votecast_db = VoteCastDBHandler(self.session)
-                self.channelcast_db = ChannelCastDBHandler(self.session)
-
-                # initializes DBHandlers
-                self.metadata_db.initialize()
-                self.peer_db.initialize()
-                self.torrent_db.initialize()
-                self.mypref_db.initialize()
-                self.votecast_db.initialize()
-                self.channelcast_db.initialize()
-
-                from Tribler.Core.Modules.tracker_manager import TrackerManager
-                self.tracker_manager = TrackerManager(self.session)
-                self.tracker_manager.initialize()
+                initializer.add(u"megacache", self.init_megacache, thread_safe=True)
+                initializer.add(u"tracker_manager", self.init_tracker_manager, depends=[u"megacache"])
 
             if self.session.get_videoplayer():
-                self.videoplayer = VideoPlayer(self.session)
+                initializer.add(u"videoplayer", self.init_videoplayer, thread_safe=True)
 
-            # Dispersy
-            self.session.dispersy_member = None
-            self.tftp_handler = None
             if self.session.get_dispersy():
-                from Tribler.dispersy.dispersy import Dispersy
-                from Tribler.dispersy.endpoint import StandaloneEndpoint
-
-                # set communication endpoint
-                endpoint = StandaloneEndpoint(self.session.get_dispersy_port(), ip=self.session.get_ip())
-
-                working_directory = unicode(self.session.get_state_dir())
-                self.dispersy = Dispersy(endpoint, working_directory)
-
-                # register TFTP service
-                from Tribler.Core.TFTP.handler import TftpHandler
-                self.tftp_handler = TftpHandler(self.session, u'', endpoint,
-                                                "fffffffd".decode('hex'), block_size=1024)
-                self.tftp_handler.initialize()
+                initializer.add(u"dispersy", self.init_dispersy)
+                initializer.add(u"tftp_handler", self.init_tftp_handler, depends=[u"dispersy"])
 
             if self.session.get_enable_torrent_search() or self.session.get_enable_channel_search():
-                self.search_manager = SearchManager(self.session)
-                self.search_manager.initialize()
+                initializer.add(u"search_manager", self.init_search_manager, depends=[u"megacache", u"dispersy"])
 
             if self.session.get_enable_channel_search():
-                from Tribler.Core.Modules.channel_manager import ChannelManager
-                self.channel_manager = ChannelManager(self.session)
-                self.channel_manager.initialize()
+                initializer.add(u"channel_manager", self.init_channel_manager, depends=[u"megacache", u"dispersy"])
+
+            initializer.run()
 
         if not self.initComplete:
             self.init(autoload_discovery)
 
+    def init_torrent_store(self):
+        self.torrent_store = TorrentStore(self.session.get_torrent_store_dir())
+
+    def init_remote_torrent_handler(self):
+        from Tribler.Core.RemoteTorrentHandler import RemoteTorrentHandler
+        self.rtorrent_handler = RemoteTorrentHandler(self.session)
+
+    def init_megacache(self):
+        # TODO(emilon): move this to a megacache component or smth
+        from Tribler.Core.CacheDB.SqliteCacheDBHandler import (PeerDBHandler, TorrentDBHandler,
+                                                               MyPreferenceDBHandler, VoteCastDBHandler,
+                                                               ChannelCastDBHandler, MetadataDBHandler)
+        from Tribler.Category.Category import Category
+
+        self._logger.debug('tlm: Reading Session state from %s', self.session.get_state_dir())
+
+        self.cat = Category.getInstance(self.session.get_install_dir())
+
+        # create DBHandlers
+        self.metadata_db = MetadataDBHandler(self.session)
+        self.peer_db = PeerDBHandler(self.session)
+        self.torrent_db = TorrentDBHandler(self.session)
+        self.mypref_db = MyPreferenceDBHandler(self.session)
+        self.votecast_db = VoteCastDBHandler(self.session)
+        self.channelcast_db = ChannelCastDBHandler(self.session)
+
+        # initializes DBHandlers
+        self.metadata_db.initialize()
+        self.peer_db.initialize()
+        self.torrent_db.initialize()
+        self.mypref_db.initialize()
+        self.votecast_db.initialize()
+        self.channelcast_db.initialize()
+
+        self.session.sqlite_db.start_maintenance()
+        # the keywords for search suggestions and autocompletion are read in the background
+        self.torrent_db.loadSearchTerms()
+
+    def init_tracker_manager(self):
+        from Tribler.Core.Modules.tracker_manager import TrackerManager
+        self.tracker_manager = TrackerManager(self.session)
+        self.tracker_manager.initialize()
+
+    def init_videoplayer(self):
+        self.videoplayer = VideoPlayer(self.session)
+
+    def init_dispersy(self):
+        from Tribler.dispersy.dispersy import Dispersy
+        from Tribler.dispersy.endpoint import StandaloneEndpoint
+
+        # set communication endpoint
+        endpoint = StandaloneEndpoint(self.session.get_dispersy_port(), ip=self.session.get_ip())
+
+        working_directory = unicode(self.session.get_state_dir())
+        self.dispersy = Dispersy(endpoint, working_directory)
+
+    def init_tftp_handler(self):
+        # register TFTP service
+        from Tribler.Core.TFTP.handler import TftpHandler
+        self.tftp_handler = TftpHandler(self.session, u'', self.dispersy.endpoint,
+                                        "fffffffd".decode('hex'), block_size=1024)
+        self.tftp_handler.initialize()
+
+    def init_search_manager(self):
+        self.search_manager = SearchManager(self.session)
+        self.search_manager.initialize()
+
+    def init_channel_manager(self):
+        from Tribler.Core.Modules.channel_manager import ChannelManager
+        self.channel_manager = ChannelManager(self.session)
+        self.channel_manager.initialize()
+
     def init(self, autoload_discovery):
+        initializer = ComponentInitializer(self.startup_profiler)
         if self.dispersy:
-            from Tribler.dispersy.community import HardKilledCommunity
+            initializer.add(u"dispersy_start", lambda: self.init_dispersy_start(autoload_discovery))
 
-            self._logger.info("lmc: Starting Dispersy...")
+        # The mainline DHT runs on its own thread and libtorrent only schedules its tasks through the rawserver,
+        # which can be called from any thread
+        initializer.add(u"mainline_dht", self.init_mainline_dht, thread_safe=True)
 
-            now = timemod.time()
-            success = self.dispersy.start(autoload_discovery)
+        if self.session.get_libtorrent():
+            initializer.add(u"libtorrent", self.init_libtorrent, thread_safe=True)
 
-            diff = timemod.time() - now
-            if success:
-                self._logger.info("lmc: Dispersy started successfully in %.2f seconds [port: %d]",
-                                  diff, self.dispersy.wan_address[1])
-            else:
-                self._logger.info("lmc: Dispersy failed to start in %.2f seconds", diff)
+        # add task for tracker checking, once the core is up
+        if self.session.get_torrent_checking():
+            initializer.add(u"torrent_checker", self.init_torrent_checker, critical=False)
 
-            self.upnp_ports.append((self.dispersy.wan_address[1], 'UDP'))
+        if self.rtorrent_handler:
+            initializer.add(u"remote_torrent_handler_initialize", self.rtorrent_handler.initialize,
+                            depends=[u"dispersy_start"])
 
-            from Tribler.dispersy.crypto import M2CryptoSK
-            self.session.dispersy_member = blockingCallFromThread(reactor, self.dispersy.get_member,
-                                                                  private_key=self.dispersy.crypto.key_to_bin(M2CryptoSK(filename=self.session.get_permid_keypair_filename())))
+        initializer.run()
 
-            blockingCallFromThread(reactor, self.dispersy.define_auto_load, HardKilledCommunity,
-                                   self.session.dispersy_member, load=True)
+        with self.startup_profiler.measure(u"upnp"):
+            self.start_upnp()
 
-            if self.session.get_megacache():
-                self.dispersy.database.attach_commit_callback(self.session.sqlite_db.commit_now)
-
-            # notify dispersy finished loading
-            self.session.uch.notify(NTFY_DISPERSY, NTFY_STARTED, None)
-
-            @blocking_call_on_reactor_thread
-            def load_communities():
-                # load communities
-                # Search Community
-                if self.session.get_enable_torrent_search():
-                    from Tribler.community.search.community import SearchCommunity
-                    self.dispersy.define_auto_load(SearchCommunity, self.session.dispersy_member, load=True,
-                                                   kargs={'tribler_session': self.session})
-
-                # AllChannel Community
-                if self.session.get_enable_channel_search():
-                    from Tribler.community.allchannel.community import AllChannelCommunity
-                    self.dispersy.define_auto_load(AllChannelCommunity, self.session.dispersy_member, load=True,
-                                                   kargs={'tribler_session': self.session})
-            load_communities()
+        self.initComplete = True
+
+        self._logger.info("lmc: core started in %.2f seconds", self.startup_profiler.get_report()[u'core_time'])
+        if initializer.has_deferred():
+            self.rawserver.add_task(lambda: self.network_init_deferred(initializer), DEFERRED_INIT_DELAY)
+        else:
+            self.write_startup_report()
+
+    def init_dispersy_start(self, autoload_discovery):
+        from Tribler.dispersy.community import HardKilledCommunity
+
+        self._logger.info("lmc: Starting Dispersy...")
+
+        now = timemod.time()
+        success = self.dispersy.start(autoload_discovery)
+
+        diff = timemod.time() - now
+        if success:
+            self._logger.info("lmc: Dispersy started successfully in %.2f seconds [port: %d]",
+                              diff, self.dispersy.wan_address[1])
+        else:
+            self._logger.info("lmc: Dispersy failed to start in %.2f seconds", diff)
+
+        self.upnp_ports.append((self.dispersy.wan_address[1], 'UDP'))
+
+        from Tribler.dispersy.crypto import M2CryptoSK
+        private_key = self.dispersy.crypto.key_to_bin(M2CryptoSK(filename=self.session.get_permid_keypair_filename()))
+        self.session.dispersy_member = blockingCallFromThread(reactor, self.dispersy.get_member,
+                                                              private_key=private_key)
+
+        blockingCallFromThread(reactor, self.dispersy.define_auto_load, HardKilledCommunity,
+                               self.session.dispersy_member, load=True)
+
+        if self.session.get_megacache():
+            self.dispersy.database.attach_commit_callback(self.session.sqlite_db.commit_now)
 
+        # notify dispersy finished loading
+        self.session.uch.notify(NTFY_DISPERSY, NTFY_STARTED, None)
+
+        @blocking_call_on_reactor_thread
+        def load_communities():
+            # load communities
+            # Search Community
+            if self.session.get_enable_torrent_search():
+                from Tribler.community.search.community import SearchCommunity
+                self.dispersy.define_auto_load(SearchCommunity, self.session.dispersy_member, load=True,
+                                               kargs={'tribler_session': self.session})
+
+            # AllChannel Community
+            if self.session.get_enable_channel_search():
+                from Tribler.community.allchannel.community import AllChannelCommunity
+                self.dispersy.define_auto_load(AllChannelCommunity, self.session.dispersy_member, load=True,
+                                               kargs={'tribler_session': self.session})
+        load_communities()
+
+    def init_mainline_dht(self):
         from Tribler.Core.DecentralizedTracking import mainlineDHT
         try:
             self.mainline_dht = mainlineDHT.init(('127.0.0.1', self.session.get_mainline_dht_listen_port()),
@@ -232,25 +338,47 @@ class TriblerLaunchMany(Thread):
         except:
             print_exc()
 
-        if self.session.get_libtorrent():
-            from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
-            self.ltmgr = LibtorrentMgr(self.session)
+    def init_libtorrent(self):
+        from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
+        self.ltmgr = LibtorrentMgr(self.session)
 
-        # add task for tracker checking
-        if self.session.get_torrent_checking():
-            try:
-                from Tribler.Core.TorrentChecker.torrent_checker import TorrentChecker
-                self.torrent_checker = TorrentChecker(self.session)
-                self.torrent_checker.initialize()
-            except:
-                print_exc()
+    def init_torrent_checker(self):
+        try:
+            from Tribler.Core.TorrentChecker.torrent_checker import TorrentChecker
+            torrent_checker = TorrentChecker(self.session)
+            torrent_checker.initialize()
+        except:
+            print_exc()
+            return
 
-        if self.rtorrent_handler:
-            self.rtorrent_handler.initialize()
+        with self.sesslock:
+            self.torrent_checker = torrent_checker
+            requests, self.torrent_health_requests = self.torrent_health_requests, []
+        for infohash in requests:
+            torrent_checker.add_gui_request(infohash)
 
-        self.start_upnp()
+    def check_torrent_health(self, infohash):
+        """ Called by any thread. Requests made before the torrent checker has been started are queued. """
+        with self.sesslock:
+            torrent_checker = self.torrent_checker
+            if torrent_checker is None:
+                if self.session.get_torrent_checking() and self.shutdownstarttime is None:
+                    if infohash not in self.torrent_health_requests:
+                        self.torrent_health_requests.append(infohash)
+                else:
+                    self._logger.warning("tlm: torrent checker is not running, not checking %s",
+                                         binascii.hexlify(infohash))
+                return
+        torrent_checker.add_gui_request(infohash)
 
-        self.initComplete = True
+    def network_init_deferred(self, initializer):
+        """ Called by network thread. Initializes the components that are not needed to use the core. """
+        if self.shutdownstarttime is None:
+            initializer.run_deferred()
+            self.write_startup_report()
+
+    def write_startup_report(self):
+        self.startup_profiler.write_report(os.path.join(self.session.get_state_dir(), STARTUP_REPORT_FILENAME))
 
     def add(self, tdef, dscfg, pstate=None, initialdlstatus=None, setupDelay=0, hidden=False):
         """ Called by any thread """
@@ -304,6 +432,10 @@ class TriblerLaunchMany(Thread):
 
     def network_engine_wrapper_created_callback(self, d, pstate):
         """ Called by network thread """
+        if self.resume_pending:
+            self.resume_pending.discard(d.get_def().get_infohash())
+            self.check_resume_finished()
+
         try:
             if pstate is None:
                 # Checkpoint at startup
@@ -320,6 +452,10 @@ class TriblerLaunchMany(Thread):
             infohash = d.get_def().get_infohash()
             if infohash in self.downloads:
                 del self.downloads[infohash]
+            self.resume_pending.discard(infohash)
+            self.resume_checking.discard(infohash)
+            if removestate:
+                self.checkpoint_writer.discard(infohash)
         finally:
             self.sesslock.release()
 
@@ -405,8 +541,14 @@ class TriblerLaunchMany(Thread):
     #
     # State retrieval
     #
-    def set_download_states_callback(self, usercallback, getpeerlist, when=0.0):
+    def set_download_states_callback(self, usercallback, getpeerlist, when=0.0, incremental=None):
         """ Called by any thread """
+        if incremental is not None:
+            if incremental:
+                self.incremental_states_callbacks.add(usercallback)
+            else:
+                self.incremental_states_callbacks.discard(usercallback)
+
         for d in self.downloads.values():
             # Arno, 2012-05-23: At Niels' request to get total transferred
             # stats. Causes MOREINFO message to be sent from swift proc
@@ -420,15 +562,18 @@ class TriblerLaunchMany(Thread):
 
     def network_set_download_states_callback(self, usercallback):
         """ Called by network thread """
-        dslist = []
-        for d in self.downloads.values():
-            try:
-                ds = d.network_get_state(None, False, sessioncalling=True)
-                dslist.append(ds)
-            except:
-                # Niels, 2012-10-18: If Swift connection is crashing, it will raise an exception
-                # We're catching it here to continue building the downloadstates
-                print_exc()
+        if usercallback in self.incremental_states_callbacks:
+            dslist = self.network_get_incremental_download_states()
+        else:
+            dslist = []
+            for d in self.downloads.values():
+                try:
+                    ds = d.network_get_state(None, False, sessioncalling=True)
+                    dslist.append(ds)
+                except:
+                    # Niels, 2012-10-18: If Swift connection is crashing, it will raise an exception
+                    # We're catching it here to continue building the downloadstates
+                    print_exc()
 
         # Invoke the usercallback function via a new thread.
         # After the callback is invoked, the return values will be passed to
@@ -436,6 +581,20 @@ class TriblerLaunchMany(Thread):
         self.session.uch.perform_getstate_usercallback(usercallback, dslist,
                                                        self.sesscb_set_download_states_returncallback)
 
+    def network_get_incremental_download_states(self):
+        """ Called by network thread. Only creates new DownloadStates for the
+        downloads whose status changed since the previous call. """
+        dslist = DownloadStateList()
+        for d in self.downloads.values():
+            try:
+                ds, changed = d.network_get_cached_state()
+                dslist.append(ds)
+                if changed:
+                    dslist.changed.append(ds)
+            except:
+                print_exc()
+        return dslist
+
     def sesscb_set_download_states_returncallback(self, usercallback, when, newgetpeerlist):
         """ Called by SessionCallbackThread """
         if when > 0.0:
@@ -463,8 +622,91 @@ class TriblerLaunchMany(Thread):
             finally:
                 self.sesslock.release()
 
-            for i, filename in enumerate(filelist):
-                self.resume_download(filename, initialdlstatus, initialdlstatus_dict, setupDelay=i * 0.1)
+            self.resume_start = timemod.time()
+            self.resume_time = None
+            self._logger.info("tlm: resuming %d downloads", len(filelist))
+
+            # Parse the checkpoints off the reactor thread, the downloads are added once all of them have been parsed
+            network_load_checkpoints_lambda = lambda: self.network_load_checkpoints(filelist, initialdlstatus,
+                                                                                    initialdlstatus_dict)
+            self.rawserver.add_task(network_load_checkpoints_lambda, 0.0)
+
+    def network_load_checkpoints(self, filelist, initialdlstatus, initialdlstatus_dict):
+        """ Called by network thread """
+        # Parsing is pure Python and holds the GIL, so a single thread is as fast as several
+        load_resume_data_lambda = lambda: [self.load_resume_data(filename) for filename in filelist]
+        deferToThread(load_resume_data_lambda).addCallback(self.network_schedule_resumes, filelist, initialdlstatus,
+                                                           initialdlstatus_dict)
+
+    def network_schedule_resumes(self, results, filelist, initialdlstatus, initialdlstatus_dict):
+        """ Called by network thread. Queues the parsed checkpoints, the active downloads first, then the
+        finished ones and the stopped ones last. """
+        queue = []
+        for filename, resume_data in zip(filelist, results):
+            priority = 0
+            if resume_data:
+                tdef, _, pstate = resume_data
+                dlstate = pstate.get('state', 'dlstate') or {}
+                if initialdlstatus_dict.get(tdef.get_infohash(), initialdlstatus) == DLSTATUS_STOPPED:
+                    priority = 2
+                elif dlstate.get('status') == DLSTATUS_SEEDING or dlstate.get('progress') == 1.0:
+                    priority = 1
+            queue.append((priority, filename, resume_data))
+        queue.sort(key=lambda entry: entry[0])
+
+        self.resume_queue.extend(queue)
+        self.network_resume_next(initialdlstatus, initialdlstatus_dict)
+
+    def network_resume_next(self, initialdlstatus, initialdlstatus_dict):
+        """ Called by network thread. Resumes the next downloads in the queue. Downloads with fast resume data
+        are resumed in batches, as libtorrent does not have to check them, the others one at a time. The delay
+        between these steps adapts to the number of downloads that are being checked. """
+        # Adding a download to libtorrent is asynchronous, the downloads that have not been added yet count as
+        # checking. The downloads that were just added start out as waiting for the hashcheck, so until libtorrent
+        # reports on them only those without fast resume data count.
+        checking = 0
+        for infohash, d in self.downloads.items():
+            if d.lt_status is None:
+                checking += infohash in self.resume_pending or infohash in self.resume_checking
+            else:
+                self.resume_checking.discard(infohash)
+                checking += d.get_status() in (DLSTATUS_HASHCHECKING, DLSTATUS_WAITING4HASHCHECK)
+        if checking >= RESUME_MAX_CHECKING:
+            self.resume_delay = min(self.resume_delay * 2, RESUME_DELAY_MAX)
+        else:
+            self.resume_delay = max(self.resume_delay / 2, RESUME_DELAY_MIN)
+
+            for _ in xrange(RESUME_BATCH_SIZE):
+                if not self.resume_queue:
+                    break
+                _, filename, resume_data = self.resume_queue.popleft()
+                self.resume_download(filename, initialdlstatus, initialdlstatus_dict, resume_data=resume_data)
+
+                if not resume_data or not self.has_fast_resume_data(resume_data[2]):
+                    # this download will be checked
+                    break
+
+        if self.resume_queue:
+            network_resume_next_lambda = lambda: self.network_resume_next(initialdlstatus, initialdlstatus_dict)
+            self.rawserver.add_task(network_resume_next_lambda, self.resume_delay)
+        else:
+            self.check_resume_finished()
+
+    def has_fast_resume_data(self, pstate):
+        # Avoid parsing the resume data, it is parsed when the download is added
+        return pstate.get('state', 'engineresumedata', literal_eval=False) not in (None, 'None')
+
+    def check_resume_finished(self):
+        """ Called by network thread """
+        if not self.resume_queue and not self.resume_pending and self.resume_time is None and self.resume_start:
+            self.resume_time = timemod.time() - self.resume_start
+            self._logger.info("tlm: all downloads resumed in %.1f seconds", self.resume_time)
+
+    def get_resume_statistics(self):
+        """ Returns how many downloads are still waiting to be resumed and the number of seconds it took
+        to resume all downloads, or None if that has not happened yet. """
+        return {'queued': len(self.resume_queue), 'pending': len(self.resume_pending),
+                'time_to_all_resumed': self.resume_time}
 
     def load_download_pstate_noexc(self, infohash):
         """ Called by any thread, assume sesslock already held """
@@ -479,9 +721,8 @@ class TriblerLaunchMany(Thread):
         except Exception:
             self._logger.exception("Exception while loading pstate: %s", infohash)
 
-    def resume_download(self, filename, initialdlstatus=None, initialdlstatus_dict={}, setupDelay=0):
-        tdef = dscfg = pstate = None
-
+    def load_resume_data(self, filename):
+        """ Called by any thread. Returns the (tdef, dscfg, pstate) of a checkpoint, or None if it is invalid. """
         try:
             pstate = self.load_download_pstate(filename)
 
@@ -491,16 +732,30 @@ class TriblerLaunchMany(Thread):
                 tdef = TorrentDefNoMetainfo(metainfo['infohash'], metainfo['name'], metainfo.get('url', None))
             else:
                 tdef = TorrentDef.load_from_dict(metainfo)
+            self.checkpoint_writer.set_written(tdef.get_infohash(), pstate)
 
             if pstate.has_option('downloadconfig', 'saveas') and \
                     isinstance(pstate.get('downloadconfig', 'saveas'), tuple):
                 pstate.set('downloadconfig', 'saveas', pstate.get('downloadconfig', 'saveas')[-1])
 
             dscfg = DownloadStartupConfig(pstate)
+            return tdef, dscfg, pstate
 
         except:
             # FIXME(lipu): I think this part of the code has never been tested
             print_exc()
+            return None
+
+    def resume_download(self, filename, initialdlstatus=None, initialdlstatus_dict={}, setupDelay=0,
+                        resume_data=None):
+        tdef = dscfg = pstate = None
+
+        if resume_data is None:
+            resume_data = self.load_resume_data(filename)
+
+        if resume_data:
+            tdef, dscfg, pstate = resume_data
+        else:
             # pstate is invalid or non-existing
             _, file = os.path.split(filename)
 
@@ -519,23 +774,27 @@ class TriblerLaunchMany(Thread):
                         if os.path.isdir(dest_dir) or dest_dir == '':
                             dscfg.set_dest_dir(dest_dir)
 
-        self._logger.debug("tlm: load_checkpoint: pstate is %s %s",
-                           pstate.get('dlstate', 'status'), pstate.get('dlstate', 'progress'))
-        if pstate.get('state', 'engineresumedata') is None:
-            self._logger.debug("tlm: load_checkpoint: resumedata None")
-        else:
-            self._logger.debug("tlm: load_checkpoint: resumedata len %d", len(pstate.get('state', 'engineresumedata')))
+        if pstate:
+            self._logger.debug("tlm: load_checkpoint: pstate is %s %s",
+                               pstate.get('dlstate', 'status'), pstate.get('dlstate', 'progress'))
+            if not self.has_fast_resume_data(pstate):
+                self._logger.debug("tlm: load_checkpoint: resumedata None")
 
         if tdef and dscfg:
             if dscfg.get_dest_dir() != '':  # removed torrent ignoring
                 try:
                     if not self.download_exists(tdef.get_infohash()):
                         initialdlstatus = initialdlstatus_dict.get(tdef.get_infohash(), initialdlstatus)
+                        self.resume_pending.add(tdef.get_infohash())
+                        if not pstate or not self.has_fast_resume_data(pstate):
+                            self.resume_checking.add(tdef.get_infohash())
                         self.add(tdef, dscfg, pstate, initialdlstatus, setupDelay=setupDelay)
                     else:
                         self._logger.info("tlm: not resuming checkpoint because download has already been added")
 
                 except Exception as e:
+                    self.resume_pending.discard(tdef.get_infohash())
+                    self.resume_checking.discard(tdef.get_infohash())
                     self._logger.exception("tlm: load check_point: exception while adding download %s", tdef)
             else:
                 self._logger.info("tlm: removing checkpoint %s destdir is %s", filename, dscfg.get_dest_dir())
@@ -563,12 +822,14 @@ class TriblerLaunchMany(Thread):
         if checkpoint:
             for d in dllist:
                 try:
-                    # Tell all downloads to stop, and save their persistent state
-                    # in a infohash -> pstate dict which is then passed to the user
-                    # for storage.
+                    # Tell all downloads to stop, and save their persistent state.
+                    # When not stopping, active downloads save their state once
+                    # libtorrent has generated their resume data.
                     #
                     if stop:
                         (infohash, pstate) = d.network_stop(False, False)
+                    elif d.save_resume_data():
+                        continue
                     else:
                         (infohash, pstate) = d.network_checkpoint()
 
@@ -580,18 +841,27 @@ class TriblerLaunchMany(Thread):
                     self._logger.exception("Exception while checkpointing: %s", d.get_def().get_name())
 
         if stop:
-            # Some grace time for early shutdown tasks
-            if self.shutdownstarttime is not None:
-                now = timemod.time()
-                diff = now - self.shutdownstarttime
-                if diff < gracetime:
-                    self._logger.info("tlm: shutdown: delaying for early shutdown tasks %s", gracetime - diff)
-                    delay = gracetime - diff
-                    network_shutdown_callback_lambda = lambda: self.network_shutdown()
-                    self.rawserver.add_task(network_shutdown_callback_lambda, delay)
-                    return
-
-            self.network_shutdown()
+            # Wait for the checkpoints to be written before shutting down
+            if checkpoint:
+                network_shutdown_delayed_lambda = lambda _: self.network_shutdown_delayed(gracetime)
+                self.checkpoint_writer.flush().addCallback(network_shutdown_delayed_lambda)
+            else:
+                self.network_shutdown_delayed(gracetime)
+
+    def network_shutdown_delayed(self, gracetime):
+        """ Called by network thread """
+        # Some grace time for early shutdown tasks
+        if self.shutdownstarttime is not None:
+            now = timemod.time()
+            diff = now - self.shutdownstarttime
+            if diff < gracetime:
+                self._logger.info("tlm: shutdown: delaying for early shutdown tasks %s", gracetime - diff)
+                delay = gracetime - diff
+                network_shutdown_callback_lambda = lambda: self.network_shutdown()
+                self.rawserver.add_task(network_shutdown_callback_lambda, delay)
+                return
+
+        self.network_shutdown()
 
     def early_shutdown(self):
         """ Called as soon as Session shutdown is initiated. Used to start
@@ -694,12 +964,9 @@ class TriblerLaunchMany(Thread):
             self.rawserver = None
 
     def save_download_pstate(self, infohash, pstate):
-        """ Called by network thread """
-        basename = binascii.hexlify(infohash) + '.state'
-        filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-        self._logger.debug("tlm: network checkpointing: to file %s", filename)
-        pstate.write_file(filename)
+        """ Called by any thread. The pstate is written to disk asynchronously, if it changed. """
+        self._logger.debug("tlm: network checkpointing: to file %s", self.checkpoint_writer.get_filename(infohash))
+        self.checkpoint_writer.save(infohash, pstate)
 
     def load_download_pstate(self, filename):
         """ Called by any thread """
@@ -1,7 +1,10 @@
 # Written by Jelle Roozenburg, Arno Bakker
 # see LICENSE.txt for license information
 
+import heapq
 import time
+from collections import deque
+from itertools import count
 from traceback import print_exc
 import threading
 import logging
@@ -13,23 +16,52 @@ except ImportError as e:
     prctlimported = False
 
 
+# Policies for queueing a task, see ThreadPool.queueTask
+POLICY_QUEUE = 0  # always queue the task
+POLICY_DROP = 1  # drop the task when the queue is at its depth limit
+POLICY_MERGE = 2  # replace the pending task with the same key, if any, otherwise queue it (one at a time per key)
+POLICY_SERIAL = 3  # queue the task, it runs after the tasks queued earlier with the same key have finished
+
+
 class ThreadPool(object):
 
     """Flexible thread pool class.  Creates a pool of threads, then
     accepts tasks that will be dispatched to the next available
-    thread."""
+    thread.
 
-    def __init__(self, numThreads):
-        """Initialize the thread pool with numThreads workers."""
+    Tasks are dispatched in order of priority, and in the order they
+    were queued for equal priorities. The time tasks spend waiting in
+    the queue and running is recorded per task function."""
+
+    def __init__(self, numThreads, maxQueueSize=0):
+        """Initialize the thread pool with numThreads workers. When maxQueueSize
+        is set, tasks queued with POLICY_DROP are dropped if that many tasks
+        are waiting."""
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
+        self.maxQueueSize = maxQueueSize
+
         self.__threads = []
         self.__resizeLock = threading.Condition(threading.Lock())
         self.__taskCond = threading.Condition(threading.Lock())
+        # heap of [-priority, sequence number, queue time, task, args, taskCallback, key, serial key] entries
         self.__tasks = []
+        self.__keyedTasks = {}
+        # keys of the merged tasks that are running, and the task waiting for each of them to finish
+        self.__runningKeys = set()
+        self.__heldTasks = {}
+        # per key of the serial tasks that are queued or running, the tasks waiting for them to finish
+        self.__serialTasks = {}
+        self.__sequence = count()
         self.__isJoiningStopQueuing = False
         self.__isJoining = False
+
+        self.__statsLock = threading.Lock()
+        self.__taskStats = {}
+        self.__numDropped = 0
+        self.__numMerged = 0
+
         self.setThreadCount(numThreads)
 
     def setThreadCount(self, newNumThreads):
@@ -73,9 +105,20 @@ class ThreadPool(object):
         finally:
             self.__resizeLock.release()
 
-    def queueTask(self, task, args=(), taskCallback=None):
+    def getQueueSize(self):
+        """Return the number of tasks waiting to be executed."""
+        return len(self.__tasks) + len(self.__heldTasks) + sum(len(tasks) for tasks in self.__serialTasks.values())
+
+    def queueTask(self, task, args=(), taskCallback=None, priority=0, policy=POLICY_QUEUE, key=None):
         """Insert a task into the queue.  task must be callable;
-        args and taskCallback can be None."""
+        args and taskCallback can be None. Tasks with a higher priority
+        are executed first. With POLICY_MERGE, a task that is still waiting
+        in the queue with the same key is replaced by this one, which is
+        meant for periodic callbacks where only the latest call matters.
+        While a task with that key is running, the new task is held back
+        until it has finished, so those calls run one at a time and in order.
+        With POLICY_SERIAL, all tasks with the same key run one at a time in
+        the order they were queued."""
 
         if self.__isJoining or self.__isJoiningStopQueuing:
             return False
@@ -84,9 +127,34 @@ class ThreadPool(object):
 
         self.__taskCond.acquire()
         try:
-            self.__tasks.append((task, args, taskCallback))
-            # Arno, 2010-04-07: Use proper notify()+wait()
-            self.__taskCond.notifyAll()
+            if policy == POLICY_MERGE and key in self.__keyedTasks:
+                entry = self.__keyedTasks[key]
+                entry[3:6] = [task, args, taskCallback]
+                self.__numMerged += 1
+                return True
+
+            if policy == POLICY_DROP and self.maxQueueSize and len(self.__tasks) >= self.maxQueueSize:
+                self.__numDropped += 1
+                self._logger.debug("Dropping task %s, %d tasks queued", task, len(self.__tasks))
+                return False
+
+            entry = [-priority, next(self.__sequence), time.time(), task, args, taskCallback, None, None]
+            if policy == POLICY_MERGE:
+                entry[6] = key
+                self.__keyedTasks[key] = entry
+                if key in self.__runningKeys:
+                    self.__heldTasks[key] = entry
+                    return True
+            elif policy == POLICY_SERIAL:
+                entry[7] = key
+                if key in self.__serialTasks:
+                    self.__serialTasks[key].append(entry)
+                    return True
+                self.__serialTasks[key] = deque()
+            heapq.heappush(self.__tasks, entry)
+
+            # Only one thread is needed to execute the task
+            self.__taskCond.notify()
             return True
         finally:
             self.__taskCond.release()
@@ -94,30 +162,107 @@ class ThreadPool(object):
     def getNextTask(self):
         """ Retrieve the next task from the task queue.  For use
         only by ThreadPoolThread objects contained in the pool."""
-        self._logger.debug('%d', len(self.__tasks))
-
         self.__taskCond.acquire()
         try:
-            while self.__tasks == [] and not self.__isJoining:
+            while not self.__tasks and not self.__isJoining:
                 self.__taskCond.wait()
             if self.__isJoining:
                 return None, None, None
+
+            entry = heapq.heappop(self.__tasks)
+            if entry[6] is not None:
+                del self.__keyedTasks[entry[6]]
+                self.__runningKeys.add(entry[6])
+            return self.__runTask, (entry,), None
+        finally:
+            self.__taskCond.release()
+
+    def __runTask(self, entry):
+        _, _, queued, task, args, taskCallback, key, serialKey = entry
+        started = time.time()
+        try:
+            if taskCallback is None:
+                task(*args)
             else:
-                return self.__tasks.pop(0)
+                taskCallback(task(args))
+        finally:
+            self.__recordTask(task, started - queued, time.time() - started)
+            if key is not None:
+                self.__releaseKey(key)
+            if serialKey is not None:
+                self.__releaseSerialKey(serialKey)
+
+    def __releaseKey(self, key):
+        """Queue the task that was held back while the task with this key was running, if any."""
+        self.__taskCond.acquire()
+        try:
+            self.__runningKeys.discard(key)
+            entry = self.__heldTasks.pop(key, None)
+            if entry is not None:
+                heapq.heappush(self.__tasks, entry)
+                self.__taskCond.notify()
         finally:
             self.__taskCond.release()
 
+    def __releaseSerialKey(self, key):
+        """Queue the next serial task with this key, if any."""
+        self.__taskCond.acquire()
+        try:
+            tasks = self.__serialTasks.get(key)
+            if tasks is None:
+                # the queue was cleared
+                return
+            if tasks:
+                heapq.heappush(self.__tasks, tasks.popleft())
+                self.__taskCond.notify()
+            else:
+                del self.__serialTasks[key]
+        finally:
+            self.__taskCond.release()
+
+    def __recordTask(self, task, waitTime, runTime):
+        name = getattr(task, '__name__', repr(task))
+        with self.__statsLock:
+            stats = self.__taskStats.get(name)
+            if stats is None:
+                stats = self.__taskStats[name] = [0, 0.0, 0.0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += waitTime
+            stats[2] = max(stats[2], waitTime)
+            stats[3] += runTime
+            stats[4] = max(stats[4], runTime)
+
+    def getStatistics(self):
+        """Return the queue statistics and, per task function name, the number
+        of executions and the average and maximum wait and run times in seconds."""
+        with self.__statsLock:
+            tasks = dict((name, {'count': num, 'avg_wait': totalWait / num, 'max_wait': maxWait,
+                                 'avg_run': totalRun / num, 'max_run': maxRun})
+                         for name, (num, totalWait, maxWait, totalRun, maxRun) in self.__taskStats.iteritems())
+        return {'queued': self.getQueueSize(), 'dropped': self.__numDropped, 'merged': self.__numMerged,
+                'tasks': tasks}
+
     def joinAll(self, waitForTasks=True, waitForThreads=True):
         """ Clear the task queue and terminate all pooled threads,
-        optionally allowing the tasks and threads to finish."""
+        optionally allowing the tasks and threads to finish. Unless the
+        threads are waited for, the pool stays stopped."""
 
         # Mark the pool as joining to prevent any more task queueing
         self.__isJoiningStopQueuing = True
 
         # Wait for tasks to finish
         if waitForTasks:
-            while self.__tasks:
+            while self.getQueueSize():
                 time.sleep(.1)
+        else:
+            self.__taskCond.acquire()
+            try:
+                del self.__tasks[:]
+                self.__keyedTasks.clear()
+                self.__heldTasks.clear()
+                self.__serialTasks.clear()
+            finally:
+                self.__taskCond.release()
 
         # Mark the pool as joining to make all threads stop executing tasks
         self.__isJoining = True
@@ -139,8 +284,8 @@ class ThreadPool(object):
                     t.join()
                     del t
 
-            # Reset the pool for potential reuse
-            self.__isJoining = False
+                # Reset the pool for potential reuse
+                self.__isJoining = False
         finally:
             self.__resizeLock.release()
 
@@ -1,18 +1,185 @@
-from Tribler.dispersy.taskmanager import TaskManager
-from twisted.internet import reactor
-from threading import RLock
-
-
-class TwistedRawServer(TaskManager):
-
-    def __init__(self):
-        super(TwistedRawServer, self).__init__()
-        self._auto_counter = 0
-        self._lock = RLock()
-
-    def add_task(self, wrapper, delay):
-        with self._lock:
-            self._auto_counter += 1
-
-        task_name = "twisted_rawserver %d" % self._auto_counter
-        reactor.callFromThread(lambda: self.register_task(task_name, reactor.callLater(delay, wrapper)))
+import logging
+from heapq import heappop, heappush
+from math import ceil
+from threading import RLock
+
+from Tribler.dispersy.taskmanager import TaskManager
+from twisted.internet import reactor
+from twisted.python.threadable import isInIOThread
+
+
+DEFAULT_GRANULARITY = 0.1
+DEFAULT_WHEEL_SIZE = 512
+
+
+class TwistedRawServer(TaskManager):
+
+    """
+    Runs delayed tasks on the reactor thread.
+
+    Instead of scheduling a DelayedCall for every task, the tasks are kept in a hashed timer wheel of wheel_size
+    slots of granularity seconds each. A single reactor call advances the wheel and runs all tasks that have become
+    due, so tasks may run up to granularity seconds late. That call is scheduled for the earliest slot that holds a
+    task, so the wheel does not wake up the reactor for empty slots. Tasks without a delay are run on the next
+    reactor iteration.
+    """
+
+    _reactor = reactor
+
+    def __init__(self, granularity=DEFAULT_GRANULARITY, wheel_size=DEFAULT_WHEEL_SIZE):
+        super(TwistedRawServer, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self.granularity = granularity
+        self.wheel_size = wheel_size
+
+        self._auto_counter = 0
+        self._lock = RLock()
+
+        # every slot maps task ids to (tick, deadline, wrapper) tuples, tasks whose tick is more than one rotation
+        # away stay in their slot until the wheel comes around in the right rotation
+        self._slots = [{} for _ in xrange(wheel_size)]
+        self._task_slots = {}
+        # tasks without a delay, by task id, as (deadline, wrapper) tuples
+        self._immediate = {}
+        # the number of tasks per pending tick and a heap of those ticks, which may hold ticks that are no longer
+        # pending
+        self._tick_counts = {}
+        self._ticks = []
+        self._start = self._reactor.seconds()
+        self._last_tick = -1
+        self._tick_call = None
+        self._next_tick = None
+        self._tick_requested = False
+
+    def add_task(self, wrapper, delay):
+        """
+        Schedule wrapper to be called on the reactor thread after delay seconds. Can be called from any thread.
+        @return: the id of the task, which can be passed to cancel_task.
+        """
+        deadline = self._reactor.seconds() + delay
+        # allow for rounding, a deadline on a slot boundary belongs to that slot
+        tick = int(ceil((deadline - self._start) / self.granularity - 1e-6))
+        with self._lock:
+            self._auto_counter += 1
+            task_id = self._auto_counter
+
+            if delay <= 0:
+                tick = self._last_tick
+                self._immediate[task_id] = (deadline, wrapper)
+                self._task_slots[task_id] = None
+            else:
+                if tick <= self._last_tick:
+                    tick = self._last_tick + 1
+                slot = tick % self.wheel_size
+                self._slots[slot][task_id] = (tick, deadline, wrapper)
+                self._task_slots[task_id] = slot
+                if tick not in self._tick_counts:
+                    self._tick_counts[tick] = 0
+                    heappush(self._ticks, tick)
+                self._tick_counts[tick] += 1
+
+            if self._tick_requested or (self._tick_call is not None and tick >= self._next_tick):
+                return task_id
+            self._tick_requested = True
+
+        if isInIOThread():
+            self._schedule_tick()
+        else:
+            self._reactor.callFromThread(self._schedule_tick)
+        return task_id
+
+    def cancel_task(self, task_id):
+        """
+        Cancel a task that has not been run yet.
+        @return: whether the task was pending.
+        """
+        with self._lock:
+            if task_id not in self._task_slots:
+                return False
+            slot = self._task_slots.pop(task_id)
+            if slot is None:
+                del self._immediate[task_id]
+            else:
+                self._release_tick(self._slots[slot].pop(task_id)[0])
+            return True
+
+    def get_pending_task_count(self):
+        return len(self._task_slots)
+
+    def cancel_all_pending_tasks(self):
+        with self._lock:
+            if self._tick_call is not None and self._tick_call.active():
+                self._tick_call.cancel()
+            self._tick_call = None
+            self._tick_requested = False
+            self._slots = [{} for _ in xrange(self.wheel_size)]
+            self._task_slots.clear()
+            self._immediate.clear()
+            self._tick_counts.clear()
+            self._ticks = []
+        super(TwistedRawServer, self).cancel_all_pending_tasks()
+
+    def _release_tick(self, tick):
+        self._tick_counts[tick] -= 1
+        if not self._tick_counts[tick]:
+            del self._tick_counts[tick]
+
+    def _schedule_tick(self):
+        """
+        Schedule the wheel to advance to the earliest tick that has tasks, if tasks are pending. Runs on the reactor
+        thread.
+        """
+        with self._lock:
+            self._tick_requested = False
+            if self._immediate:
+                next_tick = self._last_tick
+                delay = 0
+            else:
+                while self._ticks and self._ticks[0] not in self._tick_counts:
+                    heappop(self._ticks)
+                if not self._ticks:
+                    return
+                next_tick = self._ticks[0]
+                delay = max(0, self._start + next_tick * self.granularity - self._reactor.seconds())
+
+            if self._tick_call is not None:
+                if self._next_tick <= next_tick:
+                    return
+                self._tick_call.cancel()
+            self._next_tick = next_tick
+            self._tick_call = self._reactor.callLater(delay, self._tick)
+
+    def _tick(self):
+        """
+        Run all tasks that are due in one go.
+        """
+        now = self._reactor.seconds()
+        with self._lock:
+            self._tick_call = None
+            due = [(deadline, task_id, wrapper) for task_id, (deadline, wrapper) in self._immediate.iteritems()]
+            for task_id in self._immediate:
+                del self._task_slots[task_id]
+            self._immediate.clear()
+
+            # the reactor may call us a fraction too early due to rounding
+            current_tick = int((now - self._start) / self.granularity + 1e-6)
+            first_tick = max(self._last_tick + 1, current_tick - self.wheel_size + 1)
+            for tick in xrange(first_tick, current_tick + 1):
+                slot = self._slots[tick % self.wheel_size]
+                for task_id, (task_tick, deadline, wrapper) in slot.items():
+                    if task_tick <= current_tick:
+                        due.append((deadline, task_id, wrapper))
+                        del slot[task_id]
+                        del self._task_slots[task_id]
+                        self._release_tick(task_tick)
+            self._last_tick = max(self._last_tick, current_tick)
+
+        due.sort()
+        for _, _, wrapper in due:
+            try:
+                wrapper()
+            except:
+                self._logger.exception("Task %s failed", wrapper)
+
+        self._schedule_tick()
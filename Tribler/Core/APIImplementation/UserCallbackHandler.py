@@ -7,13 +7,16 @@ from threading import currentThread
 import logging
 
 from Tribler.Core.simpledefs import STATEDIR_DLPSTATE_DIR
-from Tribler.Core.APIImplementation.ThreadPool import ThreadNoPool
+from Tribler.Core.APIImplementation.ThreadPool import ThreadPool, POLICY_MERGE, POLICY_SERIAL
 from Tribler.Core.CacheDB.Notifier import Notifier
 
 
+USER_CALLBACK_THREADS = 4
+
+
 class UserCallbackHandler(object):
 
-    def __init__(self, session):
+    def __init__(self, session, num_threads=USER_CALLBACK_THREADS):
         super(UserCallbackHandler, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -21,14 +24,14 @@ class UserCallbackHandler(object):
         self.sesslock = session.sesslock
 
         # Notifier for callbacks to API user
-        self.threadpool = ThreadNoPool()
+        self.threadpool = ThreadPool(num_threads)
 
         self.notifier = Notifier.getInstance(self.threadpool)
 
     def shutdown(self):
-        # stop threadpool
+        # stop threadpool, this is called on the reactor thread so do not wait for the queued callbacks, they are dropped
         Notifier.delInstance()
-        self.threadpool.joinAll()
+        self.threadpool.joinAll(waitForTasks=False, waitForThreads=False)
 
     def perform_getstate_usercallback(self, usercallback, data, returncallback):
         """ Called by network thread """
@@ -40,7 +43,10 @@ class UserCallbackHandler(object):
                 returncallback(usercallback, when, getpeerlist)
             except:
                 self._logger.exception('Could not perform usercallback')
-        self.perform_usercallback(session_getstate_usercallback_target)
+
+        # The state callbacks are periodic, a state that has not been delivered yet is replaced by the newer one
+        self.threadpool.queueTask(session_getstate_usercallback_target, policy=POLICY_MERGE,
+                                  key=(usercallback, returncallback))
 
     def perform_removestate_callback(self, infohash, contentdests):
         """ Called by network thread """
@@ -52,10 +58,10 @@ class UserCallbackHandler(object):
                 self.sesscb_removestate(infohash, contentdests)
             except:
                 self._logger.exception("Could not remove state")
-        self.perform_usercallback(session_removestate_callback_target)
+        # remove the states in the order the downloads were removed
+        self.threadpool.queueTask(session_removestate_callback_target, policy=POLICY_SERIAL, key=u"removestate")
 
     def perform_usercallback(self, target):
-        # TODO: thread pool, etc.
         self.threadpool.queueTask(target)
 
     def sesscb_removestate(self, infohash, contentdests):
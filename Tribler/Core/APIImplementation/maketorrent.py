@@ -309,7 +309,7 @@ def get_length_filepieceranges_from_metainfo(metainfo, selectedfiles):
         return total, filepieceranges
 
 
-def copy_metainfo_to_input(metainfo, input):
+def copy_metainfo_to_input(metainfo, input, copy_files=True):
     keys = tdefdictdefaults.keys()
     # Arno: For magnet link support
     keys.append("initial peers")
@@ -323,18 +323,19 @@ def copy_metainfo_to_input(metainfo, input):
             input[key] = metainfo['info'][key]
 
     # Note: don't know inpath, set to outpath
-    if 'length' in metainfo['info']:
-        outpath = metainfo['info']['name']
-        length = metainfo['info']['length']
-        d = {'inpath': outpath, 'outpath': outpath, 'length': length}
-        input['files'].append(d)
-    else:  # multi-file torrent
-        files = metainfo['info']['files']
-        for file in files:
-            outpath = pathlist2filename(file['path'])
-            length = file['length']
+    if copy_files:
+        if 'length' in metainfo['info']:
+            outpath = metainfo['info']['name']
+            length = metainfo['info']['length']
             d = {'inpath': outpath, 'outpath': outpath, 'length': length}
             input['files'].append(d)
+        else:  # multi-file torrent
+            files = metainfo['info']['files']
+            for file in files:
+                outpath = pathlist2filename(file['path'])
+                length = file['length']
+                d = {'inpath': outpath, 'outpath': outpath, 'length': length}
+                input['files'].append(d)
 
     # Diego : we want web seeding
     if 'url-list' in metainfo:
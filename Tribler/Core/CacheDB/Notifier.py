@@ -3,7 +3,10 @@
 
 import threading
 import logging
+from collections import defaultdict
+from time import time
 
+from Tribler.Core.APIImplementation.ThreadPool import POLICY_SERIAL
 from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENTS,
                                      NTFY_MODIFICATIONS, NTFY_MODERATIONS, NTFY_MARKINGS, NTFY_MYPREFERENCES,
                                      NTFY_ACTIVITIES, NTFY_REACHABLE, NTFY_CHANNELCAST, NTFY_VOTECAST, NTFY_DISPERSY,
@@ -31,11 +34,16 @@ class Notifier(object):
 
         self.pool = pool
 
-        self.observers = []
+        # observers indexed by (subject, changeType), each a list of (func, id, cache) tuples. The lists are
+        # replaced rather than modified, so notify can use them without holding the lock.
+        self.observers = {}
         self.observerscache = {}
         self.observertimers = {}
         self.observerLock = threading.Lock()
 
+        self.event_counts = defaultdict(int)
+        self.event_counts_start = time()
+
         Notifier.__single = self
 
     def getInstance(*args, **kw):
@@ -59,26 +67,29 @@ class Notifier(object):
         addObserver(NTFY_TORRENTS, [NTFY_SEARCH_RESULT], 'a_search_id') -> get
                     callbacks when peer-searchresults of of search
                     with id=='a_search_id' come in
+
+        When cache is set, the events are coalesced: the events that arrive within cache seconds of the first
+        one are delivered in a single call to func with the list of their [subject, changeType, id, ...] args.
         """
         assert isinstance(changeTypes, list)
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
 
-        obs = (func, subject, changeTypes, id, cache)
-        self.observerLock.acquire()
-        self.observers.append(obs)
-        self.observerLock.release()
+        obs = (func, id, cache)
+        with self.observerLock:
+            for changeType in changeTypes:
+                key = (subject, changeType)
+                self.observers[key] = self.observers.get(key, []) + [obs]
 
     def remove_observer(self, func):
         """ Remove all observers with function func
         """
         with self.observerLock:
-            i = 0
-            while i < len(self.observers):
-                ofunc = self.observers[i][0]
-                if ofunc == func:
-                    del self.observers[i]
+            for key, observers in self.observers.items():
+                observers = [obs for obs in observers if obs[0] != func]
+                if observers:
+                    self.observers[key] = observers
                 else:
-                    i += 1
+                    del self.observers[key]
 
     def remove_observers(self):
         with self.observerLock:
@@ -86,58 +97,66 @@ class Notifier(object):
                 timer.cancel()
             self.observerscache = {}
             self.observertimers = {}
-            self.observers = []
+            self.observers = {}
+
+    def get_event_rates(self):
+        """
+        Returns the number of events per second that have been notified for each subject.
+        """
+        elapsed = max(time() - self.event_counts_start, 1e-6)
+        return dict((subject, count / elapsed) for subject, count in self.event_counts.items())
 
     def notify(self, subject, changeType, obj_id, *args):
         """
         Notify all interested observers about an event with threads from the pool
         """
-        tasks = []
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
 
+        self.event_counts[subject] += 1
+
+        observers = self.observers.get((subject, changeType))
+        if not observers:
+            return
+
+        tasks = []
         args = [subject, changeType, obj_id] + list(args)
 
-        self.observerLock.acquire()
-        for ofunc, osubject, ochangeTypes, oid, cache in self.observers:
-            try:
-                if (subject == osubject and
-                    changeType in ochangeTypes and
-                        (oid is None or oid == obj_id)):
-
-                    if not cache:
-                        tasks.append(ofunc)
-                    else:
-                        if ofunc not in self.observerscache:
-                            def doQueue(ofunc):
-                                self.observerLock.acquire()
-                                if ofunc in self.observerscache:
-                                    events = self.observerscache[ofunc]
-                                    del self.observerscache[ofunc]
-                                    del self.observertimers[ofunc]
-                                else:
-                                    events = []
-                                self.observerLock.release()
-
-                                if events:
-                                    if self.pool:
-                                        self.pool.queueTask(ofunc, (events,))
-                                    else:
-                                        ofunc(events)
-
-                            t = threading.Timer(cache, doQueue, (ofunc,))
-                            t.setName("Notifier-timer-%s" % subject)
-                            t.start()
-
-                            self.observerscache[ofunc] = []
-                            self.observertimers[ofunc] = t
-
-                        self.observerscache[ofunc].append(args)
-            except:
-                self._logger.exception("OIDs were %s %s", repr(oid), repr(obj_id))
-
-        self.observerLock.release()
+        for ofunc, oid, cache in observers:
+            if oid is not None and oid != obj_id:
+                continue
+
+            if not cache:
+                tasks.append(ofunc)
+                continue
+
+            with self.observerLock:
+                if ofunc not in self.observerscache:
+                    t = threading.Timer(cache, self._notify_cached, (ofunc,))
+                    t.setName("Notifier-timer-%s" % subject)
+                    t.start()
+
+                    self.observerscache[ofunc] = []
+                    self.observertimers[ofunc] = t
+
+                self.observerscache[ofunc].append(args)
+
         for task in tasks:
             if self.pool:
-                self.pool.queueTask(task, args)
+                # the events of a subject are delivered one at a time, in the order they happened
+                self.pool.queueTask(task, args, policy=POLICY_SERIAL, key=subject)
             else:
                 task(*args)  # call observer function in this thread
+
+    def _notify_cached(self, ofunc):
+        """
+        Deliver the events that have been coalesced for an observer function.
+        """
+        with self.observerLock:
+            events = self.observerscache.pop(ofunc, [])
+            self.observertimers.pop(ofunc, None)
+
+        if events:
+            if self.pool:
+                self.pool.queueTask(ofunc, (events,), policy=POLICY_SERIAL, key=events[0][0])
+            else:
+                ofunc(events)
@@ -6,26 +6,31 @@
 import logging
 import os
 import threading
+from binascii import hexlify
 from copy import deepcopy
 from pprint import pformat
-from struct import unpack_from
 from threading import Lock
 from time import time
 from traceback import print_exc
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from heapq import nlargest, nsmallest
+from operator import itemgetter
+from itertools import product
 from libtorrent import bencode
 from twisted.internet.task import LoopingCall
 
 from Tribler.Core.CacheDB.Notifier import Notifier
-from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
+from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin, infohash2db, db2infohash, parse_matchinfo
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords
+from Tribler.Core.Utilities.term_index import TrigramIndex, PrefixTrie, is_search_term
 from Tribler.Core.Utilities.unicode import dunno2unicode
 from Tribler.Core.simpledefs import (INFOHASH_LENGTH, NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE, NTFY_CREATE,
                                      NTFY_MODIFIED, NTFY_TRACKERINFO, NTFY_MYPREFERENCES, NTFY_VOTECAST, NTFY_TORRENTS,
                                      NTFY_CHANNELCAST, NTFY_COMMENTS, NTFY_PLAYLISTS, NTFY_MODIFICATIONS,
                                      NTFY_MODERATIONS, NTFY_MARKINGS, NTFY_STATE)
 from Tribler.dispersy.taskmanager import TaskManager
+from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 from Tribler.Core.Utilities.tracker_utils import get_uniformed_tracker_url
 
 
@@ -43,6 +48,22 @@ MAX_POPULARITY_REC_PER_TORRENT_PEER = 3  # maximum number of records per each co
 
 DEFAULT_ID_CACHE_SIZE = 1024 * 5
 
+# loadSearchTerms reads the names of this many indexed torrents, or adds this many terms to the prefix trie, per
+# reactor iteration
+SEARCH_TERMS_BATCH_SIZE = 250
+
+# searchNames ranks at most this many candidates for remote searches and returns the best ones
+REMOTE_SEARCH_CANDIDATES = 250
+REMOTE_SEARCH_RESULTS = 25
+
+# the age of a torrent lowers its eviction weight by one for every day, up to this number of days
+EVICTION_MAX_AGE = 500
+# freeSpace reads all torrents of an age class that holds fewer torrents than this
+EVICTION_SMALL_CLASS = 10000
+
+# channels are listed by their number of favorite votes, then the latest modified first
+CHANNEL_ORDER = u" ORDER BY nr_favorite DESC, modified DESC, nr_torrents"
+
 
 class LimitedOrderedDict(OrderedDict):
 
@@ -108,7 +129,7 @@ class MetadataDBHandler(BasicDBHandler):
         Gets a list of metadata messages with the given hash-type and
         hash-value.
         """
-        infohash_str = bin2str(infohash) if infohash else None
+        infohash_str = infohash2db(infohash) if infohash else None
 
         column_str = u",".join(columns)
         sql = u"SELECT %s FROM MetadataMessage WHERE infohash = ?" % column_str
@@ -124,7 +145,7 @@ class MetadataDBHandler(BasicDBHandler):
                         this_result.append(None)
 
                     elif column == "infohash":
-                        this_result.append(str2bin(raw_result[idx]))
+                        this_result.append(db2infohash(raw_result[idx]))
                     elif column == "this_mid":
                         this_result.append(str(raw_result[idx]))
                     elif column == "previous_mid":
@@ -144,7 +165,7 @@ class MetadataDBHandler(BasicDBHandler):
         this_mid_str = buffer(this_mid) if this_mid else None
         prev_mid_str = buffer(prev_mid) if prev_mid else None
 
-        infohash_str = bin2str(infohash) if infohash else None
+        infohash_str = infohash2db(infohash) if infohash else None
 
         sql = u"""INSERT INTO MetadataMessage(dispersy_id, this_global_time,
                 this_mid, infohash, previous_mid, previous_global_time)
@@ -174,7 +195,7 @@ class MetadataDBHandler(BasicDBHandler):
         FROM MetadataMessage as msg, MetadataData as data
         WHERE msg.infohash = ? AND msg.message_id = data.message_id
         """
-        result = self._db.fetchall(sql, (bin2str(infohash),))
+        result = self._db.fetchall(sql, (infohash2db(infohash),))
         return result
 
     def getMetadataData(self, message_id):
@@ -208,7 +229,7 @@ class MetadataDBHandler(BasicDBHandler):
                 for i in range(len(results)):
                     result = list(results[i])
                     if result[key_index]:
-                        result[key_index] = str2bin(result[key_index])
+                        result[key_index] = db2infohash(result[key_index])
                         results[i] = result
         return results
 
@@ -364,6 +385,17 @@ class TorrentDBHandler(BasicDBHandler):
         self.mypref_db = self.votecast_db = self.channelcast_db = self._rtorrent_handler = None
 
         self.infohash_id = LimitedOrderedDict(DEFAULT_ID_CACHE_SIZE)
+        # maps tracker URLs to their ids, nothing deletes rows from TrackerInfo so the ids stay valid
+        self.tracker_id_cache = {}
+
+        self.search_term_index = None
+        self.autocomplete_trie = None
+        # the indexes loadSearchTerms is building, the last rowid of FullTextIndex it has read or None once it has
+        # read all of them, and the terms it still has to add to the prefix trie
+        self._search_terms_loading = None
+        self._search_terms_position = 0
+        self._search_term_counts = None
+        self.search_term_lock = Lock()
 
     def initialize(self, *args, **kwargs):
         super(TorrentDBHandler, self).initialize(*args, **kwargs)
@@ -397,14 +429,14 @@ class TorrentDBHandler(BasicDBHandler):
             if infohash in self.infohash_id:
                 to_return[infohash] = self.infohash_id[infohash]
             else:
-                to_select.append(bin2str(infohash))
+                to_select.append(infohash2db(infohash))
 
         parameters = '?,' * len(to_select)
         parameters = parameters[:-1]
         sql_stmt = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)" % parameters
         torrents = self._db.fetchall(sql_stmt, to_select)
         for torrent_id, infohash in torrents:
-            self.infohash_id[str2bin(infohash)] = torrent_id
+            self.infohash_id[db2infohash(infohash)] = torrent_id
 
         for infohash in infohashes:
             if infohash not in to_return:
@@ -424,7 +456,7 @@ class TorrentDBHandler(BasicDBHandler):
         sql_get_infohash = "SELECT infohash FROM Torrent WHERE torrent_id==?"
         ret = self._db.fetchone(sql_get_infohash, (torrent_id,))
         if ret:
-            ret = str2bin(ret)
+            ret = db2infohash(ret)
         return ret
 
     def hasTorrent(self, infohash):
@@ -432,8 +464,7 @@ class TorrentDBHandler(BasicDBHandler):
         assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
         if infohash in self.existed_torrents:  # to do: not thread safe
             return True
-        infohash_str = bin2str(infohash)
-        existed = self._db.getOne('CollectedTorrent', 'torrent_id', infohash=infohash_str)
+        existed = self._db.getOne('CollectedTorrent', 'torrent_id', infohash=infohash2db(infohash))
         if existed is None:
             return False
         else:
@@ -449,6 +480,45 @@ class TorrentDBHandler(BasicDBHandler):
                 self._addTorrentToDB(torrentdef, extra_info)
                 self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, infohash)
 
+    def addExternalTorrents(self, torrents):
+        """
+        Adds a batch of torrents to the database. Collected torrents are filtered and new torrents
+        are inserted with a single query each, instead of one round of queries per torrent.
+        :param torrents: A list of (torrentdef, extra_info) tuples.
+        """
+        torrents = dict((torrentdef.get_infohash(), (torrentdef, extra_info)) for torrentdef, extra_info in torrents
+                        if torrentdef.get_infohash() not in self.existed_torrents)
+        if not torrents:
+            return
+
+        parameters = u",".join(u"?" * len(torrents))
+        sql = u"SELECT infohash FROM CollectedTorrent WHERE infohash IN (%s)" % parameters
+        for infohash, in self._db.fetchall(sql, [infohash2db(infohash) for infohash in torrents]):
+            infohash = db2infohash(infohash)
+            self.existed_torrents.add(infohash)
+            del torrents[infohash]
+        if not torrents:
+            return
+
+        new_infohashes = [infohash for infohash, torrent_id in self.getTorrentIDS(torrents.keys()).iteritems()
+                          if torrent_id is None]
+
+        # the columns depend on extra_info, so insert each set of columns with its own query
+        to_insert = {}
+        for infohash in new_infohashes:
+            database_dict = self._get_database_dict(*torrents[infohash])
+            keys = tuple(sorted(database_dict.keys()))
+            to_insert.setdefault(keys, []).append(tuple(database_dict[key] for key in keys))
+
+        for keys, values in to_insert.iteritems():
+            sql = u"INSERT INTO Torrent (%s) VALUES (%s)" % (u",".join(keys), u",".join(u"?" * len(keys)))
+            self._db.executemany(sql, values)
+
+        inserted_ids = self.getTorrentIDS(new_infohashes) if new_infohashes else {}
+        for infohash, (torrentdef, extra_info) in torrents.iteritems():
+            self._addTorrentToDB(torrentdef, extra_info, torrent_id=inserted_ids.get(infohash))
+            self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, infohash)
+
     def addExternalTorrentNoDef(self, infohash, name, files, trackers, timestamp, extra_info={}):
         if not self.hasTorrent(infohash):
             metainfo = {'info': {}, 'encoding': 'utf_8'}
@@ -497,7 +567,7 @@ class TorrentDBHandler(BasicDBHandler):
 
         torrent_id = self.getTorrentID(infohash)
         if torrent_id is None:
-            self._db.insert('Torrent', infohash=bin2str(infohash), status=u'unknown')
+            self._db.insert('Torrent', infohash=infohash2db(infohash), status=u'unknown')
             torrent_id = self.getTorrentID(infohash)
         return torrent_id
 
@@ -509,7 +579,7 @@ class TorrentDBHandler(BasicDBHandler):
                 to_be_inserted.add(infohash)
 
         sql = "INSERT INTO Torrent (infohash, status) VALUES (?, ?)"
-        self._db.executemany(sql, [(bin2str(infohash), u'unknown') for infohash in to_be_inserted])
+        self._db.executemany(sql, [(infohash2db(infohash), u'unknown') for infohash in to_be_inserted])
 
         torrent_id_results = self.getTorrentIDS(infohashes)
         torrent_ids = []
@@ -522,7 +592,7 @@ class TorrentDBHandler(BasicDBHandler):
         assert isinstance(torrentdef, TorrentDef), "TORRENTDEF has invalid type: %s" % type(torrentdef)
         assert torrentdef.is_finalized(), "TORRENTDEF is not finalized"
 
-        dict = {"infohash": bin2str(torrentdef.get_infohash()),
+        dict = {"infohash": infohash2db(torrentdef.get_infohash()),
                 "name": torrentdef.get_name_as_unicode(),
                 "length": torrentdef.get_length(),
                 "creation_date": torrentdef.get_creation_date(),
@@ -530,7 +600,8 @@ class TorrentDBHandler(BasicDBHandler):
                 "insert_time": long(time()),
                 "secret": 1 if torrentdef.is_private() else 0,
                 "relevance": 0.0,
-                "category": self.category.calculateCategory(torrentdef.metainfo, torrentdef.get_name_as_unicode()),
+                "category": extra_info.get("category") or
+                self.category.calculateCategory(torrentdef.metainfo, torrentdef.get_name_as_unicode()),
                 "status": extra_info.get("status", "unknown"),
                 "comment": torrentdef.get_comment_as_unicode(),
                 "is_collected": extra_info.get('is_collected', 0)
@@ -543,24 +614,30 @@ class TorrentDBHandler(BasicDBHandler):
 
         return dict
 
-    def _addTorrentToDB(self, torrentdef, extra_info):
+    def _addTorrentToDB(self, torrentdef, extra_info, torrent_id=None):
+        """
+        Adds or updates a torrent in the database and indexes it. If torrent_id is given the Torrent
+        row has already been inserted, and only the index and trackers are added.
+        """
         assert isinstance(torrentdef, TorrentDef), "TORRENTDEF has invalid type: %s" % type(torrentdef)
         assert torrentdef.is_finalized(), "TORRENTDEF is not finalized"
 
         infohash = torrentdef.get_infohash()
         swarmname = torrentdef.get_name_as_unicode()
-        database_dict = self._get_database_dict(torrentdef, extra_info)
 
         # see if there is already a torrent in the database with this infohash
-        torrent_id = self.getTorrentID(infohash)
-        if torrent_id is None:  # not in database
-            self._db.insert("Torrent", **database_dict)
+        if torrent_id is None:
             torrent_id = self.getTorrentID(infohash)
+            database_dict = self._get_database_dict(torrentdef, extra_info)
+
+            if torrent_id is None:  # not in database
+                self._db.insert("Torrent", **database_dict)
+                torrent_id = self.getTorrentID(infohash)
 
-        else:  # infohash in db
-            del database_dict["infohash"]  # no need for infohash, its already stored
-            where = "torrent_id = %d" % torrent_id
-            self._db.update('Torrent', where=where, **database_dict)
+            else:  # infohash in db
+                del database_dict["infohash"]  # no need for infohash, its already stored
+                where = "torrent_id = %d" % torrent_id
+                self._db.update('Torrent', where=where, **database_dict)
 
         if not torrentdef.is_multifile_torrent():
             swarmname, _ = os.path.splitext(swarmname)
@@ -603,6 +680,19 @@ class TorrentDBHandler(BasicDBHandler):
         except:
             # this will fail if the fts3 module cannot be found
             print_exc()
+            return
+
+        with self.search_term_lock:
+            if self._search_terms_loading is None:
+                indexes = (self.search_term_index, self.autocomplete_trie)
+            elif self._search_terms_position is None or torrent_id <= self._search_terms_position:
+                indexes = self._search_terms_loading
+            else:
+                # loadSearchTerms has not read this torrent yet
+                indexes = ()
+            for index in indexes:
+                if index is not None:
+                    index.add_terms(swarm_keywords.split())
 
     # ------------------------------------------------------------
     # Adds the trackers of a given torrent into the database.
@@ -651,15 +741,14 @@ class TorrentDBHandler(BasicDBHandler):
                 kw.pop(key)
 
         if len(kw) > 0:
-            infohash_str = bin2str(infohash)
-            where = "infohash='%s'" % infohash_str
+            where = "infohash = X'%s'" % hexlify(infohash)
             self._db.update(self.table_name, where, **kw)
 
         if notify:
             self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
     def on_torrent_collect_response(self, infohashes):
-        infohash_list = [(bin2str(infohash)) for infohash in infohashes]
+        infohash_list = [infohash2db(infohash) for infohash in infohashes]
 
         i_parameters = u"?," * len(infohash_list)
         i_parameters = i_parameters[:-1]
@@ -670,13 +759,13 @@ class TorrentDBHandler(BasicDBHandler):
         info_dict = {}
         for torrent_id, infohash in results:
             if infohash:
-                info_dict[infohash] = torrent_id
+                info_dict[db2infohash(infohash)] = torrent_id
 
         to_be_inserted = []
-        for infohash in infohash_list:
+        for infohash in infohashes:
             if infohash in info_dict:
                 continue
-            to_be_inserted.append((infohash,))
+            to_be_inserted.append((infohash2db(infohash),))
 
         if len(to_be_inserted) > 0:
             sql = u"INSERT OR IGNORE INTO Torrent (infohash) VALUES (?)"
@@ -685,9 +774,9 @@ class TorrentDBHandler(BasicDBHandler):
     def on_search_response(self, torrents):
         status = u'unknown'
 
-        torrents = [(bin2str(torrent[0]), torrent[1], torrent[2], torrent[3], torrent[4][0],
+        torrents = [(torrent[0], torrent[1], torrent[2], torrent[3], torrent[4][0],
                      torrent[5]) for torrent in torrents]
-        infohash = [(torrent[0],) for torrent in torrents]
+        infohash = [(infohash2db(torrent[0]),) for torrent in torrents]
 
         sql = u"SELECT torrent_id, infohash, is_collected, name FROM Torrent WHERE infohash == ?"
         results = self._db.executemany(sql, infohash) or []
@@ -697,7 +786,7 @@ class TorrentDBHandler(BasicDBHandler):
         tid_collected = set()
         tid_name = {}
         for torrent_id, infohash, is_collected, name in results:
-            infohash = str(infohash)
+            infohash = db2infohash(infohash)
 
             if infohash:
                 infohash_tid[infohash] = torrent_id
@@ -714,13 +803,14 @@ class TorrentDBHandler(BasicDBHandler):
 
             if tid:  # we know this torrent
                 if tid not in tid_collected and swarmname != tid_name.get(tid, ''):  # if not collected and name not equal then do fullupdate
-                    update.append((swarmname, length, nrfiles, category, creation_date, infohash, status, tid))
+                    update.append((swarmname, length, nrfiles, category, creation_date, infohash2db(infohash), status,
+                                   tid))
                     to_be_indexed.append((tid, swarmname))
 
                 elif infohash and infohash not in infohash_tid:
-                    update_infohash.append((infohash, tid))
+                    update_infohash.append((infohash2db(infohash), tid))
             else:
-                insert.append((swarmname, length, nrfiles, category, creation_date, infohash, status))
+                insert.append((swarmname, length, nrfiles, category, creation_date, infohash2db(infohash), status))
 
         if len(update) > 0:
             sql = u"UPDATE Torrent SET name = ?, length = ?, num_files = ?, category = ?, creation_date = ?," \
@@ -771,64 +861,92 @@ class TorrentDBHandler(BasicDBHandler):
         if not tracker_list:
             return
 
-        parameters = u"?," * len(tracker_list)
-        parameters = parameters[:-1]
-        sql = u"SELECT tracker FROM TrackerInfo WHERE tracker IN (%s)" % parameters
+        sql = u"INSERT OR IGNORE INTO TorrentTrackerMapping (torrent_id, tracker_id) VALUES (?,?)"
+        self._db.executemany(sql, [(torrent_id, tracker_id) for tracker_id in self._getTrackerIds(tracker_list)])
 
-        found_tracker_list = self._db.fetchall(sql, tuple(tracker_list))
-        found_tracker_list = [tracker[0] for tracker in found_tracker_list]
+    def _getTrackerIds(self, tracker_list):
+        """
+        Returns the ids of the trackers in tracker_list, adding the trackers that are not in the database yet.
+        Invalid tracker URLs are skipped.
+        """
+        trackers = set()
+        for tracker in tracker_list:
+            if tracker not in (u'DHT', u'no-DHT'):
+                tracker = get_uniformed_tracker_url(tracker)
+            if tracker:
+                trackers.add(tracker)
+
+        unknown_trackers = [tracker for tracker in trackers if tracker not in self.tracker_id_cache]
+        if unknown_trackers:
+            self._db.executemany(u"INSERT OR IGNORE INTO TrackerInfo (tracker) VALUES (?)",
+                                 [(tracker,) for tracker in unknown_trackers])
+            parameters = u",".join(u"?" * len(unknown_trackers))
+            sql = u"SELECT tracker, tracker_id FROM TrackerInfo WHERE tracker IN (%s)" % parameters
+            self.tracker_id_cache.update(self._db.fetchall(sql, unknown_trackers))
 
-        # update tracker info
-        not_found_tracker_list = [tracker for tracker in tracker_list if tracker not in found_tracker_list]
-        for tracker in not_found_tracker_list:
             if self.session.lm.tracker_manager is not None:
-                self.session.lm.tracker_manager.add_tracker(tracker)
+                for tracker in unknown_trackers:
+                    self.session.lm.tracker_manager.add_tracker(tracker)
 
-        # update torrent-tracker mapping
-        sql = 'INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id)'\
-            + ' VALUES(?, (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?))'
-        new_mapping_list = [(torrent_id, tracker) for tracker in tracker_list]
-        if new_mapping_list:
-            self._db.executemany(sql, new_mapping_list)
+        return [self.tracker_id_cache[tracker] for tracker in trackers]
 
-        # add trackers into the torrent file if it has been collected
-        if not self.session.get_torrent_store() or self.session.lm.torrent_store is None:
-            return
+    def addTrackersToTorrent(self, infohash, torrent_data):
+        """
+        Adds the trackers of a torrent that are in the database but not in its torrent file to the torrent file.
+        The tracker lists are only merged when a collected torrent is exported, the torrent store keeps the torrent
+        files as they were collected.
+        :param infohash: The infohash of the torrent.
+        :param torrent_data: The bencoded torrent file.
+        :return: The bencoded torrent file with the new trackers in their own tiers of its announce list, or the
+        torrent file as it was if it cannot be decoded.
+        """
+        torrent_id = self.getTorrentID(infohash)
+        if torrent_id is None:
+            return torrent_data
 
-        infohash = self.getInfohash(torrent_id)
-        if infohash and self.session.has_collected_torrent(infohash):
-            torrent_data = self.session.get_collected_torrent(infohash)
-            tdef = TorrentDef.load_from_memory(torrent_data)
-
-            new_tracker_list = []
-            for tracker in tracker_list:
-                if tdef.get_tracker() and tracker == tdef.get_tracker():
-                    continue
-                if tdef.get_tracker_hierarchy() and tracker in tdef.get_tracker_hierarchy():
-                    continue
-                if tracker in ('DHT', 'no-DHT'):
-                    continue
-                tracker = get_uniformed_tracker_url(tracker)
-                if tracker and [tracker] not in new_tracker_list:
-                    new_tracker_list.append([tracker])
+        tracker_list = [tracker for tracker in self.getTrackerListByTorrentID(torrent_id)
+                        if tracker not in (u'DHT', u'no-DHT')]
+        if not tracker_list:
+            return torrent_data
+
+        try:
+            metainfo = TorrentDef.load_from_memory(torrent_data).get_metainfo()
+        except ValueError as e:
+            self._logger.warning(u"Could not add trackers to torrent %s: %s", hexlify(infohash), e)
+            return torrent_data
+        announce = metainfo.get('announce')
+        announce_list = metainfo.get('announce-list') or ([[announce]] if announce else [])
+
+        known_trackers = set(get_uniformed_tracker_url(tracker) for tier in announce_list for tracker in tier)
+        new_tracker_list = [[tracker.encode('utf-8')] for tracker in tracker_list if tracker not in known_trackers]
+        if not new_tracker_list:
+            return torrent_data
 
-            if tdef.get_tracker_hierarchy():
-                new_tracker_list = tdef.get_tracker_hierarchy() + new_tracker_list
-            if new_tracker_list:
-                tdef.set_tracker_hierarchy(new_tracker_list)
-                # have to use bencode to get around the TorrentDef.is_finalized() check in TorrentDef.encode()
-                self.session.save_collected_torrent(infohash, bencode(tdef.metainfo))
+        metainfo['announce-list'] = announce_list + new_tracker_list
+        return bencode(metainfo)
 
     def getTorrentsOnTracker(self, tracker, current_time):
-        sql = """
+        """
+        Returns the torrents on a tracker that are due for a check, the longest overdue first.
+        """
+        tracker_id = self.tracker_id_cache.get(tracker)
+        if tracker_id is None:
+            tracker_id = self._db.fetchone(u"SELECT tracker_id FROM TrackerInfo WHERE tracker = ?", (tracker,))
+            if tracker_id is None:
+                return []
+            self.tracker_id_cache[tracker] = tracker_id
+
+        # the tracker_next_check triggers keep next_check of the mappings equal to next_tracker_check
+        sql = u"""
             SELECT T.torrent_id, T.infohash, T.last_tracker_check
-              FROM Torrent T, TrackerInfo TI, TorrentTrackerMapping TTM
-              WHERE TI.tracker = ?
-              AND TI.tracker_id = TTM.tracker_id AND T.torrent_id = TTM.torrent_id
-              AND next_tracker_check < ?
+              FROM TorrentTrackerMapping TTM, Torrent T
+              WHERE TTM.tracker_id = ? AND TTM.next_check < ?
+              AND T.torrent_id = TTM.torrent_id
+              ORDER BY TTM.next_check
             """
-        infohash_list = self._db.fetchall(sql, (tracker, current_time))
-        return [(torrent_id, str2bin(infohash), last_tracker_check) for torrent_id, infohash, last_tracker_check in infohash_list]
+        infohash_list = self._db.fetchall(sql, (tracker_id, current_time))
+        return [(torrent_id, db2infohash(infohash), last_tracker_check)
+                for torrent_id, infohash, last_tracker_check in infohash_list]
 
     def getTrackerListByTorrentID(self, torrent_id):
         sql = 'SELECT TR.tracker FROM TrackerInfo TR, TorrentTrackerMapping MP'\
@@ -881,7 +999,7 @@ class TorrentDBHandler(BasicDBHandler):
         else:
             keys = list(keys)
 
-        res = self._db.getOne('Torrent C', keys, infohash=bin2str(infohash))
+        res = self._db.getOne('Torrent C', keys, infohash=infohash2db(infohash))
 
         if not res:
             return None
@@ -917,7 +1035,7 @@ class TorrentDBHandler(BasicDBHandler):
                 for i in range(len(results)):
                     result = list(results[i])
                     if result[key_index]:
-                        result[key_index] = str2bin(result[key_index])
+                        result[key_index] = db2infohash(result[key_index])
                         results[i] = result
         fix_value('infohash')
         return results
@@ -934,18 +1052,14 @@ class TorrentDBHandler(BasicDBHandler):
              AND T.secret is not 1 ORDER BY CT.insert_time DESC LIMIT ?
              """
         results = self._db.fetchall(sql, (limit,))
-        return [[str2bin(result[0]), result[1], result[2], result[3] or 0, result[4]] for result in results]
+        return [[db2infohash(result[0]), result[1], result[2], result[3] or 0, result[4]] for result in results]
 
     def getRandomlyCollectedTorrents(self, insert_time, limit):
-        sql = u"""
-            SELECT CT.infohash, CT.num_seeders, CT.num_leechers, T.last_tracker_check
-             FROM Torrent T, CollectedTorrent CT
-             WHERE CT.torrent_id = T.torrent_id
-             AND CT.insert_time < ?
-             AND T.secret is not 1 ORDER BY RANDOM() DESC LIMIT ?
-            """
-        results = self._db.fetchall(sql, (insert_time, limit))
-        return [[str2bin(result[0]), result[1], result[2], result[3] or 0] for result in results]
+        results = self._db.getRandom(u"Torrent", (u"infohash", u"num_seeders", u"num_leechers", u"last_tracker_check"),
+                                     u"torrent_id", u"Torrent",
+                                     where=u"is_collected == 1 AND insert_time < ? AND secret is not 1",
+                                     args=(insert_time,), limit=limit)
+        return [[db2infohash(result[0]), result[1], result[2], result[3] or 0] for result in results]
 
     def select_torrents_to_collect(self, hashes):
         parameters = '?,' * len(hashes)
@@ -954,261 +1068,260 @@ class TorrentDBHandler(BasicDBHandler):
         # TODO: bias according to votecast, popular first
 
         sql = u"SELECT infohash FROM Torrent WHERE is_collected == 0 AND infohash IN (%s)" % parameters
-        results = self._db.fetchall(sql, map(bin2str, hashes))
-        return [str2bin(infohash) for infohash, in results]
+        results = self._db.fetchall(sql, map(infohash2db, hashes))
+        return [db2infohash(infohash) for infohash, in results]
 
     def getTorrentsStats(self):
         return self._db.getOne('CollectedTorrent', ['count(torrent_id)', 'sum(length)', 'sum(num_files)'])
 
     def freeSpace(self, torrents2del):
-        if self.channelcast_db and self.channelcast_db._channel_id:
-            sql = U"""
-                SELECT torrent_file_name, torrent_id, relevance,
-                MIN(relevance, 2500) + MIN(500, num_leechers) + 4*MIN(500, num_seeders) - (MAX(0, MIN(500, (%d - creation_date)/86400)) ) AS weight
-                FROM CollectedTorrent
-                WHERE torrent_id NOT IN (SELECT torrent_id FROM MyPreference)
-                AND torrent_id NOT IN (SELECT torrent_id FROM ChannelTorrents WHERE channel_id == %d)
-                ORDER BY weight
-                LIMIT %d
-            """ % (int(time()), self.channelcast_db._channel_id, torrents2del)
-        else:
-            sql = u"""
-                SELECT torrent_file_name, torrent_id, relevance,
-                    min(relevance,2500) +  min(500,num_leechers) + 4*min(500,num_seeders) - (max(0,min(500,(%d-creation_date)/86400)) ) AS weight
-                FROM CollectedTorrent
-                WHERE torrent_id NOT IN (SELECT torrent_id FROM MyPreference)
-                ORDER BY weight
-                LIMIT %d
-            """ % (int(time()), torrents2del)
-
-        res_list = self._db.fetchall(sql)
-        if len(res_list) == 0:
-            return False
-
-        # delete torrents from db
-        sql_del_torrent = u"UPDATE Torrent SET torrent_file_name = NULL WHERE torrent_id = ?"
-        # sql_del_tracker = "delete from TorrentTracker where torrent_id=?"
-        # sql_del_pref = "delete from Preference where torrent_id=?"
-        tids = [(torrent_id,) for torrent_file_name, torrent_id, relevance, weight in res_list]
+        """
+        Evicts the torrents2del collected torrents with the lowest weight that we did not download and that are not
+        in our channel, deleting them from the torrent store in one batch. The weight of a torrent is
+            min(relevance, 2500) + min(500, num_leechers) + 4 * min(500, num_seeders) - min(500, age in days)
+        and is unknown when any of its inputs is.
+
+        Instead of computing the weight of every collected torrent, index range scans each find the lowest weighted
+        torrents of one kind: those with an unknown weight, which go first, those older than EVICTION_MAX_AGE days
+        and those created in the future, both ordered by eviction_weight, and the others, ordered by
+        eviction_date_weight. Within each of these kinds the order of the index is the order of the weights. A kind
+        that holds fewer than EVICTION_SMALL_CLASS torrents is read through the creation date index instead, as the
+        scan of the weight index would have to skip the torrents of the other kinds to find its torrents.
+        @return: the number of evicted torrents.
+        """
+        now = time()
+        max_age_date = now - EVICTION_MAX_AGE * 86400
 
-        self._db.executemany(sql_del_torrent, tids)
-        # self._db.executemany(sql_del_tracker, tids)
-        # self._db.executemany(sql_del_pref, tids)
+        conditions = u"is_collected == 1 AND torrent_id NOT IN (SELECT torrent_id FROM MyPreference)"
+        args = []
+        if self.channelcast_db and self.channelcast_db._channel_id:
+            conditions += u" AND torrent_id NOT IN (SELECT torrent_id FROM ChannelTorrents WHERE channel_id == ?)"
+            args.append(self.channelcast_db._channel_id)
+        sql = u"SELECT torrent_id, infohash, eviction_weight, creation_date FROM Torrent WHERE " + conditions
+
+        candidates = self._db.fetchall(sql + u" AND eviction_weight IS NULL ORDER BY torrent_id LIMIT ?",
+                                       args + [torrents2del])
+        min_weight = self._db.fetchone(u"SELECT min(eviction_weight) FROM Torrent WHERE is_collected == 1")
+        if min_weight is not None:
+            # younger torrents all have a larger eviction_date_weight than the second argument, start the range scan
+            # there. The + keeps SQLite from using the creation date index for the range of the weight scans.
+            for date_range, date_args, scan, scan_args in (
+                    (u"creation_date <= ?", [max_age_date], u"eviction_weight IS NOT NULL ORDER BY eviction_weight",
+                     []),
+                    (u"creation_date > ?", [now], u"eviction_weight IS NOT NULL ORDER BY eviction_weight", []),
+                    (u"creation_date > ? AND creation_date <= ?", [max_age_date, now],
+                     u"eviction_date_weight > ? ORDER BY eviction_date_weight", [min_weight + max_age_date / 86400.0])):
+                class_size = self._db.fetchone(u"SELECT count(*) FROM (SELECT 1 FROM Torrent WHERE is_collected == 1"
+                                               u" AND %s LIMIT ?)" % date_range, date_args + [EVICTION_SMALL_CLASS])
+                if class_size < EVICTION_SMALL_CLASS:
+                    candidates += self._db.fetchall(sql + u" AND " + date_range, args + date_args)
+                else:
+                    candidates += self._db.fetchall(
+                        sql + u" AND " + date_range.replace(u"creation_date", u"+creation_date") + u" AND " + scan +
+                        u" LIMIT ?", args + date_args + scan_args + [torrents2del])
 
-        # but keep the infohash in db to maintain consistence with preference db
-        # torrent_id_infohashes = [(torrent_id,infohash_str,relevance) for torrent_file_name, torrent_id, infohash_str, relevance, weight in res_list]
-        # sql_insert =  "insert into Torrent (torrent_id, infohash, relevance) values (?,?,?)"
-        # self._db.executemany(sql_insert, torrent_id_infohashes)
+        def get_weight(candidate):
+            _, _, weight, creation_date = candidate
+            if weight is None:
+                return None
+            return weight - min(EVICTION_MAX_AGE, max(0, (now - creation_date) / 86400.0))
 
-        deleted = 0  # deleted any file?
-        insert_files = []
+        to_evict = {}
+        for candidate in sorted(candidates, key=get_weight):
+            if len(to_evict) == torrents2del:
+                break
+            to_evict[candidate[0]] = db2infohash(candidate[1])
+        if not to_evict:
+            return 0
 
-        if len(insert_files) > 0:
-            sql_insert_files = "INSERT OR IGNORE INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)"
-            self._db.executemany(sql_insert_files, insert_files)
+        self._db.executemany(u"UPDATE Torrent SET is_collected = 0 WHERE torrent_id = ?",
+                             [(torrent_id,) for torrent_id in to_evict])
+        self.existed_torrents.difference_update(to_evict.values())
+        self.session.delete_collected_torrents(to_evict.values())
 
-        self._logger.info("Erased %d torrents", deleted)
-        return deleted
+        self._logger.info("Erased %d torrents", len(to_evict))
+        return len(to_evict)
 
     def searchNames(self, kws, local=True, keys=None, doSort=True):
+        """
+        Searches the names and files of the torrents for the keywords kws.
+
+        Torrents that are only in channels we marked as spam, or that were deleted from all of their channels, are
+        not returned. Unless local is True, only collected torrents that are not secret are searched and only the
+        REMOTE_SEARCH_RESULTS best ranked of the first REMOTE_SEARCH_CANDIDATES matches are returned. The ranking is
+        done by the search_rank SQL function, ties are broken by the number of seeders.
+        @param keys: the columns of Torrent T to return, which must include infohash.
+        @param doSort: whether to return local results ranked as well.
+        @return: a list of results, each consisting of the values of keys, the channel_id of the channel the torrent
+        is returned in, a dictionary of the keywords matching its swarmname, filenames and fileextensions and the
+        columns of that channel as returned by ChannelCastDBHandler.getChannels.
+        """
         assert 'infohash' in keys
-        assert not doSort or ('num_seeders' in keys or 'T.num_seeders' in keys)
-
         infohash_index = keys.index('infohash')
-        num_seeders_index = keys.index('num_seeders') if 'num_seeders' in keys else -1
-
-        if num_seeders_index == -1:
-            doSort = False
-
-        t1 = time()
-        values = ", ".join(keys)
-        mainsql = "SELECT " + values + ", C.channel_id, Matchinfo(FullTextIndex) FROM"
-        if local:
-            mainsql += " Torrent T"
-        else:
-            mainsql += " CollectedTorrent T"
-
-        mainsql += """, FullTextIndex
-                    LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id
-                    WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid AND C.deleted_at IS NULL AND FullTextIndex MATCH ?
-                    """
 
+        my_votes = self.votecast_db.getMyVotes() if self.votecast_db else {}
+        spam_channel_ids = [channel_id for channel_id, vote in my_votes.iteritems() if vote < 0]
+        sort = doSort or not local
+        matchinfo = u"matchinfo(FullTextIndex, '%s')" % self._db.matchinfo_format
+        sql = u"SELECT T.torrent_id, " + u", ".join(keys) + u", " + matchinfo + u", " + \
+              (u"search_rank(" + matchinfo + u") AS rank, T.num_seeders AS seeders" if sort else u"0, 0") + \
+              u" FROM " + (u"Torrent T" if local else u"CollectedTorrent T") + u""", FullTextIndex
+            WHERE T.name IS NOT NULL AND T.torrent_id = FullTextIndex.rowid AND FullTextIndex MATCH ?
+            AND (NOT EXISTS (SELECT * FROM _ChannelTorrents C WHERE C.torrent_id = T.torrent_id)
+                 OR EXISTS (SELECT * FROM _ChannelTorrents C WHERE C.torrent_id = T.torrent_id
+                            AND C.deleted_at IS NULL AND C.channel_id NOT IN (%s)))""" % \
+            u",".join(str(int(channel_id)) for channel_id in spam_channel_ids)
         if not local:
-            mainsql += "AND T.secret is not 1 LIMIT 250"
-
-        query = " ".join(filter_keywords(kws))
-        not_negated = [kw for kw in filter_keywords(kws) if kw[0] != '-']
-
-        results = self._db.fetchall(mainsql, (query,))
-
-        t2 = time()
-
-        channels = set()
-        channel_dict = {}
-        for result in results:
-            if result[-2]:
-                channels.add(result[-2])
-
-        if len(channels) > 0:
-            # results are tuples of (id, str(dispersy_cid), name, description,
-            # nr_torrents, nr_favorites, nr_spam, my_vote, modified, id ==
-            # self._channel_id)
-            for channel in self.channelcast_db.getChannels(channels):
-                if channel[1] != '-1':
-                    channel_dict[channel[0]] = channel
-
-        t3 = time()
-        myChannelId = self.channelcast_db._channel_id or 0
-
-        result_dict = {}
-
-        # step 1, merge torrents keep one with best channel
-        for result in results:
-            channel_id = result[-2]
-            channel = channel_dict.get(channel_id, None)
-
-            infohash = result[infohash_index]
-            if channel:
-                # ignoring spam channels
-                if channel[7] < 0:
-                    continue
-
-                # see if we have a better channel in torrents_dict
-                if infohash in result_dict:
-                    old_channel = channel_dict.get(result_dict[infohash][-2], False)
-                    if old_channel:
-
-                        # allways prefer my channel
-                        if old_channel[0] == myChannelId:
-                            continue
-
-                        # allways prefer channel with higher vote
-                        if channel[7] < old_channel[7]:
-                            continue
-
-                        votes = (channel[5] or 0) - (channel[6] or 0)
-                        oldvotes = (old_channel[5] or 0) - (old_channel[6] or 0)
-                        if votes < oldvotes:
-                            continue
-
-                result_dict[infohash] = result
-
-            elif infohash not in result_dict:
-                result_dict[infohash] = result
-
-        t4 = time()
-
-        # step 2, fix all dict fields
-        dont_sort_list = []
-        results = [list(result) for result in result_dict.values()]
-        for i in xrange(len(results) - 1, -1, -1):
-            result = results[i]
-
-            result[infohash_index] = str2bin(result[infohash_index])
-
-            matches = {'swarmname': set(), 'filenames': set(), 'fileextensions': set()}
-
-            # Matchinfo is documented at: http://www.sqlite.org/fts3.html#matchinfo
-            matchinfo = str(result[-1])
-            num_phrases, num_cols = unpack_from('II', matchinfo)
-            unpack_str = 'I' * (3 * num_cols * num_phrases)
-            matchinfo = unpack_from('II' + unpack_str, matchinfo)
-
-            swarmnames, filenames, fileextensions = [
-                [matchinfo[3 * (i + p * num_cols) + 2] for p in range(num_phrases)]
-                for i in range(num_cols)
-            ]
-
-            for i, keyword in enumerate(not_negated):
-                if swarmnames[i]:
-                    matches['swarmname'].add(keyword)
-                if filenames[i]:
-                    matches['filenames'].add(keyword)
-                if fileextensions[i]:
-                    matches['fileextensions'].add(keyword)
+            # ranking every match of a common keyword takes too long, like before only consider a few candidates. They
+            # are taken in the order of the index, any other order makes SQLite read all matches first.
+            sql = u"SELECT * FROM (" + sql + u" AND T.secret is not 1 LIMIT %d)" \
+                  u" ORDER BY rank DESC, seeders DESC LIMIT %d" % (REMOTE_SEARCH_CANDIDATES, REMOTE_SEARCH_RESULTS)
+        elif sort:
+            sql += u" ORDER BY rank DESC, seeders DESC"
+
+        keywords = filter_keywords(kws)
+        not_negated = [kw for kw in keywords if kw[0] != '-']
+        query = u" ".join(keywords)
+        results = self._db.fetchall(sql, (query,))
+
+        # fetch the channels of the returned torrents, keeping the best channel of every torrent
+        torrent_channels = {}
+        if results and self.channelcast_db:
+            if local:
+                # there may be a lot of results, let SQLite find them again instead of parsing all of their ids
+                torrent_ids, args = u"SELECT rowid FROM FullTextIndex WHERE FullTextIndex MATCH ?", (query,)
+            else:
+                torrent_ids, args = u",".join(str(result[0]) for result in results), ()
+            channel_rows = self._db.fetchall(u"SELECT torrent_id, channel_id FROM _ChannelTorrents "
+                                             u"WHERE deleted_at IS NULL AND torrent_id IN (%s)" % torrent_ids, args)
+            channel_dict = dict((channel[0], channel) for channel in
+                                self.channelcast_db.getChannels(set(channel_id for _, channel_id in channel_rows))
+                                if channel[1] != '-1' and channel[7] >= 0)
+            my_channel_id = self.channelcast_db._channel_id or 0
+
+            def channel_key(channel):
+                # always prefer my channel, then the channel with the highest vote
+                return (channel[0] == my_channel_id, channel[7], (channel[5] or 0) - (channel[6] or 0))
+
+            for torrent_id, channel_id in channel_rows:
+                channel = channel_dict.get(channel_id)
+                if channel and (torrent_id not in torrent_channels or
+                                channel_key(channel) >= channel_key(torrent_channels[torrent_id])):
+                    torrent_channels[torrent_id] = channel
+
+        all_matches = {}
+        for i, result in enumerate(results):
+            result = list(result[1:-2])
+            result[infohash_index] = db2infohash(result[infohash_index])
+
+            # rows matching the keywords in the same columns share their matches
+            columns = parse_matchinfo(result[-1])
+            matches = all_matches.get(columns)
+            if matches is None:
+                matches = all_matches[columns] = dict(
+                    (column, set(keyword for keyword, keyword_columns in zip(not_negated, columns)
+                                 if keyword_columns[col]))
+                    for col, column in enumerate(('swarmname', 'filenames', 'fileextensions')))
             result[-1] = matches
 
-            channel = channel_dict.get(result[-2], (result[-2], None, '', '', 0, 0, 0, 0, 0, False))
+            channel = torrent_channels.get(results[i][0], (None, None, '', '', 0, 0, 0, 0, 0, False))
+            result.insert(-1, channel[0])
             result.extend(channel)
+            results[i] = result
 
-            if doSort and result[num_seeders_index] <= 0:
-                dont_sort_list.append(result)
-                results.pop(i)
-
-        t5 = time()
-
-        if doSort:
-            def compare(a, b):
-                return cmp(a[num_seeders_index], b[num_seeders_index])
-            results.sort(compare, reverse=True)
-        results.extend(dont_sort_list)
+        return results
 
-        if not local:
-            results = results[:25]
+    def getAutoCompleteTerms(self, keyword, max_terms):
+        """
+        Completes the last word of keyword to at most max_terms of the most common keywords in the names of the
+        indexed torrents that start with it. Nothing is completed until loadSearchTerms is done.
+        """
+        head, _, prefix = keyword.lower().rpartition(u" ")
+        autocomplete_trie = self.autocomplete_trie
+        if not prefix or autocomplete_trie is None:
+            return []
 
-        return results
+        completions = autocomplete_trie.get_completions(prefix, max_terms + 1)
+        return [head + u" " + term if head else term for term in completions if term != prefix][:max_terms]
 
-    def getAutoCompleteTerms(self, keyword, max_terms, limit=100):
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
-        result = self._db.fetchall(sql, (keyword + '*', limit))
+    def getSearchSuggestion(self, keywords, limit=1):
+        """
+        Suggests at most limit alternative searches, in which the keywords that do not occur in the name of any
+        indexed torrent are replaced by the closest ones that do. Nothing is suggested until loadSearchTerms is done.
+        """
+        term_index = self.search_term_index
+        if term_index is None:
+            return []
 
-        all_terms = set()
-        for line, in result:
-            if len(all_terms) >= max_terms:
-                break
-            i1 = line.find(keyword)
-            i2 = line.find(' ', i1 + len(keyword))
-            all_terms.add(line[i1:i2] if i2 >= 0 else line[i1:])
+        alternatives = []
+        corrected = False
+        for keyword in keywords:
+            keyword = keyword.lower()
+            closest = None
+            if len(keyword) > 3 and keyword not in term_index:
+                closest = term_index.get_closest_terms(keyword, limit)
+            if closest:
+                alternatives.append(closest)
+                corrected = True
+            else:
+                alternatives.append([(0, keyword)])
 
-        if keyword in all_terms:
-            all_terms.remove(keyword)
-        if '' in all_terms:
-            all_terms.remove('')
+        if not corrected:
+            return []
 
-        return list(all_terms)
+        suggestions = nsmallest(limit, product(*alternatives), key=lambda terms: sum(distance for distance, _ in terms))
+        return [u" ".join(term for _, term in terms) for terms in suggestions]
 
-    def getSearchSuggestion(self, keywords, limit=1):
-        match = [keyword.lower() for keyword in keywords if len(keyword) > 3]
-
-        def lev(a, b):
-            "Calculates the Levenshtein distance between a and b."
-            n, m = len(a), len(b)
-            if n > m:
-                # Make sure n <= m, to use O(min(n,m)) space
-                a, b = b, a
-                n, m = m, n
-
-            current = range(n + 1)
-            for i in range(1, m + 1):
-                previous, current = current, [i] + [0] * n
-                for j in range(1, n + 1):
-                    add, delete = previous[j] + 1, current[j - 1] + 1
-                    change = previous[j - 1]
-                    if a[j - 1] != b[i - 1]:
-                        change = change + 1
-                    current[j] = min(add, delete, change)
-
-            return current[n]
-
-        def levcollate(s1, s2):
-            l1 = sum(sorted([lev(a, b) for a in s1.split() for b in match])[:len(match)])
-            l2 = sum(sorted([lev(a, b) for a in s2.split() for b in match])[:len(match)])
-
-            # return -1 if s1<s2, +1 if s1>s2 else 0
-            if l1 < l2:
-                return -1
-            if l1 > l2:
-                return 1
-            return 0
+    @call_on_reactor_thread
+    def loadSearchTerms(self, batch_size=SEARCH_TERMS_BATCH_SIZE):
+        """
+        Builds the trigram index used by getSearchSuggestion and the prefix trie used by getAutoCompleteTerms from
+        one scan of the names of the indexed torrents. This runs in the background, both indexes are used once it is
+        done. Every reactor iteration reads batch_size names, the terms are only counted for the trie during the
+        scan and added to it afterwards, batch_size terms at a time and the most frequent first, so that the tops
+        of the trie are not reordered.
+        """
+        with self.search_term_lock:
+            self._search_terms_loading = (TrigramIndex(), PrefixTrie())
+            self._search_terms_position = 0
+        self._search_term_counts = defaultdict(int)
+        self.register_task(u"load search terms",
+                           LoopingCall(self._loadSearchTermsBatch, batch_size)).start(0)
+
+    def _loadSearchTermsBatch(self, batch_size):
+        search_term_index, autocomplete_trie = self._search_terms_loading
+
+        if self._search_terms_position is not None:
+            rows = self._db.fetchall(u"SELECT rowid, swarmname FROM FullTextIndex WHERE rowid > ? ORDER BY rowid "
+                                     u"LIMIT ?", (self._search_terms_position, batch_size))
+            terms = [term for _, swarmname in rows if swarmname for term in swarmname.lower().split()]
+            for term in terms:
+                if is_search_term(term):
+                    self._search_term_counts[term] += 1
+
+            with self.search_term_lock:
+                search_term_index.add_terms(terms)
+                self._search_terms_position = rows[-1][0] if len(rows) == batch_size else None
+
+            if self._search_terms_position is None:
+                # the trie would only keep the most frequent terms anyway
+                counts = self._search_term_counts
+                number = len(counts) if len(counts) <= autocomplete_trie.max_terms \
+                    else autocomplete_trie.max_terms * 3 / 4
+                self._search_term_counts = nlargest(number, counts.iteritems(), key=itemgetter(1))
+                self._search_term_counts.reverse()
+            return
 
-        cursor = self._db.get_cursor()
-        connection = cursor.getconnection()
-        connection.createcollation("leven", levcollate)
+        if self._search_term_counts:
+            autocomplete_trie.add_term_counts(dict(self._search_term_counts[-batch_size:]))
+            del self._search_term_counts[-batch_size:]
+            return
 
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? ORDER By swarmname collate leven ASC LIMIT ?"
-        results = self._db.fetchall(sql, (' OR '.join(['*%s*' % m for m in match]), limit))
-        connection.createcollation("leven", None)
-        return [result[0] for result in results]
+        with self.search_term_lock:
+            self.search_term_index, self.autocomplete_trie = self._search_terms_loading
+            self._search_terms_loading = None
+        self._search_term_counts = None
+        self.cancel_pending_task(u"load search terms")
 
 
 class MyPreferenceDBHandler(BasicDBHandler):
@@ -1240,7 +1353,7 @@ class MyPreferenceDBHandler(BasicDBHandler):
 
         res = self._db.fetchall(sql)
         res = [item for sublist in res for item in sublist]
-        return [str2bin(p) if p else '' for p in res]
+        return [db2infohash(p) if p else '' for p in res]
 
     def getMyPrefStats(self, torrent_id=None):
         value_name = ('torrent_id', 'destination_path',)
@@ -1316,7 +1429,9 @@ class VoteCastDBHandler(BasicDBHandler):
 
         self.channelcast_db = None
 
+    @blocking_call_on_reactor_thread
     def initialize(self, *args, **kwargs):
+        # the megacache is initialized on a thread of its own, the looping call is started on the reactor thread
         self.channelcast_db = self.session.open_dbhandler(NTFY_CHANNELCAST)
         self.session.sqlite_db.register_task(u"flush to database",
                                              LoopingCall(self._flush_to_database)).start(VOTECAST_FLUSH_DB_INTERVAL,
@@ -1327,8 +1442,17 @@ class VoteCastDBHandler(BasicDBHandler):
         self.channelcast_db = None
 
     def on_votes_from_dispersy(self, votes):
-        insert_vote = "INSERT OR REPLACE INTO _ChannelVotes (channel_id, voter_id, dispersy_id, vote, time_stamp) VALUES (?,?,?,?,?)"
-        self._db.executemany(insert_vote, votes)
+        # the channel_votes triggers update the vote counts of the channels. A replaced vote would not fire the
+        # delete trigger, so existing votes are updated in place and only new ones are inserted.
+        latest_votes = dict(((vote[0], vote[1]), vote) for vote in votes).values()
+        update_vote = "UPDATE _ChannelVotes SET dispersy_id = ?, vote = ?, time_stamp = ?, deleted_at = NULL " + \
+                      "WHERE channel_id = ? AND voter_id IS ?"
+        self._db.executemany(update_vote, [(dispersy_id, vote, time_stamp, channel_id, voter_id)
+                                           for channel_id, voter_id, dispersy_id, vote, time_stamp in latest_votes])
+        insert_vote = "INSERT INTO _ChannelVotes (channel_id, voter_id, dispersy_id, vote, time_stamp) " + \
+                      "SELECT ?,?,?,?,? WHERE NOT EXISTS " + \
+                      "(SELECT 1 FROM _ChannelVotes WHERE channel_id = ? AND voter_id IS ?)"
+        self._db.executemany(insert_vote, [tuple(vote) + (vote[0], vote[1]) for vote in latest_votes])
 
         for channel_id, voter_id, _, vote, _ in votes:
             if voter_id is None:
@@ -1349,26 +1473,12 @@ class VoteCastDBHandler(BasicDBHandler):
             self.updatedChannels.add(channel_id)
 
     def _flush_to_database(self):
+        # the vote counts are already up to date, only the notifications are batched
         channel_ids = list(self.updatedChannels)
         self.updatedChannels.clear()
 
-        if channel_ids:
-            parameters = ",".join("?" * len(channel_ids))
-            sql = "Select channel_id, vote FROM ChannelVotes WHERE channel_id in (" + parameters + ")"
-            positive_votes = {}
-            negative_votes = {}
-            for channel_id, vote in self._db.fetchall(sql, channel_ids):
-                if vote == 2:
-                    positive_votes[channel_id] = positive_votes.get(channel_id, 0) + 1
-                elif vote == -1:
-                    negative_votes[channel_id] = negative_votes.get(channel_id, 0) + 1
-
-            updates = [(positive_votes.get(channel_id, 0), negative_votes.get(channel_id, 0), channel_id)
-                       for channel_id in channel_ids]
-            self._db.executemany("UPDATE OR IGNORE _Channels SET nr_favorite = ?, nr_spam = ? WHERE id = ?", updates)
-
-            for channel_id in channel_ids:
-                self.notifier.notify(NTFY_VOTECAST, NTFY_UPDATE, channel_id)
+        for channel_id in channel_ids:
+            self.notifier.notify(NTFY_VOTECAST, NTFY_UPDATE, channel_id)
 
     def get_latest_vote_dispersy_id(self, channel_id, voter_id):
         if voter_id:
@@ -1440,6 +1550,7 @@ class ChannelCastDBHandler(BasicDBHandler):
         self.votecast_db = None
         self.torrent_db = None
 
+    @blocking_call_on_reactor_thread
     def initialize(self, *args, **kwargs):
         self.modification_types = dict(self._db.fetchall("SELECT name, id FROM MetaDataTypes"))
         self.id2modification = dict([(v, k) for k, v in self.modification_types.iteritems()])
@@ -1611,7 +1722,7 @@ class ChannelCastDBHandler(BasicDBHandler):
             infohash = self._db.fetchone(sql, (channeltorrent_id,))
 
             if infohash:
-                infohash = str2bin(infohash)
+                infohash = db2infohash(infohash)
                 self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
         elif modification_type in ['swift-url']:
@@ -1766,7 +1877,7 @@ class ChannelCastDBHandler(BasicDBHandler):
         if playlist_id:
             get_channeltorent_id = """SELECT id FROM _ChannelTorrents, Torrent
             WHERE _ChannelTorrents.torrent_id = Torrent.torrent_id AND Torrent.infohash = ?"""
-            channeltorrent_id = self._db.fetchone(get_channeltorent_id, (bin2str(infohash),))
+            channeltorrent_id = self._db.fetchone(get_channeltorent_id, (infohash2db(infohash),))
 
             if channeltorrent_id:
                 sql = "UPDATE _PlaylistTorrents SET deleted_at = ? WHERE playlist_id = ? AND channeltorrent_id = ?"
@@ -1920,7 +2031,7 @@ class ChannelCastDBHandler(BasicDBHandler):
         AND ChannelTorrents.channel_id==? and ChannelTorrents.dispersy_id <> -1 order by time_stamp desc limit ?"""
         myrecenttorrents = self._db.fetchall(sql, (self._channel_id, NUM_OWN_RECENT_TORRENTS))
         for cid, infohash, timestamp in myrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            torrent_dict.setdefault(str(cid), set()).add(db2infohash(infohash))
             least_recent = timestamp
 
         if len(myrecenttorrents) == NUM_OWN_RECENT_TORRENTS and least_recent != -1:
@@ -1930,10 +2041,10 @@ class ChannelCastDBHandler(BasicDBHandler):
             AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
             myrandomtorrents = self._db.fetchall(sql, (self._channel_id, least_recent, NUM_OWN_RANDOM_TORRENTS))
             for cid, infohash, _ in myrecenttorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+                torrent_dict.setdefault(str(cid), set()).add(db2infohash(infohash))
 
             for cid, infohash in myrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+                torrent_dict.setdefault(str(cid), set()).add(db2infohash(infohash))
 
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
         additionalSpace = (NUM_OWN_RECENT_TORRENTS + NUM_OWN_RANDOM_TORRENTS) - nr_records
@@ -1954,18 +2065,20 @@ class ChannelCastDBHandler(BasicDBHandler):
         WHERE voter_id ISNULL AND vote=2) and ChannelTorrents.dispersy_id <> -1 ORDER BY time_stamp desc limit ?"""
         othersrecenttorrents = self._db.fetchall(sql, (NUM_OTHERS_RECENT_TORRENTS,))
         for cid, infohash, timestamp in othersrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            torrent_dict.setdefault(str(cid), set()).add(db2infohash(infohash))
             least_recent = timestamp
 
         if othersrecenttorrents and len(othersrecenttorrents) == NUM_OTHERS_RECENT_TORRENTS and least_recent != -1:
-            sql = """SELECT dispersy_cid, infohash FROM ChannelTorrents, Channels, Torrent
-            WHERE ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
+            where = """ChannelTorrents.torrent_id = Torrent.torrent_id AND Channels.id = ChannelTorrents.channel_id
             AND ChannelTorrents.channel_id in (select channel_id from ChannelVotes
             WHERE voter_id ISNULL and vote=2) and time_stamp < ?
-            AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
-            othersrandomtorrents = self._db.fetchall(sql, (least_recent, NUM_OTHERS_RANDOM_TORRENTS))
+            AND ChannelTorrents.dispersy_id <> -1"""
+            othersrandomtorrents = self._db.getRandom(u"ChannelTorrents, Channels, Torrent",
+                                                      (u"dispersy_cid", u"infohash"), u"ChannelTorrents.id",
+                                                      u"_ChannelTorrents", where=where, args=(least_recent,),
+                                                      limit=NUM_OTHERS_RANDOM_TORRENTS)
             for cid, infohash in othersrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+                torrent_dict.setdefault(str(cid), set()).add(db2infohash(infohash))
 
         twomonthsago = long(time() - 5259487)
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
@@ -1980,7 +2093,7 @@ class ChannelCastDBHandler(BasicDBHandler):
         AND ChannelTorrents.dispersy_id <> -1 and Channels.modified > ? order by time_stamp desc limit ?"""
         interesting_records = self._db.fetchall(sql, (twomonthsago, NUM_OTHERS_DOWNLOADED))
         for cid, infohash in interesting_records:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            torrent_dict.setdefault(str(cid), set()).add(db2infohash(infohash))
 
         return torrent_dict
 
@@ -1990,20 +2103,20 @@ class ChannelCastDBHandler(BasicDBHandler):
 
         returnar = []
         for infohash, in self._db.fetchall(sql, (channel_id, limit)):
-            returnar.append(str2bin(infohash))
+            returnar.append(db2infohash(infohash))
         return returnar
 
     def getTorrentFromChannelId(self, channel_id, infohash, keys):
         sql = "SELECT " + ", ".join(keys) + """ FROM Torrent, ChannelTorrents
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND channel_id = ? AND infohash = ?"""
-        result = self._db.fetchone(sql, (channel_id, bin2str(infohash)))
+        result = self._db.fetchone(sql, (channel_id, infohash2db(infohash)))
 
         return self.__fixTorrent(keys, result)
 
     def getChannelTorrents(self, infohash, keys):
         sql = "SELECT " ", ".join(keys) + """ FROM Torrent, ChannelTorrents
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND infohash = ?"""
-        results = self._db.fetchall(sql, (bin2str(infohash),))
+        results = self._db.fetchall(sql, (infohash2db(infohash),))
 
         return self.__fixTorrents(keys, results)
 
@@ -2119,7 +2232,7 @@ class ChannelCastDBHandler(BasicDBHandler):
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id
               AND ChannelTorrents.id = PlaylistTorrents.channeltorrent_id
               AND playlist_id = ? AND infohash = ?"""
-        result = self._db.fetchone(sql, (playlist_id, bin2str(infohash)))
+        result = self._db.fetchone(sql, (playlist_id, infohash2db(infohash)))
 
         return self.__fixTorrent(keys, result)
 
@@ -2216,14 +2329,14 @@ class ChannelCastDBHandler(BasicDBHandler):
     def __fixTorrent(self, keys, torrent):
         if len(keys) == 1:
             if keys[0] == 'infohash':
-                return str2bin(torrent)
+                return db2infohash(torrent)
             return torrent
 
         def fix_value(key, torrent):
             if key in keys:
                 key_index = keys.index(key)
                 if torrent[key_index]:
-                    torrent[key_index] = str2bin(torrent[key_index])
+                    torrent[key_index] = db2infohash(torrent[key_index])
         if torrent:
             torrent = list(torrent)
             fix_value('infohash', torrent)
@@ -2236,7 +2349,7 @@ class ChannelCastDBHandler(BasicDBHandler):
                 for i in range(len(results)):
                     result = list(results[i])
                     if result[key_index]:
-                        result[key_index] = str2bin(result[key_index])
+                        result[key_index] = db2infohash(result[key_index])
                         results[i] = result
         fix_value('infohash')
         return results
@@ -2340,7 +2453,7 @@ class ChannelCastDBHandler(BasicDBHandler):
                 dispersy_cid = str(dispersy_cid)
                 torrents = self._db.fetchall(select_torrents, (channel_id, limitTorrents))
                 for infohash, ChTname, CoTname, time_stamp in torrents:
-                    infohash = str2bin(infohash)
+                    infohash = db2infohash(infohash)
                     results.append((channel_id, dispersy_cid, name, infohash, ChTname or CoTname, time_stamp))
             return results
         return []
@@ -2350,7 +2463,7 @@ class ChannelCastDBHandler(BasicDBHandler):
               "FROM Channels WHERE"
         for keyword in keywords:
             sql += " name like '%" + keyword + "%' and"
-        sql = sql[:-3]
+        sql = sql[:-3] + CHANNEL_ORDER
         return self._getChannels(sql)
 
     def getChannel(self, channel_id):
@@ -2363,7 +2476,7 @@ class ChannelCastDBHandler(BasicDBHandler):
     def getChannelFromPermid(self, channel_permid):
         sql = "Select C.id, C.name, C.description, C.dispersy_cid, " + \
               "C.modified, C.nr_torrents, C.nr_favorite, C.nr_spam " + \
-              "FROM Channels as C, Peer WHERE C.peer_id = Peer.peer_id AND Peer.permid = ?"
+              "FROM Channels as C, Peer WHERE C.peer_id = Peer.peer_id AND Peer.permid = ?" + CHANNEL_ORDER
         channels = self._getChannels(sql, (channel_permid,))
         if len(channels) > 0:
             return channels[0]
@@ -2374,7 +2487,7 @@ class ChannelCastDBHandler(BasicDBHandler):
               "nr_torrents, nr_favorite, nr_spam FROM Channels " + \
               "WHERE id IN ('" + \
             channel_ids + \
-            "')"
+            "')" + CHANNEL_ORDER
         return self._getChannels(sql)
 
     def getChannelsByCID(self, channel_cids):
@@ -2385,43 +2498,29 @@ class ChannelCastDBHandler(BasicDBHandler):
         sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam " + \
               "FROM Channels WHERE dispersy_cid IN (" + \
             parameters + \
-            ")"
+            ")" + CHANNEL_ORDER
         return self._getChannels(sql, channel_cids)
 
     def getAllChannels(self):
         """ Returns all the channels """
-        sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam FROM Channels"
+        sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam " + \
+              "FROM Channels" + CHANNEL_ORDER
         return self._getChannels(sql)
 
     def getNewChannels(self, updated_since=0):
         """ Returns all newest unsubscribed channels, ie the ones with no votes (positive or negative)"""
         sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam " + \
-              "FROM Channels WHERE nr_favorite = 0 AND nr_spam = 0 AND modified > ?"
+              "FROM Channels WHERE nr_favorite = 0 AND nr_spam = 0 AND modified > ?" + CHANNEL_ORDER
         return self._getChannels(sql, (updated_since,))
 
     def getLatestUpdated(self, max_nr=20):
-        def channel_sort(a, b):
-            # first compare local vote, spam -> return -1
-            if a[7] == -1:
-                return 1
-            if b[7] == -1:
-                return -1
-
-            # then compare latest update
-            if a[8] < b[8]:
-                return 1
-            if a[8] > b[8]:
-                return -1
-            # finally compare nr_torrents
-            return cmp(a[4], b[4])
-
         sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam " + \
-              "FROM Channels Order By modified DESC Limit ?"
-        return self._getChannels(sql, (max_nr,), cmpF=channel_sort)
+              "FROM Channels Order By modified DESC, nr_torrents Limit ?"
+        return self._getChannels(sql, (max_nr,))
 
     def getMostPopularChannels(self, max_nr=20):
         sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam " + \
-              "FROM Channels ORDER BY nr_favorite DESC, modified DESC LIMIT ?"
+              "FROM Channels" + CHANNEL_ORDER + " LIMIT ?"
         return self._getChannels(sql, (max_nr,), includeSpam=False)
 
     def getMySubscribedChannels(self, includeDispsersy=False):
@@ -2431,15 +2530,16 @@ class ChannelCastDBHandler(BasicDBHandler):
         if not includeDispsersy:
             sql += " AND dispersy_cid == -1"
 
-        return self._getChannels(sql)
+        return self._getChannels(sql + CHANNEL_ORDER)
 
-    def _getChannels(self, sql, args=None, cmpF=None, includeSpam=True):
-        """Returns the channels based on the input sql, if the number of positive votes
-        is less than maxvotes and the number of torrent > 0"""
+    def _getChannels(self, sql, args=None, includeSpam=True):
+        """Returns the channels based on the input sql, in the order the sql returns them except for the ones
+        I voted as spam, which come last"""
         if self.votecast_db is None:
             return []
 
         channels = []
+        spam_channels = []
         results = self._db.fetchall(sql, args)
 
         my_votes = self.votecast_db.getMyVotes()
@@ -2450,35 +2550,14 @@ class ChannelCastDBHandler(BasicDBHandler):
             if name.strip() == '':
                 continue
 
-            channels.append((id, str(dispersy_cid), name, description, nr_torrents,
-                            nr_favorites, nr_spam, my_vote, modified, id == self._channel_id))
-
-        def channel_sort(a, b):
-            # first compare local vote, spam -> return -1
-            if a[7] == -1:
-                return 1
-            if b[7] == -1:
-                return -1
-
-            # then compare nr_favorites
-            if a[5] < b[5]:
-                return 1
-            if a[5] > b[5]:
-                return -1
-
-            # then compare latest update
-            if a[8] < b[8]:
-                return 1
-            if a[8] > b[8]:
-                return -1
-
-            # finally compare nr_torrents
-            return cmp(a[4], b[4])
+            channel = (id, str(dispersy_cid), name, description, nr_torrents,
+                       nr_favorites, nr_spam, my_vote, modified, id == self._channel_id)
+            if my_vote == -1:
+                spam_channels.append(channel)
+            else:
+                channels.append(channel)
 
-        if cmpF is None:
-            cmpF = channel_sort
-        channels.sort(cmpF)
-        return channels
+        return channels + spam_channels
 
     def getMyChannelId(self):
         if self._channel_id:
@@ -2517,7 +2596,7 @@ class ChannelCastDBHandler(BasicDBHandler):
               FROM Channels, ChannelTorrents, Torrent
               WHERE Channels.id = ChannelTorrents.channel_id
               AND ChannelTorrents.torrent_id = Torrent.torrent_id AND infohash = ?"""
-        channels = self._db.fetchall(sql, (bin2str(infohash),))
+        channels = self._db.fetchall(sql, (infohash2db(infohash),))
 
         if len(channels) > 0:
             channel_ids = set()
@@ -7,6 +7,10 @@
 # 25 is used by Tribler 6.5-git
 # 26 is used by Tribler 6.5-git (with database upgrade scripts)
 # 27 is used by Tribler 6.5-git (TorrentStatus and Category tables are removed)
+# 28 is used by Tribler 6.5-git (infohashes are stored as BLOBs instead of base64 text)
+# 29 is used by Tribler 6.5-git (eviction weights of collected torrents are indexed)
+# 30 is used by Tribler 6.5-git (channel vote counts are kept up to date by triggers)
+# 31 is used by Tribler 6.5-git (the torrents due for a tracker check are indexed per tracker)
 
 TRIBLER_59_DB_VERSION = 17
 TRIBLER_60_DB_VERSION = 17
@@ -23,9 +27,13 @@ TRIBLER_64RC2_DB_VERSION = 24
 TRIBLER_65PRE_DB_VERSION = 25
 TRIBLER_65PRE2_DB_VERSION = 26
 TRIBLER_65PRE3_DB_VERSION = 27
+TRIBLER_65PRE4_DB_VERSION = 28
+TRIBLER_65PRE5_DB_VERSION = 29
+TRIBLER_65PRE6_DB_VERSION = 30
+TRIBLER_65PRE7_DB_VERSION = 31
 
 # the lowest supported database version number
 LOWEST_SUPPORTED_DB_VERSION = TRIBLER_59_DB_VERSION
 
 # the latest database version number
-LATEST_DB_VERSION = TRIBLER_65PRE3_DB_VERSION
+LATEST_DB_VERSION = TRIBLER_65PRE7_DB_VERSION
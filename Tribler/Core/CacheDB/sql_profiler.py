@@ -0,0 +1,125 @@
+import logging
+import re
+from collections import deque
+
+
+DEFAULT_SLOW_QUERY_THRESHOLD = 0.1  # seconds
+TIMINGS_PER_TEMPLATE = 1000
+MAX_CACHED_TEMPLATES = 10000
+
+_STRING_RE = re.compile(r"[xX]?'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PARAMETER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """
+    Turns an SQL statement into a template by replacing literals with ? and collapsing lists of parameters and
+    whitespace, so that statements that only differ in their values map to the same template.
+    """
+    template = _STRING_RE.sub(u"?", sql)
+    template = _NUMBER_RE.sub(u"?", template)
+    template = _PARAMETER_LIST_RE.sub(u"(?, ...)", template)
+    return _WHITESPACE_RE.sub(u" ", template).strip()
+
+
+class QueryStatistics(object):
+
+    __slots__ = ('count', 'total_time', 'max_time', 'rows', 'timings')
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.timings = deque(maxlen=TIMINGS_PER_TEMPLATE)
+
+    def get_percentile(self, percentile):
+        timings = sorted(self.timings)
+        if not timings:
+            return 0.0
+        return timings[min(len(timings) - 1, int(len(timings) * percentile / 100.0))]
+
+
+class SQLProfiler(object):
+    """
+    Aggregates the execution times of SQL statements per statement template and logs the slow ones.
+
+    The p99 time of a template is computed over its last TIMINGS_PER_TEMPLATE executions. Statements that take
+    longer than slow_query_threshold seconds are logged with the query plan of their template, which is obtained
+    once through the explain callable.
+    """
+
+    def __init__(self, explain=None, slow_query_threshold=DEFAULT_SLOW_QUERY_THRESHOLD):
+        """
+        :param explain: Called with an SQL statement and its arguments, returns a list of lines describing the
+        query plan.
+        :param slow_query_threshold: Statements that take longer than this number of seconds are logged.
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.explain = explain
+        self.slow_query_threshold = slow_query_threshold
+
+        self._templates = {}
+        self._statistics = {}
+        self._query_plans = {}
+
+    def get_template(self, sql):
+        template = self._templates.get(sql)
+        if template is None:
+            if len(self._templates) >= MAX_CACHED_TEMPLATES:
+                self._templates.clear()
+            template = self._templates[sql] = normalize_sql(sql)
+        return template
+
+    def record(self, sql, args, duration, rows=0):
+        """
+        Record an execution of sql that took duration seconds and returned rows rows.
+        """
+        template = self.get_template(sql)
+        statistics = self._statistics.get(template)
+        if statistics is None:
+            statistics = self._statistics[template] = QueryStatistics()
+
+        statistics.count += 1
+        statistics.total_time += duration
+        statistics.max_time = max(statistics.max_time, duration)
+        statistics.rows += rows
+        statistics.timings.append(duration)
+
+        if duration > self.slow_query_threshold:
+            self._logger.warning(u"Slow query took %.3f seconds: %s\n-----\n%s\n-----\nQuery plan:\n%s",
+                                 duration, sql, args, u"\n".join(self.get_query_plan(template, sql, args)))
+
+    def get_query_plan(self, template, sql, args):
+        if template not in self._query_plans:
+            plan = []
+            if self.explain and template.split(u" ", 1)[0].upper() in (u"SELECT", u"INSERT", u"UPDATE", u"DELETE",
+                                                                      u"REPLACE", u"WITH"):
+                try:
+                    plan = self.explain(sql, args)
+                except Exception as e:
+                    plan = [u"Could not explain query: %s" % e]
+            self._query_plans[template] = plan
+        return self._query_plans[template]
+
+    def get_statistics(self):
+        """
+        Returns a list with a dictionary of statistics for every template, the templates with the highest total
+        time first.
+        """
+        result = [{u'template': template,
+                   u'count': statistics.count,
+                   u'total_time': statistics.total_time,
+                   u'mean_time': statistics.total_time / statistics.count,
+                   u'p99_time': statistics.get_percentile(99),
+                   u'max_time': statistics.max_time,
+                   u'rows': statistics.rows}
+                  for template, statistics in self._statistics.items()]
+        result.sort(key=lambda statistics: statistics[u'total_time'], reverse=True)
+        return result
+
+    def reset(self):
+        self._statistics.clear()
+        self._query_plans.clear()
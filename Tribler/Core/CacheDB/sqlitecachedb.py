@@ -2,11 +2,15 @@
 # see LICENSE.txt for license information
 import logging
 import os
+import random
+import time
 from base64 import encodestring, decodestring
+from struct import unpack_from
 from threading import currentThread, RLock
 
 import apsw
 from apsw import CantOpenError, SQLError
+from twisted.internet.task import LoopingCall
 from twisted.python.threadable import isInIOThread
 
 from Tribler.dispersy.taskmanager import TaskManager
@@ -14,6 +18,7 @@ from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_react
 
 from Tribler import LIBRARYNAME
 from Tribler.Core.CacheDB.db_versions import LATEST_DB_VERSION
+from Tribler.Core.CacheDB.sql_profiler import SQLProfiler, DEFAULT_SLOW_QUERY_THRESHOLD
 
 
 DB_SCRIPT_NAME = u"schema_sdb_v%s.sql" % str(LATEST_DB_VERSION)
@@ -26,6 +31,26 @@ DB_FILE_RELATIVE_PATH = os.path.join(DB_DIR_NAME, DB_FILE_NAME)
 
 DEFAULT_BUSY_TIMEOUT = 10000
 
+# getRandom draws random ids at most this many times, at most this many at once
+SAMPLE_ROUNDS = 4
+MAX_SAMPLE_CANDIDATES = 4096
+
+# weights of a keyword matching the swarmname, filenames and fileextensions columns of FullTextIndex in search_rank
+SEARCH_RANK_WEIGHTS = (4, 2, 1)
+MATCHINFO_CACHE_SIZE = 1024
+_matchinfo_cache = {}
+# the y matchinfo, which only counts the hits in the row itself, is much cheaper than x but needs SQLite 3.8.11
+MATCHINFO_Y_SQLITE_VERSION = (3, 8, 11)
+
+# background maintenance, see SQLiteCacheDB.start_maintenance
+MAINTENANCE_INTERVAL = 30
+MAINTENANCE_IDLE_TIME = 10  # seconds without writes before orphans are deleted
+ORPHAN_SCAN_WINDOW = 5000  # torrent ids looked at per maintenance step
+INCREMENTAL_VACUUM_PAGES = 256
+WAL_CHECKPOINT_INTERVAL = 300
+
+AUTO_VACUUM_INCREMENTAL = 2
+
 TRHEADING_DEBUG = False
 
 forceDBThread = call_on_reactor_thread
@@ -44,6 +69,55 @@ def str2bin(str_data):
     return decodestring(str_data)
 
 
+def infohash2db(infohash):
+    """ Infohashes are stored as 20-byte BLOBs since database version 28. """
+    return buffer(infohash)
+
+
+def db2infohash(value):
+    return str(value)
+
+
+def parse_matchinfo(matchinfo):
+    """
+    Returns a tuple with, for every phrase of a FullTextIndex MATCH, a tuple of booleans telling whether it matches
+    the swarmname, filenames and fileextensions of the row.
+    @param matchinfo: the result of matchinfo(FullTextIndex, SQLiteCacheDB.matchinfo_format), see
+    http://www.sqlite.org/fts3.html#matchinfo
+    """
+    return _parse_matchinfo(matchinfo)[0]
+
+
+def search_rank(matchinfo):
+    """
+    Ranks a row of a FullTextIndex MATCH by the columns its keywords match, registered as the search_rank SQL
+    function. Every keyword adds the weight in SEARCH_RANK_WEIGHTS of the best column it matches.
+    @param matchinfo: the result of matchinfo(FullTextIndex, SQLiteCacheDB.matchinfo_format).
+    """
+    return _parse_matchinfo(matchinfo)[1]
+
+
+def _parse_matchinfo(matchinfo):
+    # the rows of a MATCH only have a few distinct matchinfo values, so they are only parsed once
+    matchinfo = str(matchinfo)
+    parsed = _matchinfo_cache.get(matchinfo)
+    if parsed is None:
+        num_phrases, num_cols = unpack_from('II', matchinfo)
+        # x gives 3 values per phrase and column, y only the first of them: the hits in this row
+        stride = (len(matchinfo) / 4 - 2) / (num_phrases * num_cols)
+        hits = unpack_from('I' * (stride * num_cols * num_phrases), matchinfo, 8)
+        columns = tuple(tuple(hits[stride * (col + phrase * num_cols)] > 0 for col in xrange(num_cols))
+                        for phrase in xrange(num_phrases))
+        rank = 0
+        for matches in columns:
+            rank += next((weight for weight, match in zip(SEARCH_RANK_WEIGHTS, matches) if match), 0)
+
+        if len(_matchinfo_cache) >= MATCHINFO_CACHE_SIZE:
+            _matchinfo_cache.clear()
+        parsed = _matchinfo_cache[matchinfo] = (columns, rank)
+    return parsed
+
+
 class SQLiteCacheDB(TaskManager):
 
     def __init__(self, session, busytimeout=DEFAULT_BUSY_TIMEOUT):
@@ -61,15 +135,30 @@ class SQLiteCacheDB(TaskManager):
         self._busytimeout = busytimeout  # busytimeout is in milliseconds
 
         self._version = None
+        self._matchinfo_format = u"pcx"
 
         self._should_commit = False
         self._show_execute = False
+        self._profiler = None
+
+        self._last_write_time = 0
+        self._orphan_scan_position = 0
+        self._orphans_deleted = 0
+        self._pages_vacuumed = 0
+        self._checkpoint_due = False
+        self._last_checkpoint_time = time.time()
+        self._last_checkpoint = None
 
     @property
     def version(self):
         """The version of this database."""
         return self._version
 
+    @property
+    def matchinfo_format(self):
+        """The format string to pass to matchinfo(FullTextIndex), pcy if SQLite supports it, otherwise pcx."""
+        return self._matchinfo_format
+
     @blocking_call_on_reactor_thread
     def initialize(self, db_path=None):
         """ Initializes the database. If the database doesn't exist, we create a new one. Otherwise, we check the
@@ -114,13 +203,22 @@ class SQLiteCacheDB(TaskManager):
         try:
             self._connection = apsw.Connection(db_path)
             self._connection.setbusytimeout(self._busytimeout)
+            self._connection.createscalarfunction(u"search_rank", search_rank, 1)
         except CantOpenError as e:
             msg = u"Failed to open connection to %s: %s" % (db_path, e)
             raise CantOpenError(msg)
 
         cursor = self.get_cursor()
 
+        sqlite_version, = next(cursor.execute(u"SELECT sqlite_version()"))
+        if tuple(int(part) for part in sqlite_version.split(u".")[:3]) >= MATCHINFO_Y_SQLITE_VERSION:
+            self._matchinfo_format = u"pcy"
+
         # apply pragma
+        # free pages are given back in small steps by the background maintenance. New databases use this right
+        # away, existing ones once they are vacuumed.
+        cursor.execute(u"PRAGMA auto_vacuum = INCREMENTAL;")
+
         page_size, = next(cursor.execute(u"PRAGMA page_size"))
         if page_size < 8192:
             # journal_mode and page_size only need to be set once.  because of the VACUUM this
@@ -222,6 +320,9 @@ class SQLiteCacheDB(TaskManager):
                 self._logger.info(u"Start vacuuming...")
                 self.execute(u"VACUUM;")
 
+            if self._checkpoint_due:
+                self._checkpoint_wal()
+
             if not exiting:
                 try:
                     self._logger.info(u"Beginning another transaction...")
@@ -236,16 +337,177 @@ class SQLiteCacheDB(TaskManager):
             self.execute(u"VACUUM;")
 
     def clean_db(self, vacuum=False, exiting=False):
-        self.execute_write(u"DELETE FROM TorrentFiles WHERE torrent_id IN (SELECT torrent_id FROM CollectedTorrent)")
-        self.execute_write(u"DELETE FROM Torrent WHERE name IS NULL"
-                           u" AND torrent_id NOT IN (SELECT torrent_id FROM _ChannelTorrents)")
-
-        if vacuum:
+        """
+        Deletes a batch of orphaned rows and gives back free pages. A full VACUUM is only done if vacuum is set and
+        the database does not use incremental vacuum yet, which it will afterwards. When exiting, the torrents without
+        a name are deleted as well.
+        """
+        self._delete_orphans()
+        if exiting:
+            self._delete_nameless_torrents()
+
+        if vacuum and self._get_pragma(u"auto_vacuum") != AUTO_VACUUM_INCREMENTAL:
+            if not self._connection.getautocommit():
+                # VACUUM cannot run inside the open transaction
+                self._should_commit = True
             self.commit_now(vacuum, exiting=exiting)
+        else:
+            self._incremental_vacuum()
+            if vacuum:
+                self.commit_now(exiting=exiting)
+
+    @blocking_call_on_reactor_thread
+    def start_maintenance(self, interval=MAINTENANCE_INTERVAL):
+        """
+        Starts maintaining the database in the background. Every interval seconds a batch of orphaned rows is deleted
+        if nothing was written for a while, a few free pages are given back to the file system and, every
+        WAL_CHECKPOINT_INTERVAL seconds, the WAL is checkpointed.
+        """
+        self.register_task(u"maintenance", LoopingCall(self._maintain)).start(interval, now=False)
+
+    @blocking_call_on_reactor_thread
+    def get_maintenance_statistics(self):
+        """
+        Returns a dictionary with the page_size, page_count and free_pages of the database, whether it uses
+        incremental_vacuum, the size of its WAL in bytes, the number of orphans_deleted and pages_vacuumed by the
+        maintenance and the result (busy, log, checkpointed) of the last_checkpoint.
+        """
+        wal_path = self.sqlite_db_path + u"-wal"
+        return {u'page_size': self._get_pragma(u"page_size"),
+                u'page_count': self._get_pragma(u"page_count"),
+                u'free_pages': self._get_pragma(u"freelist_count"),
+                u'incremental_vacuum': self._get_pragma(u"auto_vacuum") == AUTO_VACUUM_INCREMENTAL,
+                u'wal_size': os.path.getsize(wal_path) if os.path.isfile(wal_path) else 0,
+                u'orphans_deleted': self._orphans_deleted,
+                u'pages_vacuumed': self._pages_vacuumed,
+                u'last_checkpoint': self._last_checkpoint}
+
+    def _maintain(self):
+        pages_vacuumed, last_checkpoint_time = self._pages_vacuumed, self._last_checkpoint_time
+
+        if time.time() - self._last_write_time >= MAINTENANCE_IDLE_TIME:
+            self._delete_orphans()
+        self._incremental_vacuum()
+
+        if time.time() - self._last_checkpoint_time >= WAL_CHECKPOINT_INTERVAL:
+            if self._connection.getautocommit():
+                self._checkpoint_wal()
+            else:
+                # a checkpoint cannot run inside a transaction, so it is done by the next commit
+                self._checkpoint_due = True
+                self._should_commit = True
+                self.commit_now()
+
+        # only report the maintenance that did something, it runs every MAINTENANCE_INTERVAL seconds
+        if self._pages_vacuumed != pages_vacuumed or self._last_checkpoint_time != last_checkpoint_time:
+            statistics = self.get_maintenance_statistics()
+            self._logger.info(u"Database maintenance: %d free pages out of %d, WAL size %d bytes",
+                              statistics[u'free_pages'], statistics[u'page_count'], statistics[u'wal_size'])
+
+    def _delete_orphans(self, window=ORPHAN_SCAN_WINDOW):
+        """
+        Deletes the files of collected torrents, looking at the next window torrent ids only. The next call continues
+        after them and the scan starts over at the end.
+        @return: The number of rows deleted.
+        """
+        max_torrent_id = self.fetchone(u"SELECT max(torrent_id) FROM Torrent") or 0
+        if self._orphan_scan_position >= max_torrent_id:
+            self._orphan_scan_position = 0
+        first, last = self._orphan_scan_position, self._orphan_scan_position + window
+
+        # these are not counted as activity by execute_write, so the maintenance keeps running while idle
+        self.execute(u"DELETE FROM TorrentFiles WHERE torrent_id IN "
+                     u"(SELECT torrent_id FROM Torrent WHERE torrent_id > ? AND torrent_id <= ? AND is_collected == 1)",
+                     (first, last))
+        self._orphan_scan_position = last
+        return self._count_orphans_deleted()
+
+    def _delete_nameless_torrents(self):
+        """
+        Deletes the torrents without a name that are not in a channel, a download or on a tracker. This is only done
+        on exit, as the TorrentDBHandler caches the ids of the torrents it has seen.
+        @return: The number of rows deleted.
+        """
+        self.execute(u"DELETE FROM Torrent WHERE name IS NULL "
+                     u"AND NOT EXISTS (SELECT 1 FROM _ChannelTorrents WHERE torrent_id = Torrent.torrent_id) "
+                     u"AND NOT EXISTS (SELECT 1 FROM MyPreference WHERE torrent_id = Torrent.torrent_id) "
+                     u"AND NOT EXISTS (SELECT 1 FROM TorrentTrackerMapping WHERE torrent_id = Torrent.torrent_id)")
+        return self._count_orphans_deleted()
+
+    def _count_orphans_deleted(self):
+        deleted = self.fetchone(u"SELECT changes()")
+        if deleted:
+            self._should_commit = True
+            self._orphans_deleted += deleted
+        return deleted
+
+    def _incremental_vacuum(self, pages=INCREMENTAL_VACUUM_PAGES):
+        """
+        Gives at most pages free pages back to the file system, if the database uses incremental vacuum.
+        @return: The number of pages given back.
+        """
+        if self._get_pragma(u"auto_vacuum") != AUTO_VACUUM_INCREMENTAL:
+            return 0
+
+        free_pages = self._get_pragma(u"freelist_count")
+        if not free_pages:
+            return 0
+
+        # the pages are only freed while stepping through the rows of the pragma
+        list(self.execute(u"PRAGMA incremental_vacuum(%d)" % pages))
+        vacuumed = free_pages - self._get_pragma(u"freelist_count")
+        if vacuumed:
+            self._should_commit = True
+            self._pages_vacuumed += vacuumed
+        return vacuumed
+
+    def _checkpoint_wal(self):
+        self._checkpoint_due = False
+        self._last_checkpoint_time = time.time()
+        self._last_checkpoint = self.fetchone(u"PRAGMA wal_checkpoint(PASSIVE)")
+        self._logger.info(u"Checkpointed the WAL: %s", self._last_checkpoint)
+
+    def _get_pragma(self, name):
+        return self.fetchone(u"PRAGMA %s" % name)
 
     def set_show_sql(self, switch):
         self._show_execute = switch
 
+    @blocking_call_on_reactor_thread
+    def set_profiling(self, enabled, slow_query_threshold=DEFAULT_SLOW_QUERY_THRESHOLD):
+        """
+        Enables or disables the SQL profiler. Enabling it again resets the statistics.
+        :param slow_query_threshold: Statements that take longer than this number of seconds are logged with their
+        query plan.
+        """
+        self._profiler = SQLProfiler(self._explain, slow_query_threshold) if enabled else None
+
+    @blocking_call_on_reactor_thread
+    def get_profiling_statistics(self):
+        """
+        Returns the statistics per statement template gathered by the SQL profiler, or None if it is disabled.
+        """
+        return self._profiler.get_statistics() if self._profiler else None
+
+    def _explain(self, sql, args):
+        cur = self._connection.cursor()
+        try:
+            sql = u"EXPLAIN QUERY PLAN " + sql
+            return [row[-1] for row in (cur.execute(sql) if args is None else cur.execute(sql, args))]
+        finally:
+            cur.close()
+
+    def _execute_profiled(self, cur, sql, args):
+        """
+        Executes sql and reads the rows it returns, so that their number and the time it took to fetch them can be
+        recorded. Like a cursor, the result is an iterator over the rows.
+        """
+        start = time.time()
+        result = cur.execute(sql) if args is None else cur.execute(sql, args)
+        rows = list(result) if result is not None else []
+        self._profiler.record(sql, args, time.time() - start, len(rows))
+        return iter(rows)
+
     # --------- generic functions -------------
 
     @blocking_call_on_reactor_thread
@@ -257,7 +519,9 @@ class SQLiteCacheDB(TaskManager):
             self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args)
 
         try:
-            if args is None:
+            if self._profiler:
+                return self._execute_profiled(cur, sql, args)
+            elif args is None:
                 return cur.execute(sql)
             else:
                 return cur.execute(sql, args)
@@ -276,6 +540,7 @@ class SQLiteCacheDB(TaskManager):
     @blocking_call_on_reactor_thread
     def executemany(self, sql, args=None):
         self._should_commit = True
+        self._last_write_time = time.time()
 
         cur = self.get_cursor()
         if self._show_execute:
@@ -283,11 +548,14 @@ class SQLiteCacheDB(TaskManager):
             self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args)
 
         try:
+            start = time.time()
             if args is None:
                 result = cur.executemany(sql)
             else:
                 result = cur.executemany(sql, args)
 
+            if self._profiler:
+                self._profiler.record(sql, None, time.time() - start)
             return result
 
         except Exception as msg:
@@ -301,6 +569,7 @@ class SQLiteCacheDB(TaskManager):
 
     def execute_write(self, sql, args=None):
         self._should_commit = True
+        self._last_write_time = time.time()
 
         self.execute(sql, args)
 
@@ -499,3 +768,73 @@ class SQLiteCacheDB(TaskManager):
         except Exception as msg:
             self._logger.exception(u"Wrong getAll sql statement: %s", sql)
             raise Exception(msg)
+
+    def getRandom(self, table_name, value_name, id_name, id_table, where=None, args=(), limit=1):
+        """
+        Returns up to limit distinct random rows of value_name from table_name that match where, in random order.
+
+        Instead of ORDER BY random(), which reads and sorts every row that matches, random ids between 1 and the
+        largest id in id_table are drawn and the rows with those ids are selected through the primary key of
+        id_table. Ids that do not exist or whose rows do not match are retried, drawing more ids at once the fewer of
+        them match. Only when too few rows match to find them this way, the remaining rows are selected with
+        ORDER BY random().
+        :param id_name: The integer primary key of id_table as named in table_name, e.g. T.torrent_id.
+        """
+        if isinstance(value_name, (tuple, list)):
+            value_name = u",".join(value_name)
+        max_id = self.fetchone(u"SELECT max(%s) FROM %s" % (id_name.split(u".")[-1], id_table))
+        if not max_id or limit <= 0:
+            return []
+
+        sql = u"SELECT %s, %s FROM %s WHERE %s IN (%%s)" % (value_name, id_name, table_name, id_name)
+        if where:
+            sql += u" AND (%s)" % where
+
+        results = {}
+        tried = set()
+        num_candidates = limit * 2
+        for _ in xrange(SAMPLE_ROUNDS):
+            num_candidates = min(num_candidates, max_id - len(tried), MAX_SAMPLE_CANDIDATES)
+            if num_candidates <= 0:
+                break
+
+            candidates = set()
+            while len(candidates) < num_candidates:
+                candidate = random.randint(1, max_id)
+                if candidate not in tried:
+                    candidates.add(candidate)
+            tried.update(candidates)
+
+            # the ids are integers we generated, so they can be put into the statement
+            rows = self.fetchall(sql % u",".join(str(candidate) for candidate in candidates), args)
+            # the rows come back ordered by id, shuffle them so the ones that are kept are not biased to low ids
+            random.shuffle(rows)
+            for row in rows:
+                if len(results) < limit:
+                    results[row[-1]] = row[:-1]
+            if len(results) >= limit:
+                break
+
+            # draw enough ids to find the remaining rows if as many of them match as in this round, and give up
+            # when so few match that it would take many rounds of MAX_SAMPLE_CANDIDATES ids
+            if rows:
+                num_candidates = (limit - len(results)) * len(candidates) * 2 / len(rows)
+            else:
+                num_candidates = len(candidates) * 8
+            if num_candidates > SAMPLE_ROUNDS * MAX_SAMPLE_CANDIDATES:
+                break
+
+        if len(results) < limit:
+            fallback_sql = u"SELECT %s, %s FROM %s" % (value_name, id_name, table_name)
+            conditions = [u"(%s)" % where] if where else []
+            if results:
+                conditions.append(u"%s NOT IN (%s)" % (id_name, u",".join(str(row_id) for row_id in results)))
+            if conditions:
+                fallback_sql += u" WHERE " + u" AND ".join(conditions)
+            fallback_sql += u" ORDER BY random() LIMIT %d" % (limit - len(results))
+            for row in self.fetchall(fallback_sql, args):
+                results[row[-1]] = row[:-1]
+
+        results = results.values()
+        random.shuffle(results)
+        return results
@@ -429,3 +429,16 @@ class DownloadState(Serializable):
             return {}
         else:
             return self.stats['tracker_status']
+
+
+class DownloadStateList(list):
+
+    """
+    The DownloadStates of all Downloads, as passed to a download states callback
+    in incremental mode. Only the states in changed have been created since the
+    previous invocation, the other states are the same objects as passed then.
+    """
+
+    def __init__(self, states=(), changed=()):
+        super(DownloadStateList, self).__init__(states)
+        self.changed = list(changed)
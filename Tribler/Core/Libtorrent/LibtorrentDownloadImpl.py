@@ -21,6 +21,7 @@ from Tribler.Core.osutils import fix_filebasename
 from Tribler.Core.TorrentDef import TorrentDefNoMetainfo, TorrentDef
 from Tribler.Core.CacheDB.Notifier import Notifier
 from Tribler.Core.Libtorrent import checkHandleAndSynchronize, waitForHandleAndSynchronize
+from Tribler.Core.Libtorrent.PieceBitfield import PieceBitfield
 
 if sys.platform == "win32":
     try:
@@ -28,6 +29,9 @@ if sys.platform == "win32":
     except:
         pass
 
+# The maximum age in seconds of the status used for computing piece progress
+PIECES_MAX_AGE = 0.5
+
 
 class VODFile(object):
 
@@ -142,6 +146,14 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
         self.cew_scheduled = False
         self.askmoreinfo = False
 
+        # The latest status received from libtorrent, and the DownloadState of the last incremental
+        # states callback, which is reused until the status of the download changes
+        self.lt_status = None
+        self.lt_status_time = 0
+        self.pieces_bitfield = None
+        self.state_changed = True
+        self.cached_state = None
+
     def get_def(self):
         return self.tdef
 
@@ -253,6 +265,8 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             atp["name"] = self.tdef.get_name_as_unicode()
 
         self.handle = self.ltmgr.add_torrent(self, atp)
+        self.lt_status = None
+        self.state_changed = True
 
         if self.handle:
             self.set_selected_files()
@@ -320,48 +334,54 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             return file_entry.size
         return 0
 
+    def get_pieces_bitfield(self):
+        """
+        Returns the PieceBitfield of the download. It is built from the latest status of the download, which
+        is only fetched again when it is older than PIECES_MAX_AGE seconds.
+        Called with dllock acquired.
+        """
+        now = time.time()
+        if self.lt_status is None or now - self.lt_status_time > PIECES_MAX_AGE:
+            self.lt_status = self.handle.status()
+            self.lt_status_time = now
+            self.pieces_bitfield = None
+
+        if self.pieces_bitfield is None:
+            self.pieces_bitfield = PieceBitfield(self.lt_status.pieces)
+        return self.pieces_bitfield
+
     @checkHandleAndSynchronize(0.0)
     def get_piece_progress(self, pieces, consecutive=False):
-        if not pieces:
-            return 1.0
-        elif consecutive:
-            pieces.sort()
-
-        status = self.handle.status()
-        if status:
-            pieces_have = 0
-            pieces_all = len(pieces)
-            bitfield = status.pieces
-            for pieceindex in pieces:
-                if pieceindex < len(bitfield) and bitfield[pieceindex]:
-                    pieces_have += 1
-                elif consecutive:
-                    break
-            return float(pieces_have) / pieces_all
-        return 0.0
+        ranges = []
+        for pieceindex in sorted(set(pieces)):
+            if ranges and ranges[-1][1] == pieceindex:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([pieceindex, pieceindex + 1])
+        return self.get_pieces_bitfield().get_progress(ranges, consecutive)
 
     @checkHandleAndSynchronize(0.0)
     def get_byte_progress(self, byteranges, consecutive=False):
-        pieces = []
+        torrent_info = self.handle.get_torrent_info()
+        ranges = []
         for fileindex, bytes_begin, bytes_end in byteranges:
             if fileindex >= 0:
                 # Ensure the we remain within the file's boundaries
-                file_entry = self.handle.get_torrent_info().file_at(fileindex)
+                file_entry = torrent_info.file_at(fileindex)
                 bytes_begin = min(
                     file_entry.size, bytes_begin) if bytes_begin >= 0 else file_entry.size + (bytes_begin + 1)
                 bytes_end = min(file_entry.size, bytes_end) if bytes_end >= 0 else file_entry.size + (bytes_end + 1)
 
-                startpiece = self.handle.get_torrent_info().map_file(fileindex, bytes_begin, 0).piece
-                endpiece = self.handle.get_torrent_info().map_file(fileindex, bytes_end, 0).piece + 1
+                startpiece = torrent_info.map_file(fileindex, bytes_begin, 0).piece
+                endpiece = torrent_info.map_file(fileindex, bytes_end, 0).piece + 1
                 startpiece = max(startpiece, 0)
-                endpiece = min(endpiece, self.handle.get_torrent_info().num_pieces())
+                endpiece = min(endpiece, torrent_info.num_pieces())
 
-                pieces += range(startpiece, endpiece)
+                ranges.append((startpiece, endpiece))
             else:
                 self._logger.info("LibtorrentDownloadImpl: could not get progress for incorrect fileindex")
 
-        pieces = list(set(pieces))
-        return self.get_piece_progress(pieces, consecutive)
+        return self.get_pieces_bitfield().get_progress(ranges, consecutive)
 
     @checkHandleAndSynchronize()
     def set_piece_priority(self, pieces_need, priority):
@@ -411,13 +431,18 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             self._logger.debug("LibtorrentDownloadImpl: alert %s with message %s", alert_type, alert)
 
         alert_types = ('tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
-                       'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert')
+                       'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert',
+                       'save_resume_data_alert', 'save_resume_data_failed_alert')
 
         if alert_type in alert_types:
             getattr(self, 'on_' + alert_type)(alert)
         else:
             self.update_lt_stats()
 
+    @checkHandleAndSynchronize()
+    def process_status_update(self, status):
+        self.update_lt_stats(status)
+
     def on_tracker_reply_alert(self, alert):
         self.tracker_status[alert.url] = [alert.num_peers, 'Working']
 
@@ -497,6 +522,15 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             self.checkpoint_after_next_hashcheck = False
             self.checkpoint()
 
+    def on_save_resume_data_alert(self, alert):
+        pstate = self.network_get_persistent_state()
+        pstate.set('state', 'engineresumedata', alert.resume_data)
+        self.session.lm.save_download_pstate(self.tdef.get_infohash(), pstate)
+
+    def on_save_resume_data_failed_alert(self, alert):
+        self._logger.warning("LibtorrentDownloadImpl: could not save resume data for %s: %s",
+                             self.tdef.get_name(), alert.message())
+
     def on_torrent_finished_alert(self, alert):
         self.update_lt_stats()
         if self.get_mode() == DLMODE_VOD:
@@ -517,8 +551,14 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
                 self.set_byte_priority([(self.get_vod_fileindex(), 0, -1)], 1)
                 self.endbuffsize = 0
 
-    def update_lt_stats(self):
-        status = self.handle.status()
+    def update_lt_stats(self, status=None):
+        if status is None:
+            status = self.handle.status()
+        self.lt_status = status
+        self.lt_status_time = time.time()
+        self.pieces_bitfield = None
+        self.state_changed = True
+
         self.dlstate = self.dlstates[status.state] if not status.paused else DLSTATUS_STOPPED
         self.dlstate = DLSTATUS_STOPPED_ON_ERROR if self.dlstate == DLSTATUS_STOPPED and status.error else self.dlstate
         if self.get_mode() == DLMODE_VOD:
@@ -686,7 +726,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
 
     @checkHandleAndSynchronize()
     def network_create_statistics_reponse(self):
-        status = self.handle.status()
+        status = self.lt_status or self.handle.status()
         numTotSeeds = status.num_complete if status.num_complete >= 0 else status.list_seeds
         numTotPeers = status.num_incomplete if status.num_incomplete >= 0 else status.list_peers
         numleech = status.num_peers - status.num_seeds
@@ -840,6 +880,22 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             if not self.done:
                 self.session.uch.perform_getstate_usercallback(usercallback, ds, self.sesscb_get_state_returncallback)
 
+    def network_get_cached_state(self):
+        """
+        Called by network thread. Returns the DownloadState of the previous call if the status of the download has
+        not changed since, otherwise a new one.
+        @return (DownloadState, whether the state is new)
+        """
+        with self.dllock:
+            if self.cached_state is not None and not self.state_changed and self.handle is not None \
+                    and not self.askmoreinfo and self.get_mode() != DLMODE_VOD:
+                return self.cached_state, False
+
+            self.cached_state = self.network_get_state(None, False, sessioncalling=True)
+            # Without a handle there are no status updates to tell us about changes
+            self.state_changed = self.handle is None
+            return self.cached_state, True
+
     def sesscb_get_state_returncallback(self, usercallback, when, newgetpeerlist):
         """ Called by SessionCallbackThread """
         with self.dllock:
@@ -865,9 +921,11 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             pstate = self.network_get_persistent_state()
             if self.handle is not None:
                 self._logger.debug("LibtorrentDownloadImpl: network_stop: engineresumedata from torrent handle")
+                self.state_changed = True
                 if removestate:
                     self.ltmgr.remove_torrent(self, removecontent)
                     self.handle = None
+                    self.lt_status = None
                 else:
                     self.set_vod_mode(False)
                     self.handle.pause()
@@ -958,10 +1016,22 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
 
     def checkpoint(self):
         """ Called by any thread """
+        if self.save_resume_data():
+            return
         (infohash, pstate) = self.network_checkpoint()
         checkpoint = lambda: self.session.lm.save_download_pstate(infohash, pstate)
         self.session.lm.rawserver.add_task(checkpoint, 0)
 
+    def save_resume_data(self):
+        """ Called by any thread. Asks libtorrent to generate the resume data of this download in the background,
+        the pstate is saved once the save_resume_data_alert comes in. Returns False if there is no torrent handle
+        to ask, in which case network_checkpoint should be used instead. """
+        with self.dllock:
+            if self.handle is None or not isinstance(self.tdef, TorrentDef):
+                return False
+            self.handle.save_resume_data()
+            return True
+
     def network_checkpoint(self):
         """ Called by network thread """
         with self.dllock:
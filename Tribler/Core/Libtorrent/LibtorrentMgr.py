@@ -86,8 +86,8 @@ class LibtorrentMgr(object):
             ltsession.add_extension(lt.create_smart_ban_plugin)
 
         ltsession.set_settings(settings)
-        ltsession.set_alert_mask(lt.alert.category_t.stats_notification |
-                                 lt.alert.category_t.error_notification |
+        # The status of the torrents is polled with post_torrent_updates instead of from stats alerts
+        ltsession.set_alert_mask(lt.alert.category_t.error_notification |
                                  lt.alert.category_t.status_notification |
                                  lt.alert.category_t.storage_notification |
                                  lt.alert.category_t.performance_warning |
@@ -262,6 +262,8 @@ class LibtorrentMgr(object):
     def process_alerts(self):
         for ltsession in self.ltsessions.itervalues():
             if ltsession:
+                # Ask for a state_update_alert with the status of the torrents that changed since the last call
+                ltsession.post_torrent_updates()
                 alert = ltsession.pop_alert()
                 while alert:
                     self.process_alert(alert)
@@ -271,6 +273,13 @@ class LibtorrentMgr(object):
 
     def process_alert(self, alert):
         alert_type = str(type(alert)).split("'")[1].split(".")[-1]
+        if alert_type == 'state_update_alert':
+            for status in alert.status:
+                infohash = str(status.handle.info_hash())
+                if infohash in self.torrents:
+                    self.torrents[infohash][0].process_status_update(status)
+            return
+
         if alert_type == 'external_ip_alert':
             external_ip = str(alert).split()[-1]
             if self.external_ip != external_ip:
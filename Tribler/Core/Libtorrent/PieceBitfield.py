@@ -0,0 +1,60 @@
+class PieceBitfield(object):
+
+    """
+    The pieces of a torrent that have been downloaded.
+
+    Keeps one byte per piece, so that the pieces we have in a range can be counted
+    and the first missing piece found by bytearray.count and bytearray.find, which
+    run in C, instead of by looping over piece indices in Python.
+    """
+
+    def __init__(self, pieces=()):
+        """
+        @param pieces: a sequence of booleans, one for every piece, such as torrent_status.pieces.
+        """
+        self.pieces = bytearray(pieces)
+
+    def __len__(self):
+        return len(self.pieces)
+
+    def set_piece(self, index):
+        if index < len(self.pieces):
+            self.pieces[index] = 1
+
+    def has_piece(self, index):
+        return index < len(self.pieces) and self.pieces[index] == 1
+
+    def get_progress(self, ranges, consecutive=False):
+        """
+        Returns the fraction of the pieces in the given ranges that we have. Overlapping
+        ranges are only counted once and pieces beyond the end of the bitfield are missing.
+        @param ranges: a list of (start, end) tuples of piece indices, end is exclusive.
+        @param consecutive: only count the pieces up to the first one that is missing.
+        """
+        merged = []
+        for start, end in sorted(ranges):
+            if start >= end:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        total = sum(end - start for start, end in merged)
+        if not total:
+            return 1.0
+
+        have = 0
+        length = len(self.pieces)
+        for start, end in merged:
+            if consecutive:
+                missing = self.pieces.find('\x00', start, end)
+                if missing >= 0:
+                    have += missing - start
+                    break
+                have += max(min(end, length) - start, 0)
+                if end > length:
+                    break
+            else:
+                have += self.pieces.count('\x01', start, end)
+        return float(have) / total
@@ -7,39 +7,67 @@ import os
 class SimpleCache(object):
     """
     This is a cache for recording the keys that we have seen before.
+
+    Keys are kept in a set and persisted in an append-only file with one JSON-encoded key per line,
+    so saving only writes the keys added since the last save. Files in the old format, a single
+    JSON list, are converted when they are loaded.
     """
     def __init__(self, file_path):
         self._logger = logging.getLogger(self.__class__.__name__)
         self._file_path = file_path
 
-        self._cache_list = list()
-        self._initial_cache_size = 0
+        self._cache_set = set()
+        self._pending_list = list()
 
     def add(self, key):
         if not self.has(key):
-            self._cache_list.append(key)
+            self._cache_set.add(key)
+            self._pending_list.append(key)
 
     def has(self, key):
-        return key in self._cache_list
+        return key in self._cache_set
 
     def load(self):
-        if os.path.exists(self._file_path):
+        self._cache_set = set()
+        self._pending_list = list()
+        if not os.path.exists(self._file_path):
+            return
+
+        try:
+            with codecs.open(self._file_path, 'rb', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            self._logger.error(u"Failed to load cache file %s: %s", self._file_path, repr(e))
+            return
+
+        if content.startswith(u'['):
+            # old format, rewrite it as an append-only file
             try:
-                with codecs.open(self._file_path, 'rb', encoding='utf-8') as f:
-                    self._cache_list = json.load(f)
+                self._cache_set = set(json.loads(content))
             except Exception as e:
                 self._logger.error(u"Failed to load cache file %s: %s", self._file_path, repr(e))
-        else:
-            self._cache_list = list()
-        self._initial_cache_size = len(self._cache_list)
+                return
+            self._save(u'wb', self._cache_set)
+            return
+
+        for line in content.splitlines():
+            try:
+                self._cache_set.add(json.loads(line))
+            except ValueError:
+                # a partially written last line, the key will be added again
+                self._logger.warning(u"Skipping corrupt line in cache file %s", self._file_path)
 
     def save(self):
-        if self._initial_cache_size == len(self._cache_list):
+        if not self._pending_list:
             return
+        if self._save(u'ab', self._pending_list):
+            self._pending_list = list()
+
+    def _save(self, mode, keys):
         try:
-            with codecs.open(self._file_path, 'wb', encoding='utf-8') as f:
-                json.dump(self._cache_list, f)
-                self._initial_cache_size = len(self._cache_list)
+            with codecs.open(self._file_path, mode, encoding='utf-8') as f:
+                f.write(u''.join(json.dumps(key) + u'\n' for key in keys))
         except Exception as e:
             self._logger.error(u"Failed to save cache file %s: %s", self._file_path, repr(e))
-            return
+            return False
+        return True
@@ -0,0 +1,169 @@
+import logging
+import time
+from binascii import hexlify
+from collections import deque
+
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from Tribler.dispersy.taskmanager import TaskManager
+from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
+
+from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.twisted_thread import reactor
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_PUBLISH_RATE = 20  # torrents per second
+DEFAULT_FLUSH_INTERVAL = 1.0
+STATS_INTERVAL = 60
+
+
+class ChannelTorrentInjector(TaskManager):
+    """
+    Pipeline that injects torrent files into a channel.
+
+    Torrent data is parsed and categorized on a pool of worker threads. The parsed torrents are
+    queued and flushed from the reactor thread in batches: the torrent store and the database are
+    updated for the whole batch at once, and the channel torrents are published as a single group
+    of Dispersy messages. A token bucket limits the number of torrents published per second.
+    """
+
+    def __init__(self, session, channel_community, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                 publish_rate=DEFAULT_PUBLISH_RATE):
+        super(ChannelTorrentInjector, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self.session = session
+        self.channel_community = channel_community
+        self.batch_size = batch_size
+        self.publish_rate = publish_rate
+
+        self._threadpool = ThreadPool(minthreads=0, maxthreads=workers, name=u"ChannelTorrentInjector")
+        self._parsed = deque()
+        self._tokens = float(batch_size)
+        self._last_refill = None
+
+        self._start_time = None
+        self._num_received = 0
+        self._num_failed = 0
+        self._num_parsing = 0
+        self._num_published = 0
+
+    @blocking_call_on_reactor_thread
+    def initialize(self):
+        self._threadpool.start()
+        self._start_time = self._last_refill = time.time()
+
+        self.register_task(u"flush", LoopingCall(self._flush)).start(DEFAULT_FLUSH_INTERVAL, now=False)
+        self.register_task(u"log_statistics", LoopingCall(self._log_statistics)).start(STATS_INTERVAL, now=False)
+
+    @blocking_call_on_reactor_thread
+    def shutdown(self):
+        self.cancel_all_pending_tasks()
+        self._threadpool.stop()
+        self._parsed.clear()
+
+        self.channel_community = None
+        self.session = None
+
+    @call_on_reactor_thread
+    def inject(self, torrent_data, callback=None, errback=None):
+        """
+        Queues raw torrent data for injection into the channel.
+        :param torrent_data: The bencoded torrent.
+        :param callback: Called without arguments on the reactor thread once the torrent has been published.
+        :param errback: Called without arguments on the reactor thread if the torrent could not be parsed or
+        published.
+        """
+        self._num_received += 1
+        self._num_parsing += 1
+
+        deferred = deferToThreadPool(reactor, self._threadpool, self._parse, torrent_data)
+        deferred.addCallbacks(self._on_parsed, self._on_parse_failed, callbackArgs=(callback, errback),
+                              errbackArgs=(errback,))
+
+    def _parse(self, torrent_data):
+        """
+        Parses and categorizes a torrent. Runs on a worker thread.
+        """
+        tdef = TorrentDef.load_from_memory(torrent_data)
+        category = self.session.lm.cat.calculateCategory(tdef.metainfo, tdef.get_name_as_unicode())
+        files = tuple(tdef.get_files_as_unicode_with_length())
+        return tdef, category, files, tdef.encode()
+
+    def _on_parsed(self, result, callback, errback):
+        self._num_parsing -= 1
+        if self.session is not None:
+            self._parsed.append(result + (callback, errback))
+
+    def _on_parse_failed(self, failure, errback):
+        self._num_parsing -= 1
+        self._num_failed += 1
+        self._logger.error(u"Failed to parse torrent: %s", failure.getErrorMessage())
+        if errback:
+            errback()
+
+    def _flush(self):
+        now = time.time()
+        self._tokens = min(self.batch_size, self._tokens + (now - self._last_refill) * self.publish_rate)
+        self._last_refill = now
+
+        count = min(len(self._parsed), int(self._tokens))
+        if not count:
+            return
+        self._tokens -= count
+
+        batch = [self._parsed.popleft() for _ in xrange(count)]
+        # an exception would stop the LoopingCall, and with it the injection
+        try:
+            self._publish(batch, now)
+        except Exception:
+            self._num_failed += count
+            self._logger.exception(u"Failed to publish %d channel torrents", count)
+            for _, _, _, _, _, errback in batch:
+                if errback:
+                    errback()
+
+    def _publish(self, batch, now):
+        torrent_store = self.session.lm.torrent_store
+        rtorrent_handler = self.session.lm.rtorrent_handler
+
+        for tdef, _, _, bdata, _, _ in batch:
+            infohash_str = hexlify(tdef.get_infohash())
+            if infohash_str not in torrent_store:
+                torrent_store[infohash_str] = bdata
+
+        self.session.lm.torrent_db.addExternalTorrents(
+            [(tdef, {u"is_collected": 1, u"status": u"good", u"category": category})
+             for tdef, category, _, _, _, _ in batch])
+
+        timestamp = long(now)
+        self.channel_community._disp_create_torrents(
+            [(tdef.get_infohash(), timestamp, tdef.get_name_as_unicode(), files, tdef.get_trackers_as_single_tuple())
+             for tdef, _, files, _, _, _ in batch])
+        self._num_published += len(batch)
+
+        for tdef, _, _, _, callback, _ in batch:
+            rtorrent_handler.notify_possible_torrent_infohash(tdef.get_infohash())
+            if callback:
+                callback()
+
+        self._logger.info(u"Published %d channel torrents, %d queued", len(batch), len(self._parsed))
+
+    def get_statistics(self):
+        """
+        Returns the throughput statistics of this injector.
+        """
+        elapsed = time.time() - self._start_time if self._start_time else 0
+        return {u'received': self._num_received,
+                u'parsing': self._num_parsing,
+                u'queued': len(self._parsed),
+                u'failed': self._num_failed,
+                u'published': self._num_published,
+                u'torrents_per_second': self._num_published / elapsed if elapsed else 0.0}
+
+    def _log_statistics(self):
+        self._logger.info(u"Injector statistics: %s", self.get_statistics())
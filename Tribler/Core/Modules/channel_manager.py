@@ -86,6 +86,14 @@ class ChannelManager(TaskManager):
         rss_parser.initialize()
         self._rss_parser_list.append(rss_parser)
 
+    @blocking_call_on_reactor_thread
+    def get_rss_statistics(self):
+        """
+        Returns the injection throughput statistics of every attached RSS feed.
+        :return: A dictionary mapping RSS URLs to statistics dictionaries.
+        """
+        return dict((rss_parser.rss_url, rss_parser.get_statistics()) for rss_parser in self._rss_parser_list)
+
     @call_on_reactor_thread
     def _on_my_channel_created(self, subject, change_type, object_id, channel_data):
         """
@@ -4,19 +4,21 @@ import logging
 import tempfile
 import os
 import re
-import time
 
+from twisted.internet.defer import DeferredSemaphore
+from twisted.internet.threads import deferToThread
 from twisted.web.client import getPage
 
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
-from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Modules.cache import SimpleCache
+from Tribler.Core.Modules.channel_injector import ChannelTorrentInjector
 from Tribler.Core.Utilities.twisted_thread import reactor
 
 
 DEFAULT_CHECK_INTERVAL = 1800  # half an hour
+MAX_CONCURRENT_FETCHES = 5
 
 
 class ChannelRssParser(TaskManager):
@@ -32,6 +34,14 @@ class ChannelRssParser(TaskManager):
 
         self._tmp_dir = None
         self._url_cache = None
+        self._injector = None
+
+        # validators of the last fetched feed, used for conditional requests
+        self._etag = None
+        self._modified = None
+
+        self._fetch_semaphore = DeferredSemaphore(MAX_CONCURRENT_FETCHES)
+        self._pending_urls = set()
 
         self._to_stop = False
 
@@ -46,6 +56,9 @@ class ChannelRssParser(TaskManager):
         # create temporary directory
         self._tmp_dir = tempfile.mkdtemp()
 
+        self._injector = ChannelTorrentInjector(self.session, self.channel_community)
+        self._injector.initialize()
+
         # schedule the scraping task
         self.register_task(u"rss_scrape",
                            reactor.callLater(2, self._task_scrape))
@@ -55,6 +68,9 @@ class ChannelRssParser(TaskManager):
         self._to_stop = True
         self.cancel_all_pending_tasks()
 
+        self._injector.shutdown()
+        self._injector = None
+
         self._tmp_dir = None
         self._url_cache.save()
         self._url_cache = None
@@ -65,34 +81,78 @@ class ChannelRssParser(TaskManager):
     def _task_scrape(self):
         rss_parser = RSSFeedParser()
 
-        for rss_item in rss_parser.parse(self.rss_url, self._url_cache):
-            if self._to_stop:
-                return
-            torrent_deferred = getPage(rss_item[u'torrent_url'].encode('utf-8'))
-            torrent_deferred.addCallback(lambda t, r=rss_item: self.on_got_torrent(t, rss_item=r))
+        # fetching and parsing the feed blocks, so it is done on a worker thread
+        feed_deferred = deferToThread(rss_parser.fetch, self.rss_url, self._etag, self._modified)
+        feed_deferred.addCallback(self._on_got_feed, rss_parser)
+        feed_deferred.addErrback(lambda failure: self._logger.error(u"Failed to fetch %s: %s", self.rss_url,
+                                                                    failure.getErrorMessage()))
+        feed_deferred.addCallback(self._schedule_scrape)
 
+    def _schedule_scrape(self, _=None):
         if not self._to_stop:
             # schedule the next scraping task
             self._logger.info(u"Finish scraping %s, schedule task after %s", self.rss_url, self.check_interval)
             self.register_task(u'rss_scrape',
                                reactor.callLater(self.check_interval, self._task_scrape))
 
+    def _on_got_feed(self, feed, rss_parser):
+        if self._to_stop:
+            return
+
+        if feed.get(u'status') == 304:
+            self._logger.info(u"RSS feed %s has not been modified", self.rss_url)
+            return
+
+        self._etag = feed.get(u'etag')
+        self._modified = feed.get(u'modified')
+
+        for rss_item in rss_parser.parse(feed, self._url_cache):
+            torrent_url = rss_item[u'torrent_url']
+            if torrent_url in self._pending_urls:
+                continue
+            self._pending_urls.add(torrent_url)
+
+            torrent_deferred = self._fetch_semaphore.run(getPage, torrent_url.encode('utf-8'))
+            torrent_deferred.addCallbacks(self.on_got_torrent, self.on_torrent_failed,
+                                          callbackKeywords={'rss_item': rss_item}, errbackArgs=(torrent_url,))
+
     def on_got_torrent(self, torrent_data, rss_item=None):
         if self._to_stop:
             return
 
-        # save torrent
-        tdef = TorrentDef.load_from_memory(torrent_data)
-        self.session.lm.rtorrent_handler.save_torrent(tdef)
+        # parsing, saving and creating the channel torrent is done by the injector
+        torrent_url = rss_item[u'torrent_url']
+        self._injector.inject(torrent_data, callback=lambda: self.on_torrent_injected(torrent_url),
+                              errback=lambda: self.on_torrent_not_injected(torrent_url))
+
+    def on_torrent_failed(self, failure, torrent_url):
+        if self._to_stop:
+            return
 
-        # create channel torrent
-        self.channel_community._disp_create_torrent_from_torrentdef(tdef, long(time.time()))
+        self._pending_urls.discard(torrent_url)
+        self._forget_validators()
+        self._logger.error(u"Failed to fetch torrent %s: %s", torrent_url, failure.getErrorMessage())
 
-        # update URL cache
-        self._url_cache.add(rss_item[u'torrent_url'])
+    def on_torrent_injected(self, torrent_url):
+        if self._to_stop:
+            return
+
+        # update URL cache, this only appends the new URL to the cache file
+        self._pending_urls.discard(torrent_url)
+        self._url_cache.add(torrent_url)
         self._url_cache.save()
 
-        self._logger.info(u"Channel torrent %s created", tdef.get_name_as_unicode())
+    def on_torrent_not_injected(self, torrent_url):
+        self._pending_urls.discard(torrent_url)
+        self._forget_validators()
+
+    def _forget_validators(self):
+        # the next scrape gets the whole feed again instead of a 304, so the torrents that failed are retried
+        self._etag = None
+        self._modified = None
+
+    def get_statistics(self):
+        return self._injector.get_statistics()
 
 
 class RSSFeedParser(object):
@@ -140,11 +200,16 @@ class RSSFeedParser(object):
 
         return parsed_html_content
 
-    def parse(self, url, cache):
-        """Parses a RSS feed. This methods supports RSS 2.0 and Media RSS.
+    def fetch(self, url, etag=None, modified=None):
+        """Downloads and parses a RSS feed. The etag and modified validators of a previous fetch make this a
+        conditional request, the returned feed has status 304 and no entries if it has not been modified.
+        This method blocks, it should not be called on the reactor thread.
         """
-        feed = feedparser.parse(url)
+        return feedparser.parse(url, etag=etag, modified=modified)
 
+    def parse(self, feed, cache):
+        """Parses a fetched RSS feed. This methods supports RSS 2.0 and Media RSS.
+        """
         for item in feed.entries:
             # ignore the ones that we have seen before
             link = item.get(u'link', None)
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from threading import Condition, Thread, currentThread
+
+from twisted.python.threadable import isInIOThread
+
+
+class StartupProfiler(object):
+    """
+    Records how long every step of the Session startup takes.
+
+    For every step the wall time and the CPU time of the process are recorded. Steps that run concurrently are all
+    charged the CPU time used by the process while they ran.
+    """
+
+    def __init__(self):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.start_time = time.time()
+        self.steps = []
+
+    @staticmethod
+    def get_cpu_time():
+        user_time, system_time = os.times()[:2]
+        return user_time + system_time
+
+    @contextmanager
+    def measure(self, name, deferred=False):
+        """
+        Measure the code run in the with block as startup step name.
+        :param deferred: whether the step runs after the core has been started.
+        """
+        start_wall = time.time()
+        start_cpu = self.get_cpu_time()
+        try:
+            yield
+        finally:
+            wall_time = time.time() - start_wall
+            step = {u'name': name,
+                    u'start': start_wall - self.start_time,
+                    u'wall_time': wall_time,
+                    u'cpu_time': self.get_cpu_time() - start_cpu,
+                    u'thread': currentThread().getName(),
+                    u'deferred': deferred}
+            self.steps.append(step)
+            self._logger.debug(u"Startup step %s took %.3f seconds", name, wall_time)
+
+    def get_report(self):
+        """
+        Returns the recorded steps, sorted by the time they started, and the total startup time.
+        """
+        steps = sorted(self.steps, key=lambda step: step[u'start'])
+        end_time = max(step[u'start'] + step[u'wall_time'] for step in steps) if steps else 0.0
+        core_steps = [step for step in steps if not step[u'deferred']]
+        core_time = max(step[u'start'] + step[u'wall_time'] for step in core_steps) if core_steps else 0.0
+        return {u'core_time': core_time, u'total_time': end_time, u'steps': steps}
+
+    def write_report(self, filename):
+        try:
+            with open(filename, 'wb') as fp:
+                json.dump(self.get_report(), fp, indent=2)
+        except (IOError, OSError) as e:
+            self._logger.error(u"Failed to write startup report %s: %s", filename, repr(e))
+
+
+class ComponentInitializer(object):
+    """
+    Initializes components in the order of their dependencies.
+
+    Components whose dependencies have all been initialized are initialized as soon as possible. Components that
+    are added as thread safe are initialized concurrently, each on its own thread, the others one after the other
+    on the calling thread. Components that are not critical are only initialized when run_deferred is called, once
+    the core is usable.
+    When called from the reactor thread everything runs on that thread, in the order the components were added,
+    since components may have to call into the reactor.
+    """
+
+    def __init__(self, profiler):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.profiler = profiler
+
+        self._components = []
+        self._deferred = []
+
+    def add(self, name, func, depends=(), critical=True, thread_safe=False):
+        """
+        Add a component.
+        :param name: The name of the component, which other components can depend on.
+        :param func: Called without arguments to initialize the component.
+        :param depends: The names of the components that have to be initialized first. Names of components that are
+        not added, e.g. because they are disabled, are ignored.
+        :param critical: Whether the component is needed for the core to be usable.
+        :param thread_safe: Whether func can run on its own thread, concurrently with the other components. It must
+        not touch state shared with other components and only call into the reactor in a thread safe way.
+        """
+        if critical:
+            self._components.append((name, func, tuple(depends), thread_safe))
+        else:
+            self._deferred.append((name, func))
+
+    def run(self):
+        """
+        Initialize all critical components, re-raising the first exception that occurred once the components that
+        were already being initialized have finished.
+        """
+        components, self._components = self._components, []
+        if isInIOThread():
+            for name, func, _, _ in components:
+                with self.profiler.measure(name):
+                    func()
+            return
+
+        names = set(component[0] for component in components)
+        waiting = [(name, func, [dep for dep in depends if dep in names], thread_safe)
+                   for name, func, depends, thread_safe in components]
+        done = set()
+        running = set()
+        errors = []
+        condition = Condition()
+
+        def run_component(name, func):
+            try:
+                with self.profiler.measure(name):
+                    func()
+            except Exception as e:
+                self._logger.exception(u"Failed to initialize %s", name)
+                with condition:
+                    errors.append(e)
+            finally:
+                with condition:
+                    running.discard(name)
+                    done.add(name)
+                    condition.notify()
+
+        while True:
+            with condition:
+                # start the thread safe components that are ready and pick one of the others to run on this thread
+                while True:
+                    ready = [] if errors else [component for component in waiting if set(component[2]) <= done]
+                    for component in ready:
+                        if component[3]:
+                            waiting.remove(component)
+                            running.add(component[0])
+                            thread = Thread(target=run_component, args=component[:2],
+                                            name=u"Initialize-" + component[0])
+                            thread.setDaemon(True)
+                            thread.start()
+
+                    serial = next((component for component in ready if not component[3]), None)
+                    if serial is not None:
+                        waiting.remove(serial)
+                        running.add(serial[0])
+                        break
+                    if not running:
+                        break
+                    condition.wait()
+
+            if serial is not None:
+                run_component(*serial[:2])
+            elif waiting and not errors:
+                raise ValueError(u"Circular dependencies between %s" % [component[0] for component in waiting])
+            else:
+                break
+
+        if errors:
+            raise errors[0]
+
+    def run_deferred(self):
+        """
+        Initialize the components that are not critical, one after the other on the calling thread.
+        """
+        deferred, self._deferred = self._deferred, []
+        for name, func in deferred:
+            try:
+                with self.profiler.measure(name, deferred=True):
+                    func()
+            except Exception:
+                self._logger.exception(u"Failed to initialize %s", name)
+
+    def has_deferred(self):
+        return bool(self._deferred)
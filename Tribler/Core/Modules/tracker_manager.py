@@ -65,8 +65,8 @@ class TrackerManager(object):
                         u'failures': 0,
                         u'is_alive': True}
 
-        # insert into database
-        sql_stmt = u"""INSERT INTO TrackerInfo(tracker, last_check, failures, is_alive) VALUES(?,?,?,?);
+        # insert into database, the torrent database may have added the tracker already
+        sql_stmt = u"""INSERT OR IGNORE INTO TrackerInfo(tracker, last_check, failures, is_alive) VALUES(?,?,?,?);
                        SELECT tracker_id FROM TrackerInfo WHERE tracker = ?;
                     """
         value_tuple = (sanitized_tracker_url, tracker_info[u'last_check'], tracker_info[u'failures'],
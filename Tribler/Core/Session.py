@@ -10,6 +10,7 @@ from binascii import hexlify
 from Tribler.Core import NoDispersyRLock
 from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany
 from Tribler.Core.APIImplementation.UserCallbackHandler import UserCallbackHandler
+from Tribler.Core.CacheDB.sql_profiler import DEFAULT_SLOW_QUERY_THRESHOLD
 from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB
 from Tribler.Core.SessionConfig import SessionConfigInterface, SessionStartupConfig
 from Tribler.Core.Upgrade.upgrade import TriblerUpgrader
@@ -278,7 +279,7 @@ class Session(SessionConfigInterface):
         self.lm.remove_id(infohash)
         self.uch.perform_removestate_callback(infohash, [])
 
-    def set_download_states_callback(self, usercallback, getpeerlist=None):
+    def set_download_states_callback(self, usercallback, getpeerlist=None, incremental=False):
         """
         See Download.set_state_callback. Calls usercallback with a list of
         DownloadStates, one for each Download in the Session as first argument.
@@ -290,9 +291,14 @@ class Session(SessionConfigInterface):
         The callback will be called by a popup thread which can be used
         indefinitely (within reason) by the higher level code.
 
+        In incremental mode only the DownloadStates of Downloads whose status
+        changed are created anew, the list passed is a DownloadStateList whose
+        changed attribute holds those states.
+
         @param usercallback A function adhering to the above spec.
+        @param incremental Whether to reuse the DownloadStates of unchanged Downloads.
         """
-        self.lm.set_download_states_callback(usercallback, getpeerlist or [])
+        self.lm.set_download_states_callback(usercallback, getpeerlist or [], incremental=incremental)
 
     #
     # Config parameters that only exist at runtime
@@ -591,13 +597,18 @@ class Session(SessionConfigInterface):
         """
         return hexlify(infohash) in self.lm.torrent_store
 
-    def get_collected_torrent(self, infohash):
+    def get_collected_torrent(self, infohash, with_trackers=False):
         """
         Gets the given torrent from the torrent_store database.
         :param infohash: The given infohash binary.
+        :param with_trackers: Whether to add the trackers the database knows for the torrent, for torrents that are
+        downloaded or exported.
         :return: The torrent data if exists, None otherwise.
         """
-        return self.lm.torrent_store.get(hexlify(infohash))
+        torrent_data = self.lm.torrent_store.get(hexlify(infohash))
+        if torrent_data is not None and with_trackers and self.lm.torrent_db is not None:
+            torrent_data = self.lm.torrent_db.addTrackersToTorrent(infohash, torrent_data)
+        return torrent_data
 
     def save_collected_torrent(self, infohash, data):
         """
@@ -607,6 +618,14 @@ class Session(SessionConfigInterface):
         """
         self.lm.torrent_store.put(hexlify(infohash), data)
 
+    def delete_collected_torrents(self, infohashes):
+        """
+        Deletes the given torrents from the torrent_store database in a single write batch.
+        :param infohashes: The given infohash binaries.
+        """
+        if self.lm.torrent_store is not None:
+            self.lm.torrent_store.delete_many([hexlify(infohash) for infohash in infohashes])
+
     def search_remote_torrents(self, keywords):
         """
         Searches for remote torrents through SearchCommunity with the given keywords.
@@ -639,10 +658,11 @@ class Session(SessionConfigInterface):
 
     def check_torrent_health(self, infohash):
         """
-        Checks the given torrent's health on its trackers.
+        Checks the given torrent's health on its trackers. The torrent checker is only started a few seconds after
+        the Session, until then the requests are queued.
         :param infohash: The given torrent infohash.
         """
-        self.lm.torrent_checker.add_gui_request(infohash)
+        self.lm.check_torrent_health(infohash)
 
     def set_max_upload_speed(self, rate):
         """
@@ -661,3 +681,30 @@ class Session(SessionConfigInterface):
         if not self.lm.ltmgr:
             raise OperationNotEnabledByConfigurationException("libtorrent is not enabled")
         self.lm.ltmgr.set_download_rate_limit(rate)
+
+    def set_sql_profiling(self, enabled, slow_query_threshold=DEFAULT_SLOW_QUERY_THRESHOLD):
+        """
+        Enables or disables profiling the SQL statements executed on the Tribler database.
+        :param enabled: Whether to profile. Enabling the profiler again resets its statistics.
+        :param slow_query_threshold: Statements that take longer than this number of seconds are logged together
+        with their query plan.
+        """
+        self.sqlite_db.set_profiling(enabled, slow_query_threshold)
+
+    def get_sql_statistics(self):
+        """
+        Gets the statistics gathered by the SQL profiler.
+        :return: A list with a dictionary for every statement template, containing the template, its count, total,
+        mean, p99 and max time in seconds and the number of rows it returned. The templates with the highest
+        total time come first. None if the profiler is not enabled.
+        """
+        return self.sqlite_db.get_profiling_statistics()
+
+    def get_db_maintenance_statistics(self):
+        """
+        Gets the effect of the background maintenance of the Tribler database.
+        :return: A dictionary with the page_size, page_count and free_pages of the database, whether it uses
+        incremental_vacuum, the wal_size in bytes, the number of orphans_deleted and pages_vacuumed so far and the
+        result (busy, log, checkpointed) of the last_checkpoint of the WAL.
+        """
+        return self.sqlite_db.get_maintenance_statistics()
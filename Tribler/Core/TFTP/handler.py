@@ -5,7 +5,7 @@ from struct import unpack
 from random import randint
 from tempfile import mkstemp
 from tarfile import TarFile
-from binascii import hexlify
+from binascii import hexlify, unhexlify
 from time import time
 from hashlib import sha1
 from base64 import b64encode
@@ -398,6 +398,8 @@ class TftpHandler(TaskManager):
             msg = u"Torrent not in store: %s" % infohash
             raise FileNotFound(msg)
 
+        if self.session.lm.torrent_db is not None:
+            file_data = self.session.lm.torrent_db.addTrackersToTorrent(unhexlify(infohash), file_data)
         return file_data, len(file_data)
 
     def _get_next_data(self, session):
@@ -36,6 +36,12 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
     cf. libtorrent torrent_info
     """
 
+    # Decoded list of (filename, length) tuples, cleared whenever metainfo_valid is set
+    _unicode_files = None
+
+    # Whether only the fields needed for indexing were loaded, see load_from_memory()
+    header_only = False
+
     def __init__(self, input=None, metainfo=None, infohash=None):
         """ Normal constructor for TorrentDef (The input, metainfo and infohash
         parameters are used internally to make this a copy constructor) """
@@ -87,13 +93,16 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
         return TorrentDef._read(f)
 
     @staticmethod
-    def load_from_memory(data):
+    def load_from_memory(data, header_only=False):
         """ Loads a torrent file that is already in memory.
         :param data: The torrent file data.
+        :param header_only: Only keep the fields needed for indexing the torrent, i.e. drop the
+        pieces and do not prepare the TorrentDef for re-finalizing. Such a TorrentDef is read-only
+        and cannot be encoded.
         :return: A TorrentDef object.
         """
         data = bdecode(data)
-        return TorrentDef._create(data)
+        return TorrentDef._create(data, header_only=header_only)
 
     def _read(stream):
         """ Internal class method that reads a torrent file from stream,
@@ -105,7 +114,7 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
         return TorrentDef._create(data)
     _read = staticmethod(_read)
 
-    def _create(metainfo):  # TODO: replace with constructor
+    def _create(metainfo, header_only=False):  # TODO: replace with constructor
         # raises ValueErrors if not good
         validTorrentFile(metainfo)
 
@@ -113,12 +122,17 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
         t.metainfo = metainfo
         t.metainfo_valid = True
         # copy stuff into self.input
-        maketorrent.copy_metainfo_to_input(t.metainfo, t.input)
+        maketorrent.copy_metainfo_to_input(t.metainfo, t.input, copy_files=not header_only)
 
         # Two places where infohash calculated, here and in maketorrent.py
         # Elsewhere: must use TorrentDef.get_infohash() to allow P2PURLs.
         t.infohash = sha1(bencode(metainfo['info'])).digest()
 
+        if header_only:
+            # the pieces are only needed to download the torrent
+            metainfo['info'] = dict((key, value) for key, value in metainfo['info'].iteritems() if key != 'pieces')
+            t.header_only = t.readonly = True
+
         assert isinstance(t.infohash, str), "INFOHASH has invalid type: %s" % type(t.infohash)
         assert len(t.infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(t.infohash)
 
@@ -458,10 +472,16 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
     def get_nr_pieces(self):
         """ Returns the number of pieces.
         @return A number of pieces. """
+        if self.header_only:
+            raise OperationNotPossibleAtRuntimeException()
+
         return len(self.metainfo['info']['pieces']) / 20
 
     def get_pieces(self):
         """ Returns the pieces"""
+        if self.header_only:
+            raise OperationNotPossibleAtRuntimeException()
+
         return self.metainfo['info']['pieces'][:]
 
     def set_initial_peers(self, value):
@@ -523,6 +543,17 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
         @return Boolean. """
         return self.metainfo_valid
 
+    @property
+    def metainfo_valid(self):
+        return self._metainfo_valid
+
+    @metainfo_valid.setter
+    def metainfo_valid(self, value):
+        # every change of the metainfo goes together with setting this flag, so it is also the
+        # place where the values derived from the metainfo are invalidated
+        self._metainfo_valid = value
+        self._unicode_files = None
+
     #
     # Operations on finalized TorrentDefs
     #
@@ -644,6 +675,9 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
         return len(self.encode())
 
     def encode(self):
+        if self.header_only:
+            raise OperationNotPossibleAtRuntimeException()
+
         if not self.readonly:
             self.finalize()
 
@@ -759,14 +793,17 @@ class TorrentDef(ContentDefinition, Serializable, Copyable):
         if not self.metainfo_valid:
             raise NotYetImplementedException()  # must save first
 
-        videofiles = []
-        for filename, length in self._get_all_files_as_unicode_with_length():
-            prefix, ext = os.path.splitext(filename)
-            if ext != "" and ext[0] == ".":
-                ext = ext[1:]
-            if exts is None or ext.lower() in exts:
-                videofiles.append((filename, length))
-        return videofiles
+        if self._unicode_files is None:
+            # decoding the filenames may try several encodings per file, so do it once
+            unicode_files = []
+            for filename, length in self._get_all_files_as_unicode_with_length():
+                prefix, ext = os.path.splitext(filename)
+                if ext != "" and ext[0] == ".":
+                    ext = ext[1:]
+                unicode_files.append((filename, length, ext.lower()))
+            self._unicode_files = unicode_files
+
+        return [(filename, length) for filename, length, ext in self._unicode_files if exts is None or ext in exts]
 
     def get_files_as_unicode(self, exts=None):
         return [filename for filename, _ in self.get_files_as_unicode_with_length(exts)]
@@ -16,7 +16,7 @@ from sqlite3 import Connection
 from Tribler.Category.Category import Category
 from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
 from Tribler.Core.CacheDB.db_versions import LOWEST_SUPPORTED_DB_VERSION, LATEST_DB_VERSION
-from Tribler.Core.CacheDB.sqlitecachedb import str2bin
+from Tribler.Core.CacheDB.sqlitecachedb import str2bin, infohash2db
 from Tribler.Core.TorrentDef import TorrentDef
 
 
@@ -77,6 +77,22 @@ class DBUpgrader(object):
         if self.db.version == 26:
             self._upgrade_26_to_27()
 
+        # version 27 -> 28
+        if self.db.version == 27:
+            self._upgrade_27_to_28()
+
+        # version 28 -> 29
+        if self.db.version == 28:
+            self._upgrade_28_to_29()
+
+        # version 29 -> 30
+        if self.db.version == 29:
+            self._upgrade_29_to_30()
+
+        # version 30 -> 31
+        if self.db.version == 30:
+            self._upgrade_30_to_31()
+
         # check if we managed to upgrade to the latest DB version.
         if self.db.version == LATEST_DB_VERSION:
             self.status_update_func(u"Database upgrade finished.")
@@ -469,6 +485,189 @@ DROP TABLE TorrentStatus;
         # update database version
         self.db.write_version(27)
 
+    def _upgrade_27_to_28(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (27, 28))
+
+        # store the infohashes in the Torrent and MetadataMessage tables as BLOBs instead of base64 encoded text
+        self.status_update_func(u"Updating Torrent table...")
+        self.db.execute(u"""
+DROP INDEX IF EXISTS infohash_idx;
+DROP VIEW IF EXISTS CollectedTorrent;
+
+CREATE TABLE _tmp_Torrent (
+  torrent_id       integer PRIMARY KEY AUTOINCREMENT NOT NULL,
+  infohash		   blob NOT NULL,
+  name             text,
+  length           integer,
+  creation_date    integer,
+  num_files        integer,
+  insert_time      numeric,
+  secret           integer,
+  relevance        numeric DEFAULT 0,
+  category         text,
+  status           text DEFAULT 'unknown',
+  num_seeders      integer,
+  num_leechers     integer,
+  comment          text,
+  dispersy_id      integer,
+  is_collected     integer DEFAULT 0,
+  last_tracker_check    integer DEFAULT 0,
+  tracker_check_retries integer DEFAULT 0,
+  next_tracker_check    integer DEFAULT 0
+);
+
+INSERT INTO _tmp_Torrent SELECT
+  torrent_id, infohash, name, length, creation_date, num_files, insert_time, secret, relevance, category, status,
+  num_seeders, num_leechers, comment, dispersy_id, is_collected, last_tracker_check, tracker_check_retries,
+  next_tracker_check
+FROM Torrent;
+
+DROP TABLE Torrent;
+ALTER TABLE _tmp_Torrent RENAME TO Torrent;
+
+CREATE VIEW CollectedTorrent AS SELECT * FROM Torrent WHERE is_collected == 1;
+""")
+        self._convert_infohashes(u"Torrent", u"torrent_id")
+        self.db.execute(u"CREATE UNIQUE INDEX infohash_idx ON Torrent (infohash);")
+
+        self.status_update_func(u"Updating MetadataMessage table...")
+        self._convert_infohashes(u"MetadataMessage", u"message_id")
+
+        # update database version
+        self.db.write_version(28)
+
+    def _upgrade_28_to_29(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (28, 29))
+
+        # add the indexed eviction weights of collected torrents, which are kept up to date by triggers
+        self.status_update_func(u"Updating Torrent table...")
+        self.db.execute(u"""
+ALTER TABLE Torrent ADD COLUMN eviction_weight numeric;
+ALTER TABLE Torrent ADD COLUMN eviction_date_weight numeric;
+
+UPDATE Torrent SET
+  eviction_weight = CASE WHEN creation_date IS NOT NULL THEN
+    min(relevance, 2500) + min(500, num_leechers) + 4 * min(500, num_seeders) END,
+  eviction_date_weight = min(relevance, 2500) + min(500, num_leechers) + 4 * min(500, num_seeders)
+                         + creation_date / 86400.0;
+
+CREATE INDEX eviction_weight_idx ON Torrent (eviction_weight) WHERE is_collected == 1;
+CREATE INDEX eviction_date_weight_idx ON Torrent (eviction_date_weight) WHERE is_collected == 1;
+CREATE INDEX eviction_creation_date_idx ON Torrent (creation_date) WHERE is_collected == 1;
+
+CREATE TRIGGER eviction_weight_insert AFTER INSERT ON Torrent
+BEGIN
+  UPDATE Torrent SET
+    eviction_weight = CASE WHEN NEW.creation_date IS NOT NULL THEN
+      min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders) END,
+    eviction_date_weight = min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders)
+                           + NEW.creation_date / 86400.0
+  WHERE torrent_id = NEW.torrent_id;
+END;
+
+CREATE TRIGGER eviction_weight_update AFTER UPDATE OF relevance, num_leechers, num_seeders, creation_date ON Torrent
+BEGIN
+  UPDATE Torrent SET
+    eviction_weight = CASE WHEN NEW.creation_date IS NOT NULL THEN
+      min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders) END,
+    eviction_date_weight = min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders)
+                           + NEW.creation_date / 86400.0
+  WHERE torrent_id = NEW.torrent_id;
+END;
+""")
+
+        # update database version
+        self.db.write_version(29)
+
+    def _upgrade_29_to_30(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (29, 30))
+
+        # count the votes of every channel once, triggers keep the counts up to date from now on
+        self.status_update_func(u"Updating Channels table...")
+        self.db.execute(u"""
+UPDATE _Channels SET
+  nr_favorite = (SELECT count(*) FROM ChannelVotes WHERE channel_id = _Channels.id AND vote == 2),
+  nr_spam = (SELECT count(*) FROM ChannelVotes WHERE channel_id = _Channels.id AND vote == -1);
+
+CREATE INDEX IF NOT EXISTS ChannelVotesCountIndex ON _Channels(nr_favorite, nr_spam);
+
+CREATE TRIGGER channel_votes_insert AFTER INSERT ON _ChannelVotes WHEN NEW.deleted_at IS NULL
+BEGIN
+  UPDATE _Channels SET nr_favorite = nr_favorite + (NEW.vote == 2), nr_spam = nr_spam + (NEW.vote == -1)
+  WHERE id = NEW.channel_id;
+END;
+
+CREATE TRIGGER channel_votes_update AFTER UPDATE OF channel_id, vote, deleted_at ON _ChannelVotes
+BEGIN
+  UPDATE _Channels SET nr_favorite = nr_favorite - (OLD.vote == 2), nr_spam = nr_spam - (OLD.vote == -1)
+  WHERE id = OLD.channel_id AND OLD.deleted_at IS NULL;
+  UPDATE _Channels SET nr_favorite = nr_favorite + (NEW.vote == 2), nr_spam = nr_spam + (NEW.vote == -1)
+  WHERE id = NEW.channel_id AND NEW.deleted_at IS NULL;
+END;
+
+CREATE TRIGGER channel_votes_delete AFTER DELETE ON _ChannelVotes WHEN OLD.deleted_at IS NULL
+BEGIN
+  UPDATE _Channels SET nr_favorite = nr_favorite - (OLD.vote == 2), nr_spam = nr_spam - (OLD.vote == -1)
+  WHERE id = OLD.channel_id;
+END;
+
+CREATE TRIGGER channel_votes_channel_insert AFTER INSERT ON _Channels
+BEGIN
+  UPDATE _Channels SET
+    nr_favorite = (SELECT count(*) FROM ChannelVotes WHERE channel_id = NEW.id AND vote == 2),
+    nr_spam = (SELECT count(*) FROM ChannelVotes WHERE channel_id = NEW.id AND vote == -1)
+  WHERE id = NEW.id;
+END;
+""")
+
+        # update database version
+        self.db.write_version(30)
+
+    def _upgrade_30_to_31(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (30, 31))
+
+        # keep a copy of next_tracker_check in the mappings so the torrents due for a check on a tracker are indexed
+        self.status_update_func(u"Updating TorrentTrackerMapping table...")
+        self.db.execute(u"""
+ALTER TABLE TorrentTrackerMapping ADD COLUMN next_check integer DEFAULT 0;
+
+UPDATE TorrentTrackerMapping SET
+  next_check = (SELECT next_tracker_check FROM Torrent WHERE torrent_id = TorrentTrackerMapping.torrent_id);
+
+CREATE INDEX TorrentTrackerNextCheckIndex ON TorrentTrackerMapping (tracker_id, next_check);
+
+CREATE TRIGGER tracker_next_check_insert AFTER INSERT ON TorrentTrackerMapping
+BEGIN
+  UPDATE TorrentTrackerMapping SET
+    next_check = (SELECT next_tracker_check FROM Torrent WHERE torrent_id = NEW.torrent_id)
+  WHERE torrent_id = NEW.torrent_id AND tracker_id = NEW.tracker_id;
+END;
+
+CREATE TRIGGER tracker_next_check_update AFTER UPDATE OF next_tracker_check ON Torrent
+WHEN NEW.next_tracker_check IS NOT OLD.next_tracker_check
+BEGIN
+  UPDATE TorrentTrackerMapping SET next_check = NEW.next_tracker_check WHERE torrent_id = NEW.torrent_id;
+END;
+""")
+
+        # update database version
+        self.db.write_version(31)
+
+    def _convert_infohashes(self, table_name, id_column):
+        """
+        Replaces the base64 encoded infohashes in a table by their binary value. Infohashes that cannot be decoded
+        are left as they are.
+        """
+        converted = []
+        for row_id, infohash_str in self.db.fetchall(u"SELECT %s, infohash FROM %s" % (id_column, table_name)):
+            try:
+                infohash = str2bin(infohash_str)
+            except Exception:
+                self._logger.warning(u"Could not convert infohash %s in %s", repr(infohash_str), table_name)
+                continue
+            converted.append((infohash2db(infohash), row_id))
+        self.db.executemany(u"UPDATE %s SET infohash = ? WHERE %s = ?" % (table_name, id_column), converted)
+
     def reimport_torrents(self):
         """Import all torrent files in the collected torrent dir, all the files already in the database will be ignored.
         """
@@ -482,7 +681,7 @@ DROP TABLE TorrentStatus;
         try:
             for infoshash_str, torrent_data in self.torrent_store.itervalues():
                 self.status_update_func("> %s" % infoshash_str)
-                torrentdef = TorrentDef.load_from_memory(torrent_data)
+                torrentdef = TorrentDef.load_from_memory(torrent_data, header_only=True)
                 if torrentdef.is_finalized():
                     infohash = torrentdef.get_infohash()
                     if not torrent_db_handler.hasTorrent(infohash):
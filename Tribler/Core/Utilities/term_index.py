@@ -0,0 +1,220 @@
+from collections import defaultdict
+from heapq import nlargest
+from threading import RLock
+
+
+MIN_TERM_LENGTH = 3
+MAX_TERM_LENGTH = 30
+MAX_CANDIDATES = 50
+DEFAULT_MAX_TRIE_TERMS = 50000
+DEFAULT_TRIE_TOP_SIZE = 10
+
+
+def levenshtein(a, b):
+    """
+    Calculates the Levenshtein distance between a and b.
+    """
+    n, m = len(a), len(b)
+    if n > m:
+        # Make sure n <= m, to use O(min(n,m)) space
+        a, b = b, a
+        n, m = m, n
+
+    current = range(n + 1)
+    for i in range(1, m + 1):
+        previous, current = current, [i] + [0] * n
+        for j in range(1, n + 1):
+            add, delete = previous[j] + 1, current[j - 1] + 1
+            change = previous[j - 1]
+            if a[j - 1] != b[i - 1]:
+                change = change + 1
+            current[j] = min(add, delete, change)
+
+    return current[n]
+
+
+def is_search_term(term):
+    """
+    Returns whether term is long enough, short enough and not a number, so it is worth suggesting.
+    """
+    return MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH and not term.isdigit()
+
+
+def get_trigrams(term):
+    """
+    Returns the set of trigrams of a term, padded so that its first and last characters get trigrams of their own.
+    """
+    padded = u"$%s$" % term
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+class TrigramIndex(object):
+    """
+    Finds the terms closest to a misspelled one.
+
+    Every term is stored in the posting sets of its trigrams. The terms sharing the most trigrams with the term that
+    is looked up are the candidates, which are ranked by their Levenshtein distance and then by how often they have
+    been added. Terms that are shorter than MIN_TERM_LENGTH or longer than MAX_TERM_LENGTH characters and numbers are
+    not indexed, as they are of no use as suggestions.
+    """
+
+    def __init__(self):
+        self.lock = RLock()
+        self.term_frequency = defaultdict(int)
+        self.trigram_terms = defaultdict(set)
+
+    def __len__(self):
+        return len(self.term_frequency)
+
+    def __contains__(self, term):
+        return term in self.term_frequency
+
+    def add_terms(self, terms):
+        """
+        Add an iterable of terms, e.g. the keywords of one torrent name.
+        """
+        with self.lock:
+            for term in terms:
+                if not is_search_term(term):
+                    continue
+
+                if term not in self.term_frequency:
+                    for trigram in get_trigrams(term):
+                        self.trigram_terms[trigram].add(term)
+                self.term_frequency[term] += 1
+
+    def get_closest_terms(self, term, limit=1, max_distance=None):
+        """
+        Returns a list of (distance, term) tuples with the at most limit terms closest to term, the closest first.
+        :param max_distance: Only return terms with at most this Levenshtein distance to term, by default a third of
+        its length.
+        """
+        if max_distance is None:
+            max_distance = max(1, len(term) / 3)
+        trigrams = get_trigrams(term)
+
+        with self.lock:
+            shared = defaultdict(int)
+            for trigram in trigrams:
+                for candidate in self.trigram_terms.get(trigram, ()):
+                    if abs(len(candidate) - len(term)) <= max_distance:
+                        shared[candidate] += 1
+
+            candidates = nlargest(MAX_CANDIDATES, shared.iteritems(), key=lambda item: item[1])
+            ranked = []
+            for candidate, _ in candidates:
+                distance = levenshtein(term, candidate)
+                if distance <= max_distance:
+                    ranked.append((distance, -self.term_frequency[candidate], candidate))
+
+        ranked.sort()
+        return [(distance, candidate) for distance, _, candidate in ranked[:limit]]
+
+
+class _TrieNode(object):
+
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = None
+        self.top = []
+
+
+class PrefixTrie(object):
+    """
+    Completes a prefix to the terms starting with it that have been added most often.
+
+    Every node of the trie keeps the top_size most frequent terms below it, so completing a prefix only walks down
+    the characters of the prefix. When it holds more than max_terms terms, the trie is rebuilt with only the most
+    frequent three quarters of max_terms terms.
+    """
+
+    def __init__(self, max_terms=DEFAULT_MAX_TRIE_TERMS, top_size=DEFAULT_TRIE_TOP_SIZE):
+        self.lock = RLock()
+        self.max_terms = max_terms
+        self.top_size = top_size
+        self.term_frequency = defaultdict(int)
+        self.root = _TrieNode()
+
+    def __len__(self):
+        return len(self.term_frequency)
+
+    def add_terms(self, terms):
+        """
+        Add an iterable of terms, e.g. the keywords of one torrent name or those of all of them.
+        """
+        counts = defaultdict(int)
+        for term in terms:
+            if is_search_term(term):
+                counts[term] += 1
+        self.add_term_counts(counts)
+
+    def add_term_counts(self, counts):
+        """
+        Add terms along with the number of times they occur, given as a dictionary of valid terms.
+        """
+        with self.lock:
+            for term, count in counts.iteritems():
+                self.term_frequency[term] += count
+
+            if len(self.term_frequency) > self.max_terms:
+                self.prune()
+            else:
+                # adding the most frequent terms first keeps the tops from being reordered
+                for term in sorted(counts, key=self.term_frequency.get, reverse=True):
+                    self._update(term)
+
+    def _update(self, term):
+        frequency = self.term_frequency[term]
+        node = self.root
+        self._update_top(node, term, frequency)
+        for char in term:
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+            self._update_top(node, term, frequency)
+
+    def _update_top(self, node, term, frequency):
+        # frequencies only go up, so a term can only enter the top by pushing out the least frequent one
+        top = node.top
+        if term not in top:
+            if len(top) >= self.top_size:
+                if self.term_frequency[top[-1]] >= frequency:
+                    return
+                top.pop()
+            top.append(term)
+
+        i = top.index(term)
+        while i > 0 and self.term_frequency[top[i - 1]] < frequency:
+            top[i - 1], top[i] = top[i], top[i - 1]
+            i -= 1
+
+    def prune(self):
+        """
+        Remove the least frequent terms until the trie holds three quarters of max_terms terms.
+        """
+        with self.lock:
+            keep = sorted(self.term_frequency.iteritems(), key=lambda item: item[1],
+                          reverse=True)[:self.max_terms * 3 / 4]
+            self.term_frequency = defaultdict(int, keep)
+            self.root = _TrieNode()
+            for term, _ in keep:
+                self._update(term)
+
+    def get_completions(self, prefix, limit):
+        """
+        Returns at most limit terms starting with prefix, the most frequent first. Never returns more than top_size
+        terms.
+        """
+        with self.lock:
+            node = self.root
+            for char in prefix:
+                if node.children is None:
+                    return []
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            return node.top[:limit]
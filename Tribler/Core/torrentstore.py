@@ -79,6 +79,16 @@ class TorrentStore(MutableMapping, TaskManager):
             self._pending_torrents.pop(key)
         self._db.Delete(key)
 
+    def delete_many(self, keys):
+        """
+        Delete keys in a single write batch.
+        """
+        write_batch = WriteBatch()
+        for key in keys:
+            self._pending_torrents.pop(key, None)
+            write_batch.Delete(key)
+        self._db.Write(write_batch)
+
     def __iter__(self):
         for k in self._pending_torrents.iterkeys():
             yield k
@@ -193,6 +193,8 @@ def main():
 
                 if tokens[1] == 'info':
                     print_info(metadata_injector.session.lm.dispersy)
+                elif tokens[1] == 'injector':
+                    print_injector(metadata_injector.session.lm.channel_manager)
                 elif tokens[1] == 'community':
                     if len(tokens) == 2:
                         print_communities(metadata_injector.session.lm.dispersy)
@@ -248,6 +250,17 @@ def print_info(dispersy):
     print >> sys.stderr, u"====================\n\n"
 
 
+def print_injector(channel_manager):
+    print >> sys.stderr, u"\n\n===== Injector Throughput ====="
+    print >> sys.stderr, u"- %10s | %10s | %10s | %10s | %10s | %10s | %s" %\
+                         (u"Received", u"Parsing", u"Queued", u"Failed", u"Published", u"Torr/s", u"RSS")
+    for rss_url, stats in channel_manager.get_rss_statistics().iteritems():
+        print >> sys.stderr, u"- %10d | %10d | %10d | %10d | %10d | %10.2f | %s" %\
+                             (stats[u'received'], stats[u'parsing'], stats[u'queued'], stats[u'failed'],
+                              stats[u'published'], stats[u'torrents_per_second'], rss_url)
+    print >> sys.stderr, u"====================\n\n"
+
+
 def print_communities(dispersy):
     stats = dispersy.statistics
     community_list = sorted(stats.communities,
@@ -218,7 +218,7 @@ class ABCApp(object):
 
             # Only allow updates to come in after we defined ratelimiter
             self.prevActiveDownloads = []
-            s.set_download_states_callback(self.sesscb_states_callback)
+            s.set_download_states_callback(self.sesscb_states_callback, incremental=True)
 
             # Schedule task for checkpointing Session, to avoid hash checks after
             # crashes.
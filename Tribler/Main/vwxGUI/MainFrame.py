@@ -433,7 +433,7 @@ class MainFrame(wx.Frame):
         if tdef is None:
             if infohash is not None:
                 # try to get the torrent from torrent_store if the infohash is provided
-                torrent_data = self.utility.session.get_collected_torrent(infohash)
+                torrent_data = self.utility.session.get_collected_torrent(infohash, with_trackers=True)
                 if torrent_data is not None:
                     # use this torrent data for downloading
                     tdef = TorrentDef.load_from_memory(torrent_data)
@@ -8,7 +8,7 @@ from traceback import print_exc
 import wx
 
 from Tribler.Category.Category import Category
-from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin, forceAndReturnDBThread
+from Tribler.Core.CacheDB.sqlitecachedb import bin2str, db2infohash, forceAndReturnDBThread
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 from Tribler.Core.Video.utils import videoextdefaults
 from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_MYPREFERENCES, NTFY_VOTECAST, NTFY_CHANNELCAST,
@@ -111,7 +111,7 @@ class TorrentManager(object):
         return True
 
     def downloadTorrent(self, torrent):
-        torrent_data = self.session.get_collected_torrent(torrent.infohash)
+        torrent_data = self.session.get_collected_torrent(torrent.infohash, with_trackers=True)
         if torrent_data is not None:
             tdef = TorrentDef.load_from_memory(torrent_data)
         else:
@@ -755,7 +755,7 @@ class LibraryManager(object):
                 self._playDownload(infohash, selectedinfilename)
         else:
             def do_db():
-                torrent_data = self.guiUtility.utility.session.get_collected_torrent(infohash)
+                torrent_data = self.guiUtility.utility.session.get_collected_torrent(infohash, with_trackers=True)
                 if torrent_data is not None:
                     tdef = TorrentDef.load_from_memory(torrent_data)
                 else:
@@ -826,7 +826,7 @@ class LibraryManager(object):
                 ) == 1.0 else "restart")
 
         if not resumed:
-            torrent_data = self.guiUtility.utility.session.get_collected_torrent(torrent.infohash)
+            torrent_data = self.guiUtility.utility.session.get_collected_torrent(torrent.infohash, with_trackers=True)
             if torrent_data is not None:
                 tdef = TorrentDef.load_from_memory(torrent_data)
 
@@ -1413,7 +1413,7 @@ class ChannelManager(object):
         sql = "SELECT distinct infohash, PL.dispersy_id FROM PlaylistTorrents PL, ChannelTorrents CT, Torrent T WHERE PL.channeltorrent_id = CT.id AND CT.torrent_id = T.torrent_id AND playlist_id = ?"
         records = self.channelcast_db._db.fetchall(sql, (playlist_id,))
         for infohash, dispersy_id in records:
-            infohash = str2bin(infohash)
+            infohash = db2infohash(infohash)
             if infohash in to_be_created:
                 to_be_created.remove(infohash)
             else:
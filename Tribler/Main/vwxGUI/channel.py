@@ -1056,7 +1056,8 @@ class ManageChannelFilesManager(BaseManager):
 
             nr_torrents_exported = 0
             for torrent in torrents:
-                torrent_data = self.channelsearch_manager.session.get_collected_torrent(torrent.infohash)
+                torrent_data = self.channelsearch_manager.session.get_collected_torrent(torrent.infohash,
+                                                                                        with_trackers=True)
                 if torrent_data is not None:
                     torrent_file_name = hexlify(torrent.infohash) + u'.torrent'
                     new_torrent_filename = os.path.join(target_dir, torrent_file_name)
@@ -369,7 +369,7 @@ class NetworkPanel(HomePanel):
         self.timer = None
 
         session = Session.get_instance()
-        session.add_observer(self.OnNotify, NTFY_TORRENTS, [NTFY_INSERT])
+        session.add_observer(self.OnNotify, NTFY_TORRENTS, [NTFY_INSERT], cache=5)
         self.UpdateStats()
 
     def CreatePanel(self):
@@ -419,7 +419,7 @@ class NetworkPanel(HomePanel):
         panel.SetSizer(vSizer)
         return panel
 
-    def OnNotify(self, subject, type, infohash):
+    def OnNotify(self, events):
         try:
             if self.IsShownOnScreen():
                 self.UpdateStats()
@@ -533,7 +533,8 @@ class TorrentListItem(DoubleLineListItemWithButtons):
     def OnExportTorrent(self, filename):
         torrents = self.guiutility.frame.top_bg.GetSelectedTorrents()
         if len(torrents) == 1:
-            torrent_data = self.guiutility.utility.session.get_collected_torrent(torrents[0].infohash)
+            torrent_data = self.guiutility.utility.session.get_collected_torrent(torrents[0].infohash,
+                                                                                 with_trackers=True)
             dlg = wx.FileDialog(
                 None,
                 message="Select an export destination",
@@ -556,7 +557,8 @@ class TorrentListItem(DoubleLineListItemWithButtons):
             if dlg.ShowModal() == wx.ID_OK:
                 path = dlg.GetPath()
                 for torrent in torrents:
-                    torrent_data = self.guiutility.utility.session.get_collected_torrent(torrent.infohash)
+                    torrent_data = self.guiutility.utility.session.get_collected_torrent(torrent.infohash,
+                                                                                         with_trackers=True)
                     dst_filename = os.path.join(path, "%s.torrent" % torrent.name)
                     if os.path.exists(dst_filename):
                         os.remove(dst_filename)
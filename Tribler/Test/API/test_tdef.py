@@ -10,6 +10,7 @@ from libtorrent import bdecode
 from Tribler.Test.test_as_server import BaseTestCase, TESTS_DATA_DIR, TESTS_API_DIR
 
 from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.exceptions import OperationNotPossibleAtRuntimeException
 from Tribler.Core.Utilities.utilities import isValidTorrentFile
 
 
@@ -57,6 +58,35 @@ class TestTorrentDef(BaseTestCase):
         self.assert_(t1.is_private() == True)
         self.assert_(t2.is_private() == False)
 
+    def test_load_header_only(self):
+        multiplefn = os.path.join(TESTS_DATA_DIR, "bak_multiple.torrent")
+        with open(multiplefn, "rb") as f:
+            data = f.read()
+
+        t1 = TorrentDef.load_from_memory(data)
+        t2 = TorrentDef.load_from_memory(data, header_only=True)
+
+        self.assertEqual(t1.get_infohash(), t2.get_infohash())
+        self.assertEqual(t1.get_name_as_unicode(), t2.get_name_as_unicode())
+        self.assertEqual(t1.get_length(), t2.get_length())
+        self.assertEqual(t1.get_files_as_unicode_with_length(), t2.get_files_as_unicode_with_length())
+        self.assertRaises(OperationNotPossibleAtRuntimeException, t2.encode)
+        self.assertRaises(OperationNotPossibleAtRuntimeException, t2.get_pieces)
+
+    def test_files_as_unicode_cached(self):
+        t = TorrentDef()
+        t.add_content(os.path.join(TESTS_API_DIR, "video.avi"))
+        t.set_tracker(TRACKER)
+        t.finalize()
+        self.assertEqual(t.get_files_as_unicode(), [u"video.avi"])
+        self.assertEqual(t.get_files_as_unicode(exts=["avi"]), [u"video.avi"])
+        self.assertEqual(t.get_files_as_unicode(exts=["mkv"]), [])
+
+        # changing the content invalidates the decoded file list
+        t.add_content(os.path.join(TESTS_API_DIR, "video2.avi"))
+        t.finalize()
+        self.assertEqual(len(t.get_files_as_unicode()), 2)
+
     def subtest_add_content_file(self):
         """ Add a single file to a TorrentDef """
         t = TorrentDef()
@@ -0,0 +1,73 @@
+'''
+The benchmark package contains scripts that measure the performance of
+Tribler components. They are not run as part of the unit tests, run them with
+python -m Tribler.Test.benchmark.<name> from the root of the repository.
+'''
+import os
+import time
+from contextlib import contextmanager
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import Tribler
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import SEARCH_TERMS_BATCH_SIZE
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB
+
+
+class BenchmarkSession(object):
+
+    """
+    Provides the parts of a Session that the database and its handlers use.
+    """
+
+    def __init__(self):
+        self.sqlite_db = None
+
+    def get_install_dir(self):
+        return os.path.dirname(os.path.dirname(os.path.abspath(Tribler.__file__)))
+
+
+def open_database(db_path, session=None):
+    """
+    Open the database at db_path, creating it if it does not exist, as the sqlite_db of session.
+    @param session: a BenchmarkSession is created if it is not given.
+    @return: the SQLiteCacheDB.
+    """
+    session = session or BenchmarkSession()
+    db = session.sqlite_db = SQLiteCacheDB(session)
+    db.initialize(db_path)
+    return db
+
+
+@contextmanager
+def benchmark_session(session=None):
+    """
+    Create a new database in a temporary directory and yield the session that uses it. The database is closed and
+    the directory removed afterwards.
+    @param session: a BenchmarkSession is created if it is not given.
+    """
+    session = session or BenchmarkSession()
+    state_dir = mkdtemp()
+    try:
+        open_database(os.path.join(state_dir, u"tribler.sdb"), session)
+        yield session
+    finally:
+        if session.sqlite_db is not None:
+            session.sqlite_db.close()
+        rmtree(state_dir)
+
+
+def load_search_terms(torrent_db):
+    """
+    Run all batches of TorrentDBHandler.loadSearchTerms, which the reactor would otherwise run.
+    @return: the total and the longest time of a batch in seconds.
+    """
+    batch_times = []
+    start = time.time()
+    torrent_db.loadSearchTerms()
+    batch_times.append(time.time() - start)
+    while torrent_db._search_terms_loading is not None:
+        start = time.time()
+        torrent_db._loadSearchTermsBatch(SEARCH_TERMS_BATCH_SIZE)
+        batch_times.append(time.time() - start)
+    return sum(batch_times), max(batch_times)
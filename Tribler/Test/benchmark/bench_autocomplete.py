@@ -0,0 +1,110 @@
+"""
+Measures completing search terms.
+
+Usage: python -m Tribler.Test.benchmark.bench_autocomplete
+
+Fills the full text index of a new database with NUM_TORRENTS torrent names
+made up of words from a random vocabulary, some far more common than others,
+and completes NUM_QUERIES prefixes of two to five characters with the FTS
+prefix query getAutoCompleteTerms used to run and with the prefix trie it uses
+now. Also reports how long loading the trie takes in total and per batch of
+the background scan, and how many nodes it needs, with and without a cap on
+its number of terms.
+"""
+import random
+import string
+import time
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
+from Tribler.Core.Utilities.term_index import PrefixTrie
+from Tribler.Test.benchmark import benchmark_session, load_search_terms
+
+
+NUM_TORRENTS = 100000
+VOCABULARY_SIZE = 50000
+WORDS_PER_NAME = 5
+NUM_QUERIES = 1000
+MAX_TERMS = 7
+CAPPED_TRIE_TERMS = 10000
+
+
+def old_autocomplete_terms(db, keyword, max_terms, limit=100):
+    sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
+    result = db.fetchall(sql, (keyword + '*', limit))
+
+    all_terms = set()
+    for line, in result:
+        if len(all_terms) >= max_terms:
+            break
+        i1 = line.find(keyword)
+        i2 = line.find(' ', i1 + len(keyword))
+        all_terms.add(line[i1:i2] if i2 >= 0 else line[i1:])
+
+    if keyword in all_terms:
+        all_terms.remove(keyword)
+    if '' in all_terms:
+        all_terms.remove('')
+
+    return list(all_terms)
+
+
+def count_nodes(trie):
+    count = 0
+    nodes = [trie.root]
+    while nodes:
+        node = nodes.pop()
+        count += 1
+        if node.children:
+            nodes.extend(node.children.itervalues())
+    return count
+
+
+def measure(func, prefixes):
+    start = time.time()
+    for prefix in prefixes:
+        func(prefix)
+    return (time.time() - start) * 1e6 / len(prefixes)
+
+
+def main():
+    random.seed(0)
+    vocabulary = set()
+    while len(vocabulary) < VOCABULARY_SIZE:
+        vocabulary.add(u"".join(random.choice(string.ascii_lowercase) for _ in xrange(random.randint(3, 10))))
+    vocabulary = sorted(vocabulary)
+    random.shuffle(vocabulary)
+
+    def random_word():
+        # a few words are very common, most are rare
+        if random.random() < 0.5:
+            return random.choice(vocabulary)
+        return vocabulary[min(VOCABULARY_SIZE, int(random.paretovariate(0.5))) - 1]
+
+    with benchmark_session() as session:
+        db = session.sqlite_db
+        db.executemany(u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES (?,?,'','')",
+                       [(i, u" ".join(random_word() for _ in xrange(WORDS_PER_NAME))) for i in xrange(NUM_TORRENTS)])
+        db.commit_now()
+        torrent_db = TorrentDBHandler(session)
+
+        prefixes = [random_word()[:random.randint(2, 5)] for _ in xrange(NUM_QUERIES)]
+
+        load_time, batch_time = load_search_terms(torrent_db)
+
+        fts_time = measure(lambda prefix: old_autocomplete_terms(db, prefix, MAX_TERMS), prefixes)
+        trie_time = measure(lambda prefix: torrent_db.getAutoCompleteTerms(prefix, MAX_TERMS), prefixes)
+        print "FTS prefix MATCH %8.2f us per completion" % fts_time
+        print "prefix trie      %8.2f us per completion" % trie_time
+        trie = torrent_db.autocomplete_trie
+        print "Loading the trie of %d terms along with the trigram index took %.2f s, at most %.0f ms per batch, " \
+              "it has %d nodes" % (len(trie), load_time, batch_time * 1000, count_nodes(trie))
+
+        capped_trie = PrefixTrie(max_terms=CAPPED_TRIE_TERMS)
+        capped_trie.add_terms(term for swarmname, in db.fetchall(u"SELECT swarmname FROM FullTextIndex")
+                              for term in swarmname.split())
+        print "A trie capped at %d terms holds %d terms in %d nodes" % (CAPPED_TRIE_TERMS, len(capped_trie),
+                                                                        count_nodes(capped_trie))
+
+
+if __name__ == "__main__":
+    main()
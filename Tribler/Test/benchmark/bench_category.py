@@ -0,0 +1,36 @@
+"""
+Measures the throughput of the torrent classifier.
+
+Usage: python -m Tribler.Test.benchmark.bench_category
+
+The torrents of the golden classification data in Tribler/Test/data are classified
+repeatedly and the number of torrents classified per second is reported.
+"""
+import json
+import os
+import timeit
+
+from Tribler.Category.Category import Category
+
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INSTALL_DIR = os.path.dirname(os.path.dirname(TESTS_DIR))
+REPEAT = 20
+
+
+def main():
+    with open(os.path.join(TESTS_DIR, u"data", u"category_golden.json")) as f:
+        torrents = [(files_list, display_name) for display_name, files_list, _ in json.load(f)]
+
+    category = Category.getInstance(INSTALL_DIR)
+
+    def classify():
+        for files_list, display_name in torrents:
+            category.calculateCategoryNonDict(files_list, display_name, '', '')
+
+    seconds = min(timeit.repeat(classify, number=REPEAT, repeat=3)) / REPEAT
+    print "%d torrents in %.3f ms, %.0f torrents/s" % (len(torrents), seconds * 1000, len(torrents) / seconds)
+
+
+if __name__ == "__main__":
+    main()
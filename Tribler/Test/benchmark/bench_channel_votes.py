@@ -0,0 +1,148 @@
+"""
+Measures counting channel votes and listing channels.
+
+Usage: python -m Tribler.Test.benchmark.bench_channel_votes
+
+Fills a new database with NUM_CHANNELS channels and NUM_VOTES votes on them and
+then receives NUM_BATCHES batches of BATCH_SIZE changed votes. Compares the way
+VoteCastDBHandler used to store them, recounting all votes of the changed
+channels when flushing, with the counts the channel_votes triggers keep up to
+date. Also compares listing all channels and the most popular ones, sorted
+with a Python cmp function before and in the order of the SQL query now.
+"""
+import os
+import random
+import time
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import ChannelCastDBHandler, VoteCastDBHandler
+from Tribler.Test.benchmark import benchmark_session
+
+
+NUM_CHANNELS = 20000
+NUM_VOTERS = 5000
+NUM_VOTES = 500000
+NUM_BATCHES = 20
+BATCH_SIZE = 500
+NUM_LISTINGS = 10
+
+CHANNELS_SQL = u"Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam " \
+               u"FROM Channels"
+
+
+def old_store_votes(db, votes):
+    db.executemany(u"INSERT OR REPLACE INTO _ChannelVotes (channel_id, voter_id, dispersy_id, vote, time_stamp) "
+                   u"VALUES (?,?,?,?,?)", votes)
+
+
+def old_flush(db, channel_ids):
+    parameters = ",".join("?" * len(channel_ids))
+    sql = "Select channel_id, vote FROM ChannelVotes WHERE channel_id in (" + parameters + ")"
+    positive_votes = {}
+    negative_votes = {}
+    for channel_id, vote in db.fetchall(sql, channel_ids):
+        if vote == 2:
+            positive_votes[channel_id] = positive_votes.get(channel_id, 0) + 1
+        elif vote == -1:
+            negative_votes[channel_id] = negative_votes.get(channel_id, 0) + 1
+
+    updates = [(positive_votes.get(channel_id, 0), negative_votes.get(channel_id, 0), channel_id)
+               for channel_id in channel_ids]
+    db.executemany("UPDATE OR IGNORE _Channels SET nr_favorite = ?, nr_spam = ? WHERE id = ?", updates)
+
+
+def old_get_channels(db, my_votes, sql, args=None):
+    channels = []
+    for id, name, description, dispersy_cid, modified, nr_torrents, nr_favorites, nr_spam in db.fetchall(sql, args):
+        channels.append((id, str(dispersy_cid), name, description, nr_torrents,
+                         nr_favorites, nr_spam, my_votes.get(id, 0), modified, False))
+
+    def channel_sort(a, b):
+        if a[7] == -1:
+            return 1
+        if b[7] == -1:
+            return -1
+        if a[5] < b[5]:
+            return 1
+        if a[5] > b[5]:
+            return -1
+        if a[8] < b[8]:
+            return 1
+        if a[8] > b[8]:
+            return -1
+        return cmp(a[4], b[4])
+
+    channels.sort(channel_sort)
+    return channels
+
+
+def random_votes(count, timestamp):
+    return [(random.randint(1, NUM_CHANNELS), random.randint(1, NUM_VOTERS), random.randint(0, 2 ** 31),
+             random.choice((2, 2, 2, -1, 0)), timestamp) for _ in xrange(count)]
+
+
+def main():
+    random.seed(0)
+    with benchmark_session() as session:
+        db = session.sqlite_db
+        db.executemany(u"INSERT INTO _Channels (id, dispersy_cid, peer_id, name, modified, nr_torrents) "
+                       u"VALUES (?,?,?,?,?,?)",
+                       [(i, buffer(os.urandom(20)), i, u"channel %d" % i, random.randint(0, 10 ** 6),
+                         random.randint(0, 1000)) for i in xrange(1, NUM_CHANNELS + 1)])
+        db.executemany(u"INSERT OR IGNORE INTO _ChannelVotes (channel_id, voter_id, dispersy_id, vote, time_stamp) "
+                       u"VALUES (?,?,?,?,?)", random_votes(NUM_VOTES, 0))
+        db.commit_now()
+
+        vote_db = VoteCastDBHandler(session)
+        channel_db = ChannelCastDBHandler(session)
+        vote_db.channelcast_db = channel_db
+        channel_db.votecast_db = vote_db
+        batches = [random_votes(BATCH_SIZE, i + 1) for i in xrange(NUM_BATCHES)]
+        db.execute(u"CREATE TEMP TABLE InitialVotes AS SELECT * FROM _ChannelVotes")
+
+        start = time.time()
+        for votes in batches:
+            old_store_votes(db, votes)
+            old_flush(db, list(set(vote[0] for vote in votes)))
+        old_votes = (time.time() - start) * 1000 / NUM_BATCHES
+        old_counts = db.fetchall(u"SELECT id, nr_favorite, nr_spam FROM _Channels ORDER BY id")
+
+        # restore the initial votes and count them once, like the upgrade to version 30 does
+        db.execute(u"DELETE FROM _ChannelVotes")
+        db.execute(u"INSERT INTO _ChannelVotes SELECT * FROM InitialVotes")
+        db.execute(u"UPDATE _Channels SET "
+                   u"nr_favorite = (SELECT count(*) FROM ChannelVotes WHERE channel_id = _Channels.id AND vote == 2),"
+                   u"nr_spam = (SELECT count(*) FROM ChannelVotes WHERE channel_id = _Channels.id AND vote == -1)")
+        db.commit_now()
+
+        start = time.time()
+        for votes in batches:
+            vote_db.on_votes_from_dispersy(votes)
+        new_votes = (time.time() - start) * 1000 / NUM_BATCHES
+        assert db.fetchall(u"SELECT id, nr_favorite, nr_spam FROM _Channels ORDER BY id") == old_counts
+        vote_db.updatedChannels.clear()
+
+        print "Storing %d votes: recount on flush %.2f ms, triggers %.2f ms" % (BATCH_SIZE, old_votes, new_votes)
+
+        my_votes = vote_db.getMyVotes()
+        for name, old_list, new_list in (
+                ("all channels", lambda: old_get_channels(db, my_votes, CHANNELS_SQL), channel_db.getAllChannels),
+                ("20 most popular channels",
+                 lambda: old_get_channels(db, my_votes, CHANNELS_SQL + u" ORDER BY nr_favorite DESC, modified DESC "
+                                                                       u"LIMIT ?", (20,)),
+                 channel_db.getMostPopularChannels)):
+            start = time.time()
+            for _ in xrange(NUM_LISTINGS):
+                old_list()
+            old_time = (time.time() - start) * 1000 / NUM_LISTINGS
+
+            start = time.time()
+            for _ in xrange(NUM_LISTINGS):
+                new_list()
+            new_time = (time.time() - start) * 1000 / NUM_LISTINGS
+
+            assert [channel[0] for channel in old_list()] == [channel[0] for channel in new_list()]
+            print "Listing %s: cmp sort %.2f ms, SQL order %.2f ms" % (name, old_time, new_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measures checkpointing 1000 downloads at shutdown.
+
+Usage: python -m Tribler.Test.benchmark.bench_checkpoint_writer
+
+Compares writing every pstate with CallbackConfigParser.write_file on the
+reactor thread, as LaunchManyCore.save_download_pstate used to do, with the
+CheckpointWriter. For the writer, the time spent on the reactor thread and
+the time the batch takes on the threadpool are reported separately, for a
+first shutdown where every pstate changed and for a second one where only
+the active downloads changed.
+"""
+import os
+import random
+import shutil
+import time
+from tempfile import mkdtemp
+
+from twisted.internet.task import Clock
+
+from Tribler.Core.APIImplementation.CheckpointWriter import CheckpointWriter
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+
+
+NUM_DOWNLOADS = 1000
+NUM_ACTIVE = 50
+NUM_PIECES = 1000
+
+
+def create_pstate(index, progress):
+    pstate = CallbackConfigParser()
+    pstate.add_section('downloadconfig')
+    for option, value in (('saveas', '/home/user/Downloads'), ('max_upload_rate', 0), ('max_download_rate', 0),
+                          ('hops', 0), ('safe_seeding', True), ('mode', 0), ('selected_files', [])):
+        pstate.set('downloadconfig', option, value)
+    pstate.add_section('state')
+    pstate.set('state', 'version', 10)
+    pstate.set('state', 'metainfo', {'announce': 'http://tracker.example.com/announce',
+                                     'info': {'name': 'torrent %d' % index, 'piece length': 262144,
+                                              'length': NUM_PIECES * 262144,
+                                              'pieces': os.urandom(20 * NUM_PIECES)}})
+    pstate.set('state', 'dlstate', {'status': 3, 'progress': progress, 'swarmcache': None})
+    pstate.set('state', 'engineresumedata', {'file-format': 'libtorrent resume file', 'file-version': 1,
+                                             'pieces': '\x01' * int(progress * NUM_PIECES) +
+                                             '\x00' * (NUM_PIECES - int(progress * NUM_PIECES)),
+                                             'total_uploaded': 0, 'total_downloaded': int(progress * 1e9)})
+    return pstate
+
+
+def write_files(pstate_dir, pstates):
+    for infohash, pstate in pstates.iteritems():
+        pstate.write_file(os.path.join(pstate_dir, infohash.encode('hex') + '.state'))
+
+
+def main():
+    random.seed(0)
+    pstates = dict((os.urandom(20), create_pstate(i, random.random())) for i in xrange(NUM_DOWNLOADS))
+    pstate_dir = mkdtemp()
+    try:
+        start = time.time()
+        write_files(pstate_dir, pstates)
+        print "write_file on the reactor thread: %.0f ms" % ((time.time() - start) * 1000)
+
+        writer = CheckpointWriter(pstate_dir)
+        writer._reactor = Clock()
+        writer._reactor.callFromThread = lambda f, *args: f(*args)
+        for shutdown in ("first shutdown", "second shutdown"):
+            start = time.time()
+            for infohash, pstate in pstates.iteritems():
+                writer.save(infohash, pstate)
+            reactor_time = time.time() - start
+
+            start = time.time()
+            batch, writer._pending = writer._pending, {}
+            written = writer.write_batch(batch)
+            print "CheckpointWriter, %s: %.0f ms on the reactor thread, %.0f ms on the threadpool, %d written" % (
+                shutdown, reactor_time * 1000, (time.time() - start) * 1000, written)
+
+            for infohash in random.sample(pstates, NUM_ACTIVE):
+                pstates[infohash] = create_pstate(0, random.random())
+    finally:
+        shutil.rmtree(pstate_dir)
+
+
+if __name__ == "__main__":
+    main()
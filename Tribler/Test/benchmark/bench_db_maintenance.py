@@ -0,0 +1,98 @@
+"""
+Measures cleaning up the database.
+
+Usage: python -m Tribler.Test.benchmark.bench_db_maintenance
+
+Fills a new database with NUM_TORRENTS torrents, one in COLLECTED_FRACTION of
+them collected with FILES_PER_TORRENT files and one in NAMELESS_FRACTION of
+them without a name, and copies it. On the first copy, runs the DELETE queries
+clean_db used to run followed by a full VACUUM, which blocked the reactor for
+the whole time. On the second copy, deletes the torrents without a name as
+clean_db does on exit, then runs the steps of the background maintenance until
+all orphans are deleted and all free pages are given back, and reports how long
+the longest step took along with the free pages and WAL size afterwards.
+"""
+import os
+import random
+import time
+from shutil import copy, rmtree
+from tempfile import mkdtemp
+
+from Tribler.Core.CacheDB.sqlitecachedb import infohash2db
+from Tribler.Test.benchmark import open_database
+
+
+NUM_TORRENTS = 200000
+COLLECTED_FRACTION = 0.25
+NAMELESS_FRACTION = 0.2
+FILES_PER_TORRENT = 5
+
+
+def create_db(db_path):
+    db = open_database(db_path)
+    try:
+        torrents = []
+        for i in xrange(1, NUM_TORRENTS + 1):
+            name = None if random.random() < NAMELESS_FRACTION else u"torrent %d" % i
+            torrents.append((i, infohash2db(os.urandom(20)), name, int(random.random() < COLLECTED_FRACTION)))
+        db.executemany(u"INSERT INTO Torrent (torrent_id, infohash, name, is_collected) VALUES (?,?,?,?)", torrents)
+        db.executemany(u"INSERT INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)",
+                       [(torrent_id, u"file %d" % j, 2 ** 20) for torrent_id, _, _, is_collected in torrents
+                        if is_collected for j in xrange(FILES_PER_TORRENT)])
+    finally:
+        db.close()
+
+
+def main():
+    random.seed(0)
+    state_dir = mkdtemp()
+    try:
+        old_path = os.path.join(state_dir, u"old.sdb")
+        new_path = os.path.join(state_dir, u"new.sdb")
+        create_db(old_path)
+        copy(old_path, new_path)
+
+        db = open_database(old_path)
+        try:
+            start = time.time()
+            db.execute_write(u"DELETE FROM TorrentFiles WHERE torrent_id IN (SELECT torrent_id FROM CollectedTorrent)")
+            db.execute_write(u"DELETE FROM Torrent WHERE name IS NULL"
+                             u" AND torrent_id NOT IN (SELECT torrent_id FROM _ChannelTorrents)")
+            delete_time = time.time() - start
+            db.execute(u"VACUUM")
+            old_time = time.time() - start
+            old_pages = db.get_maintenance_statistics()[u'page_count']
+        finally:
+            db.close()
+        print "DELETE and VACUUM: %.0f ms blocked, %.0f ms of it deleting, %d pages left" % (
+            old_time * 1000, delete_time * 1000, old_pages)
+
+        db = open_database(new_path)
+        try:
+            start = time.time()
+            db._delete_nameless_torrents()
+            exit_time = time.time() - start
+
+            max_torrent_id = db.fetchone(u"SELECT max(torrent_id) FROM Torrent")
+            step_times = []
+            while db._orphan_scan_position < max_torrent_id or db.get_maintenance_statistics()[u'free_pages']:
+                start = time.time()
+                db._delete_orphans()
+                db._incremental_vacuum()
+                step_times.append(time.time() - start)
+            db._checkpoint_wal()
+            statistics = db.get_maintenance_statistics()
+        finally:
+            db.close()
+        print "Deleting the torrents without a name on exit: %.0f ms" % (exit_time * 1000)
+        print "Maintenance: %d steps, %.0f ms in total, longest step %.0f ms" % (
+            len(step_times), sum(step_times) * 1000, max(step_times) * 1000)
+        print "After maintenance: %d orphans deleted, %d pages vacuumed, %d free pages out of %d, " \
+              "WAL size %d bytes" % (statistics[u'orphans_deleted'], statistics[u'pages_vacuumed'],
+                                     statistics[u'free_pages'], statistics[u'page_count'], statistics[u'wal_size'])
+    finally:
+        rmtree(state_dir)
+
+
+if __name__ == "__main__":
+    main()
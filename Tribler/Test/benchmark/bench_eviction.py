@@ -0,0 +1,76 @@
+"""
+Measures selecting the collected torrents to evict.
+
+Usage: python -m Tribler.Test.benchmark.bench_eviction
+
+Fills the Torrent table of a new database with NUM_TORRENTS collected torrents
+of varying age and popularity and compares the query freeSpace used to run,
+which computes the weight of every collected torrent and sorts them, with
+TorrentDBHandler.freeSpace, which finds the lowest weighted torrents through
+the eviction weight indexes. The evicted torrents are collected again after
+every call.
+"""
+import os
+import random
+import time
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
+from Tribler.Core.CacheDB.sqlitecachedb import infohash2db
+from Tribler.Test.benchmark import BenchmarkSession, benchmark_session
+
+
+NUM_TORRENTS = 500000
+NUM_CALLS = 20
+TORRENTS_TO_EVICT = 50
+
+ORDER_BY_WEIGHT_SQL = u"""
+    SELECT torrent_id, relevance,
+        min(relevance,2500) +  min(500,num_leechers) + 4*min(500,num_seeders) - (max(0,min(500,(%d-creation_date)/86400)) ) AS weight
+    FROM CollectedTorrent
+    WHERE torrent_id NOT IN (SELECT torrent_id FROM MyPreference)
+    ORDER BY weight
+    LIMIT %d"""
+
+
+class EvictionSession(BenchmarkSession):
+
+    def delete_collected_torrents(self, infohashes):
+        pass
+
+
+def fill_database(db):
+    now = int(time.time())
+    db.executemany(u"INSERT INTO Torrent (infohash, name, creation_date, relevance, num_seeders, num_leechers, "
+                   u"is_collected) VALUES (?,?,?,?,?,?,1)",
+                   [(infohash2db(os.urandom(20)), u"torrent %d" % i, now - random.randint(0, 1000 * 86400),
+                     random.randint(0, 3000), random.randint(0, 1000), random.randint(0, 1000))
+                    for i in xrange(NUM_TORRENTS)])
+    db.commit_now()
+
+
+def main():
+    random.seed(0)
+    with benchmark_session(EvictionSession()) as session:
+        db = session.sqlite_db
+        fill_database(db)
+        torrent_db = TorrentDBHandler(session)
+
+        start = time.time()
+        for _ in xrange(NUM_CALLS):
+            assert len(db.fetchall(ORDER_BY_WEIGHT_SQL % (int(time.time()), TORRENTS_TO_EVICT))) == TORRENTS_TO_EVICT
+        order_by_weight = (time.time() - start) * 1000 / NUM_CALLS
+
+        elapsed = 0.0
+        for _ in xrange(NUM_CALLS):
+            start = time.time()
+            assert torrent_db.freeSpace(TORRENTS_TO_EVICT) == TORRENTS_TO_EVICT
+            elapsed += time.time() - start
+            db.execute(u"UPDATE Torrent SET is_collected = 1 WHERE is_collected == 0")
+        free_space = elapsed * 1000 / NUM_CALLS
+
+        print "Evicting %d out of %d torrents: ORDER BY weight %.2f ms, freeSpace %.2f ms" % (
+            TORRENTS_TO_EVICT, NUM_TORRENTS, order_by_weight, free_space)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures storing infohashes as base64 encoded text and as BLOBs.
+
+Usage: python -m Tribler.Test.benchmark.bench_infohash_storage
+
+Creates a Torrent table with a unique index on infohash for both formats,
+fills it with NUM_TORRENTS random infohashes and reports the size of the
+database file and the time it takes to look up torrent ids by infohash,
+including converting the infohashes to their database format, both one by
+one and in batches of BATCH_SIZE, as getTorrentIDS does.
+"""
+import os
+import random
+import sqlite3
+import time
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from Tribler.Core.CacheDB.sqlitecachedb import bin2str, infohash2db
+
+
+NUM_TORRENTS = 500000
+NUM_LOOKUPS = 20000
+BATCH_SIZE = 50
+PAGE_SIZE = 8192
+
+
+def create_database(filename, infohashes, to_db):
+    connection = sqlite3.connect(filename)
+    connection.execute("PRAGMA page_size = %d" % PAGE_SIZE)
+    connection.execute("CREATE TABLE Torrent (torrent_id integer PRIMARY KEY AUTOINCREMENT NOT NULL, "
+                       "infohash blob NOT NULL, name text, length integer)")
+    connection.execute("CREATE UNIQUE INDEX infohash_idx ON Torrent (infohash)")
+    connection.executemany("INSERT INTO Torrent (infohash, name, length) VALUES (?, ?, ?)",
+                           ((to_db(infohash), u"torrent %d" % i, i * 1024) for i, infohash in enumerate(infohashes)))
+    connection.commit()
+    connection.execute("VACUUM")
+    return connection
+
+
+def lookup_one(connection, infohashes, to_db):
+    start = time.time()
+    for infohash in infohashes:
+        connection.execute("SELECT torrent_id FROM Torrent WHERE infohash = ?", (to_db(infohash),)).fetchall()
+    return time.time() - start
+
+
+def lookup_batches(connection, infohashes, to_db):
+    sql = "SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)" % ",".join("?" * BATCH_SIZE)
+    start = time.time()
+    for i in xrange(0, len(infohashes), BATCH_SIZE):
+        connection.execute(sql, [to_db(infohash) for infohash in infohashes[i:i + BATCH_SIZE]]).fetchall()
+    return time.time() - start
+
+
+def main():
+    random.seed(0)
+    infohashes = [os.urandom(20) for _ in xrange(NUM_TORRENTS)]
+    lookups = random.sample(infohashes, NUM_LOOKUPS)
+
+    directory = mkdtemp()
+    try:
+        for name, to_db in (("base64 text", bin2str), ("BLOB", infohash2db)):
+            filename = os.path.join(directory, name.replace(" ", "_") + ".sdb")
+            connection = create_database(filename, infohashes, to_db)
+            one = lookup_one(connection, lookups, to_db)
+            batches = lookup_batches(connection, lookups, to_db)
+            connection.close()
+
+            print "%-12s %6.1f MB, %5.2f us per lookup, %5.2f us per infohash in batches of %d" % (
+                name, os.path.getsize(filename) / 1024.0 / 1024.0, one * 1e6 / NUM_LOOKUPS,
+                batches * 1e6 / NUM_LOOKUPS, BATCH_SIZE)
+    finally:
+        rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measures computing the progress of byte ranges of a torrent with 20k pieces.
+
+Usage: python -m Tribler.Test.benchmark.bench_piece_progress
+
+Compares PieceBitfield with looping over the list of piece indices, as
+LibtorrentDownloadImpl.get_piece_progress used to do, for the whole torrent
+and for a 5MB prebuffer range.
+"""
+import random
+import timeit
+
+from Tribler.Core.Libtorrent.PieceBitfield import PieceBitfield
+
+
+NUM_PIECES = 20000
+PIECE_SIZE = 256 * 1024
+REPEAT = 100
+
+
+def list_progress(status_pieces, pieces, consecutive=False):
+    pieces = list(set(pieces))
+    if consecutive:
+        pieces.sort()
+    pieces_have = 0
+    for pieceindex in pieces:
+        if pieceindex < len(status_pieces) and status_pieces[pieceindex]:
+            pieces_have += 1
+        elif consecutive:
+            break
+    return float(pieces_have) / len(pieces)
+
+
+def bench(statement):
+    return min(timeit.repeat(statement, number=REPEAT, repeat=3)) / REPEAT * 1e6
+
+
+def main():
+    random.seed(0)
+    status_pieces = [random.random() < 0.9 for _ in xrange(NUM_PIECES)]
+    prebuffer = (NUM_PIECES / 2, NUM_PIECES / 2 + 5 * 1024 * 1024 / PIECE_SIZE)
+
+    print "%-25s %12s %12s" % ("range", "list us", "bitfield us")
+    for name, (start, end) in (("whole torrent", (0, NUM_PIECES)), ("prebuffer", prebuffer)):
+        for consecutive in (False, True):
+            bitfield = PieceBitfield(status_pieces)
+            assert list_progress(status_pieces, range(start, end), consecutive) == \
+                bitfield.get_progress([(start, end)], consecutive)
+            print "%-25s %12.1f %12.1f" % (
+                name + (" consecutive" if consecutive else ""),
+                bench(lambda: list_progress(status_pieces, range(start, end), consecutive)),
+                bench(lambda: bitfield.get_progress([(start, end)], consecutive)))
+
+    print "building the bitfield from the status: %.1f us" % bench(lambda: PieceBitfield(status_pieces))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures sampling random collected torrents.
+
+Usage: python -m Tribler.Test.benchmark.bench_random_sampling
+
+Fills the Torrent table of a new database with NUM_TORRENTS torrents, of
+which COLLECTED_FRACTION are collected, and compares the ORDER BY random()
+query getRandomlyCollectedTorrents used to run with SQLiteCacheDB.getRandom,
+for a sample over all collected torrents and for one over the oldest tenth.
+"""
+import os
+import random
+import time
+
+from Tribler.Core.CacheDB.sqlitecachedb import infohash2db
+from Tribler.Test.benchmark import benchmark_session
+
+
+NUM_TORRENTS = 500000
+COLLECTED_FRACTION = 0.6
+NUM_CALLS = 50
+LIMIT = 25
+
+ORDER_BY_RANDOM_SQL = u"""
+    SELECT infohash, num_seeders, num_leechers, last_tracker_check FROM Torrent
+    WHERE is_collected == 1 AND insert_time < ? AND secret is not 1 ORDER BY random() LIMIT ?"""
+
+
+def fill_database(db):
+    db.executemany(u"INSERT INTO Torrent (infohash, name, insert_time, is_collected, num_seeders) VALUES (?,?,?,?,?)",
+                   [(infohash2db(os.urandom(20)), u"torrent %d" % i, i, int(random.random() < COLLECTED_FRACTION),
+                     random.randint(0, 1000)) for i in xrange(NUM_TORRENTS)])
+    # leave some holes in the ids
+    db.execute(u"DELETE FROM Torrent WHERE torrent_id % 7 == 0")
+    db.commit_now()
+
+
+def measure(func):
+    start = time.time()
+    for _ in xrange(NUM_CALLS):
+        rows = func()
+        assert len(rows) == LIMIT, len(rows)
+    return (time.time() - start) * 1000 / NUM_CALLS
+
+
+def main():
+    random.seed(0)
+    with benchmark_session() as session:
+        db = session.sqlite_db
+        fill_database(db)
+
+        for name, insert_time in (("all collected torrents", NUM_TORRENTS), ("oldest tenth", NUM_TORRENTS / 10)):
+            order_by_random = measure(lambda: db.fetchall(ORDER_BY_RANDOM_SQL, (insert_time, LIMIT)))
+            get_random = measure(lambda: db.getRandom(u"Torrent", (u"infohash", u"num_seeders", u"num_leechers",
+                                                                   u"last_tracker_check"), u"torrent_id", u"Torrent",
+                                                      where=u"is_collected == 1 AND insert_time < ? AND secret is not 1",
+                                                      args=(insert_time,), limit=LIMIT))
+            print "%d out of %s: ORDER BY random() %.2f ms, getRandom %.2f ms" % (LIMIT, name, order_by_random,
+                                                                                  get_random)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Measures the overhead of scheduling delayed tasks with 10k tasks pending.
+
+Usage: python -m Tribler.Test.benchmark.bench_rawserver
+
+Compares the timer wheel of TwistedRawServer with a named DelayedCall per
+task, as the raw server used to schedule them. The tasks are never run, only
+scheduled and cancelled, so the reactor is not started; its timer heap is
+updated the way a running reactor would.
+"""
+import random
+import timeit
+
+from twisted.internet import reactor
+
+from Tribler.Core.APIImplementation.TwistedRawServer import TwistedRawServer
+
+
+PENDING = 10000
+REPEAT = 5
+
+
+def noop():
+    pass
+
+
+def bench_wheel(delays):
+    rawserver = TwistedRawServer()
+    task_ids = [rawserver.add_task(noop, delay) for delay in delays]
+    reactor.runUntilCurrent()
+    timers = len(reactor.getDelayedCalls())
+    for task_id in task_ids:
+        rawserver.cancel_task(task_id)
+    rawserver.cancel_all_pending_tasks()
+    return timers
+
+
+def bench_delayed_calls(delays):
+    tasks = {}
+    for i, delay in enumerate(delays):
+        tasks["twisted_rawserver %d" % i] = reactor.callLater(delay, noop)
+    reactor._insertNewDelayedCalls()
+    timers = len(reactor.getDelayedCalls())
+    for call in tasks.itervalues():
+        call.cancel()
+    reactor.runUntilCurrent()
+    return timers
+
+
+def main():
+    delays = [random.uniform(0, 60) for _ in xrange(PENDING)]
+    for name, function in (("timer wheel", bench_wheel), ("delayed calls", bench_delayed_calls)):
+        seconds = min(timeit.repeat(lambda: function(delays), number=1, repeat=REPEAT))
+        print "%-15s %d tasks scheduled and cancelled in %.1f ms, %.2f us per task, %d reactor timers" % (
+            name, PENDING, seconds * 1000, seconds / PENDING * 1e6, function(delays))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Measures searching the names of torrents.
+
+Usage: python -m Tribler.Test.benchmark.bench_search
+
+Fills a new database with NUM_TORRENTS torrents, a fifth of which are in one
+or two of NUM_CHANNELS channels, one of which we marked as spam, and compares
+the searchNames implementation that merged and sorted every matching row in
+Python with TorrentDBHandler.searchNames, which ranks the torrents in SQLite,
+for a broad keyword matching half of the torrents and a narrow one. Remote
+searches return the 25 best results, local ones return all of them.
+"""
+import os
+import random
+import time
+from struct import unpack_from
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler, ChannelCastDBHandler, VoteCastDBHandler
+from Tribler.Core.CacheDB.sqlitecachedb import infohash2db, db2infohash
+from Tribler.Core.Utilities.search_utils import filter_keywords
+from Tribler.Test.benchmark import benchmark_session
+
+
+NUM_TORRENTS = 200000
+NUM_CHANNELS = 20
+VOCABULARY_SIZE = 5000
+NUM_CALLS = 10
+
+REMOTE_KEYS = ['infohash', 'T.name', 'T.length', 'T.num_files', 'T.category', 'T.creation_date', 'T.num_seeders',
+               'T.num_leechers']
+LOCAL_KEYS = ['T.torrent_id', 'infohash', 'T.name', 'length', 'category', 'status', 'num_seeders', 'num_leechers']
+
+
+def old_search_names(torrent_db, kws, local=True, keys=None, doSort=True):
+    assert 'infohash' in keys
+    assert not doSort or ('num_seeders' in keys or 'T.num_seeders' in keys)
+
+    infohash_index = keys.index('infohash')
+    num_seeders_index = keys.index('num_seeders') if 'num_seeders' in keys else -1
+
+    if num_seeders_index == -1:
+        doSort = False
+
+    values = ", ".join(keys)
+    mainsql = "SELECT " + values + ", C.channel_id, Matchinfo(FullTextIndex) FROM"
+    if local:
+        mainsql += " Torrent T"
+    else:
+        mainsql += " CollectedTorrent T"
+
+    mainsql += """, FullTextIndex
+                LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id
+                WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid AND C.deleted_at IS NULL AND FullTextIndex MATCH ?
+                """
+
+    if not local:
+        mainsql += "AND T.secret is not 1 LIMIT 250"
+
+    query = " ".join(filter_keywords(kws))
+    not_negated = [kw for kw in filter_keywords(kws) if kw[0] != '-']
+
+    results = torrent_db._db.fetchall(mainsql, (query,))
+
+    channels = set()
+    channel_dict = {}
+    for result in results:
+        if result[-2]:
+            channels.add(result[-2])
+
+    if len(channels) > 0:
+        # results are tuples of (id, str(dispersy_cid), name, description,
+        # nr_torrents, nr_favorites, nr_spam, my_vote, modified, id ==
+        # self._channel_id)
+        for channel in torrent_db.channelcast_db.getChannels(channels):
+            if channel[1] != '-1':
+                channel_dict[channel[0]] = channel
+
+    myChannelId = torrent_db.channelcast_db._channel_id or 0
+
+    result_dict = {}
+
+    # step 1, merge torrents keep one with best channel
+    for result in results:
+        channel_id = result[-2]
+        channel = channel_dict.get(channel_id, None)
+
+        infohash = db2infohash(result[infohash_index])
+        if channel:
+            # ignoring spam channels
+            if channel[7] < 0:
+                continue
+
+            # see if we have a better channel in torrents_dict
+            if infohash in result_dict:
+                old_channel = channel_dict.get(result_dict[infohash][-2], False)
+                if old_channel:
+
+                    # allways prefer my channel
+                    if old_channel[0] == myChannelId:
+                        continue
+
+                    # allways prefer channel with higher vote
+                    if channel[7] < old_channel[7]:
+                        continue
+
+                    votes = (channel[5] or 0) - (channel[6] or 0)
+                    oldvotes = (old_channel[5] or 0) - (old_channel[6] or 0)
+                    if votes < oldvotes:
+                        continue
+
+            result_dict[infohash] = result
+
+        elif infohash not in result_dict:
+            result_dict[infohash] = result
+
+    # step 2, fix all dict fields
+    dont_sort_list = []
+    results = [list(result) for result in result_dict.values()]
+    for i in xrange(len(results) - 1, -1, -1):
+        result = results[i]
+
+        result[infohash_index] = db2infohash(result[infohash_index])
+
+        matches = {'swarmname': set(), 'filenames': set(), 'fileextensions': set()}
+
+        # Matchinfo is documented at: http://www.sqlite.org/fts3.html#matchinfo
+        matchinfo = str(result[-1])
+        num_phrases, num_cols = unpack_from('II', matchinfo)
+        unpack_str = 'I' * (3 * num_cols * num_phrases)
+        matchinfo = unpack_from('II' + unpack_str, matchinfo)
+
+        swarmnames, filenames, fileextensions = [
+            [matchinfo[3 * (i + p * num_cols) + 2] for p in range(num_phrases)]
+            for i in range(num_cols)
+        ]
+
+        for i, keyword in enumerate(not_negated):
+            if swarmnames[i]:
+                matches['swarmname'].add(keyword)
+            if filenames[i]:
+                matches['filenames'].add(keyword)
+            if fileextensions[i]:
+                matches['fileextensions'].add(keyword)
+        result[-1] = matches
+
+        channel = channel_dict.get(result[-2], (result[-2], None, '', '', 0, 0, 0, 0, 0, False))
+        result.extend(channel)
+
+        if doSort and result[num_seeders_index] <= 0:
+            dont_sort_list.append(result)
+            results.pop(i)
+
+    if doSort:
+        def compare(a, b):
+            return cmp(a[num_seeders_index], b[num_seeders_index])
+        results.sort(compare, reverse=True)
+    results.extend(dont_sort_list)
+
+    if not local:
+        results = results[:25]
+
+    return results
+
+
+def fill_database(db):
+    vocabulary = [u"word%d" % i for i in xrange(VOCABULARY_SIZE)]
+    torrents = []
+    for i in xrange(NUM_TORRENTS):
+        words = random.sample(vocabulary, 4) + ([u"common"] if i % 2 else [])
+        torrents.append((i + 1, infohash2db(os.urandom(20)), u" ".join(words), random.randint(-1, 1000)))
+
+    db.executemany(u"INSERT INTO Torrent (torrent_id, infohash, name, num_seeders, is_collected) VALUES (?,?,?,?,1)",
+                   torrents)
+    db.executemany(u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES (?,?,'','')",
+                   [(torrent_id, name) for torrent_id, _, name, _ in torrents])
+    db.executemany(u"INSERT INTO _Channels (id, dispersy_cid, name, nr_favorite) VALUES (?,?,?,?)",
+                   [(i, u"cid%d" % i, u"channel %d" % i, random.randint(0, 100)) for i in xrange(1, NUM_CHANNELS + 1)])
+    db.executemany(u"INSERT INTO _ChannelTorrents (torrent_id, channel_id) VALUES (?,?)",
+                   [(torrent_id, random.randint(1, NUM_CHANNELS)) for torrent_id in xrange(1, NUM_TORRENTS + 1, 5)] +
+                   [(torrent_id, random.randint(1, NUM_CHANNELS)) for torrent_id in xrange(1, NUM_TORRENTS + 1, 50)])
+    db.execute(u"INSERT INTO _ChannelVotes (channel_id, voter_id, vote) VALUES (1, NULL, -1)")
+    db.commit_now()
+
+
+def measure(func):
+    start = time.time()
+    for _ in xrange(NUM_CALLS):
+        func()
+    return (time.time() - start) * 1000 / NUM_CALLS
+
+
+def main():
+    random.seed(0)
+    with benchmark_session() as session:
+        db = session.sqlite_db
+        fill_database(db)
+
+        torrent_db = TorrentDBHandler(session)
+        torrent_db.votecast_db = VoteCastDBHandler(session)
+        torrent_db.channelcast_db = ChannelCastDBHandler(session)
+        torrent_db.channelcast_db.votecast_db = torrent_db.votecast_db
+
+        for name, keyword in (("broad", u"common"), ("narrow", u"word42")):
+            for local, keys in ((False, REMOTE_KEYS), (True, LOCAL_KEYS)):
+                old = measure(lambda: old_search_names(torrent_db, [keyword], local=local, keys=keys, doSort=False))
+                new = measure(lambda: torrent_db.searchNames([keyword], local=local, keys=keys, doSort=False))
+                print "%-6s keyword, %-6s search: old %8.2f ms, new %8.2f ms" % (
+                    name, "local" if local else "remote", old, new)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measures the quality and latency of search suggestions for misspelled keywords.
+
+Usage: python -m Tribler.Test.benchmark.bench_search_suggestions
+
+Fills the full text index of a new database with NUM_TORRENTS torrent names
+made up of words from a random vocabulary and looks up NUM_QUERIES words with
+a single typo. The implementation getSearchSuggestion used to have, which
+matched the keyword against the names of all torrents and sorted them by the
+Levenshtein distance of their words, counts as correct when the top
+suggestion contains the original word. TorrentDBHandler.getSearchSuggestion
+counts as correct when it suggests the original word.
+"""
+import random
+import string
+import time
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
+from Tribler.Core.Utilities.term_index import levenshtein
+from Tribler.Test.benchmark import benchmark_session, load_search_terms
+
+
+NUM_TORRENTS = 100000
+VOCABULARY_SIZE = 20000
+WORDS_PER_NAME = 4
+NUM_QUERIES = 200
+
+
+def misspell(word):
+    i = random.randrange(len(word))
+    edit = random.choice(("delete", "insert", "substitute", "transpose"))
+    if edit == "delete":
+        return word[:i] + word[i + 1:]
+    if edit == "insert":
+        return word[:i] + random.choice(string.ascii_lowercase) + word[i:]
+    if edit == "substitute":
+        return word[:i] + random.choice(string.ascii_lowercase.replace(word[i], "")) + word[i + 1:]
+    i = min(i, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def old_search_suggestion(db, keywords, limit=1):
+    match = [keyword.lower() for keyword in keywords if len(keyword) > 3]
+
+    def distance(swarmname):
+        return sum(sorted([levenshtein(a, b) for a in swarmname.split() for b in match])[:len(match)])
+
+    results = db.fetchall(u"SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ?",
+                          (' OR '.join(['*%s*' % m for m in match]),))
+    return sorted([swarmname for swarmname, in results], key=distance)[:limit]
+
+
+def main():
+    random.seed(0)
+    vocabulary = set()
+    while len(vocabulary) < VOCABULARY_SIZE:
+        vocabulary.add(u"".join(random.choice(string.ascii_lowercase) for _ in xrange(random.randint(4, 10))))
+    vocabulary = sorted(vocabulary)
+
+    with benchmark_session() as session:
+        db = session.sqlite_db
+        db.executemany(u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES (?,?,'','')",
+                       [(i, u" ".join(random.sample(vocabulary, WORDS_PER_NAME))) for i in xrange(NUM_TORRENTS)])
+        db.commit_now()
+        torrent_db = TorrentDBHandler(session)
+
+        queries = []
+        known = set(vocabulary)
+        while len(queries) < NUM_QUERIES:
+            word = random.choice(vocabulary)
+            typo = misspell(word)
+            if typo not in known:
+                queries.append((word, typo))
+
+        load_time, batch_time = load_search_terms(torrent_db)
+
+        for name, suggest, is_correct in (
+                ("old", lambda typo: old_search_suggestion(db, [typo]),
+                 lambda word, suggestions: suggestions and word in suggestions[0].split()),
+                ("trigram index", lambda typo: torrent_db.getSearchSuggestion([typo]),
+                 lambda word, suggestions: suggestions == [word])):
+            correct = 0
+            start = time.time()
+            for word, typo in queries:
+                if is_correct(word, suggest(typo)):
+                    correct += 1
+            elapsed = time.time() - start
+            print "%-13s %3d%% correct, %7.2f ms per suggestion" % (name, correct * 100 / NUM_QUERIES,
+                                                                    elapsed * 1000 / NUM_QUERIES)
+        print "Loading the trigram index along with the prefix trie took %.2f s, at most %.0f ms per batch" % (
+            load_time, batch_time * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Measures loading torrents and decoding their file lists with TorrentDef.
+
+Usage: python -m Tribler.Test.benchmark.bench_tdef [torrent files]
+
+Without arguments the torrents in Tribler/Test/data are used, pass a set of
+real many-file torrents to get meaningful numbers.
+"""
+import glob
+import os
+import sys
+import timeit
+
+from Tribler.Core.TorrentDef import TorrentDef
+
+
+TESTS_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), u"data")
+REPEAT = 50
+
+
+def bench(statement, number=REPEAT):
+    return min(timeit.repeat(statement, number=number, repeat=3)) / number * 1000
+
+
+def main(filenames):
+    print "%-50s %7s %10s %10s %10s %10s" % ("torrent", "files", "load ms", "header ms", "files1 ms", "filesN ms")
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            data = f.read()
+
+        tdef = TorrentDef.load_from_memory(data)
+
+        def first_files_call():
+            tdef.metainfo_valid = True
+            tdef.get_files_as_unicode_with_length()
+
+        print "%-50s %7d %10.3f %10.3f %10.3f %10.3f" % (
+            os.path.basename(filename)[:50], len(tdef.get_files()),
+            bench(lambda: TorrentDef.load_from_memory(data)),
+            bench(lambda: TorrentDef.load_from_memory(data, header_only=True)),
+            bench(first_files_call),
+            bench(tdef.get_files_as_unicode_with_length))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join(TESTS_DATA_DIR, u"*.torrent"))))
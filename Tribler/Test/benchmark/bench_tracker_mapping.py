@@ -0,0 +1,140 @@
+"""
+Measures adding the trackers of collected torrents to the database.
+
+Usage: python -m Tribler.Test.benchmark.bench_tracker_mapping
+
+Creates NUM_TORRENTS collected torrents of PIECES_PER_TORRENT pieces and adds
+TRACKERS_PER_CALL trackers, picked from NUM_TRACKERS trackers, to every one of
+them. Compares the way addTorrentTrackerMappingInBatch used to do this, which
+looked up the trackers one query at a time and added them to the torrent file
+in the torrent store as well, with TorrentDBHandler.addTorrentTrackerMappingInBatch,
+which only stores the mappings. The torrent store is kept in memory, so the
+time spent writing the torrent files to disk is not included.
+"""
+import os
+import random
+import time
+from hashlib import sha1
+
+from libtorrent import bencode
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
+from Tribler.Core.CacheDB.sqlitecachedb import infohash2db
+from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.tracker_utils import get_uniformed_tracker_url
+from Tribler.Test.benchmark import BenchmarkSession, benchmark_session
+
+
+NUM_TORRENTS = 2000
+PIECES_PER_TORRENT = 500
+NUM_TRACKERS = 200
+TRACKERS_PER_CALL = 5
+
+
+class BenchmarkLaunchMany(object):
+
+    def __init__(self):
+        self.tracker_manager = None
+        self.torrent_store = {}
+
+
+class TorrentStoreSession(BenchmarkSession):
+
+    def __init__(self):
+        super(TorrentStoreSession, self).__init__()
+        self.lm = BenchmarkLaunchMany()
+
+    def get_torrent_store(self):
+        return True
+
+    def has_collected_torrent(self, infohash):
+        return infohash in self.lm.torrent_store
+
+    def get_collected_torrent(self, infohash):
+        return self.lm.torrent_store.get(infohash)
+
+    def save_collected_torrent(self, infohash, data):
+        self.lm.torrent_store[infohash] = data
+
+
+def old_add_tracker_mapping(torrent_db, session, torrent_id, tracker_list):
+    db = session.sqlite_db
+    parameters = u",".join(u"?" * len(tracker_list))
+    sql = u"SELECT tracker FROM TrackerInfo WHERE tracker IN (%s)" % parameters
+    found_tracker_list = [tracker for tracker, in db.fetchall(sql, tuple(tracker_list))]
+
+    # the tracker manager added the unknown trackers one at a time
+    for tracker in tracker_list:
+        if tracker not in found_tracker_list:
+            db.execute(u"INSERT INTO TrackerInfo(tracker, last_check, failures, is_alive) VALUES(?,?,?,?)",
+                       (tracker, 0, 0, True))
+
+    sql = u"INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id) " \
+          u"VALUES(?, (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?))"
+    db.executemany(sql, [(torrent_id, tracker) for tracker in tracker_list])
+
+    infohash = torrent_db.getInfohash(torrent_id)
+    if infohash and session.has_collected_torrent(infohash):
+        tdef = TorrentDef.load_from_memory(session.get_collected_torrent(infohash))
+
+        new_tracker_list = []
+        for tracker in tracker_list:
+            if tdef.get_tracker() and tracker == tdef.get_tracker():
+                continue
+            if tdef.get_tracker_hierarchy() and tracker in tdef.get_tracker_hierarchy():
+                continue
+            tracker = get_uniformed_tracker_url(tracker)
+            if tracker and [tracker] not in new_tracker_list:
+                new_tracker_list.append([tracker])
+
+        if tdef.get_tracker_hierarchy():
+            new_tracker_list = tdef.get_tracker_hierarchy() + new_tracker_list
+        if new_tracker_list:
+            tdef.set_tracker_hierarchy(new_tracker_list)
+            session.save_collected_torrent(infohash, bencode(tdef.metainfo))
+
+
+def create_torrents():
+    torrents = []
+    for i in xrange(NUM_TORRENTS):
+        info = {'name': 'torrent %d' % i, 'piece length': 2 ** 18, 'length': PIECES_PER_TORRENT * 2 ** 18,
+                'pieces': os.urandom(20 * PIECES_PER_TORRENT)}
+        torrents.append((sha1(bencode(info)).digest(), bencode({'announce': 'http://tracker%d.org/announce' % i,
+                                                               'info': info})))
+    return torrents
+
+
+def measure(torrents, trackers, add_tracker_mapping):
+    with benchmark_session(TorrentStoreSession()) as session:
+        db = session.sqlite_db
+        db.executemany(u"INSERT INTO Torrent (infohash, name) VALUES (?,?)",
+                       [(infohash2db(infohash), u"torrent") for infohash, _ in torrents])
+        session.lm.torrent_store.update(torrents)
+        db.commit_now()
+        torrent_db = TorrentDBHandler(session)
+
+        calls = [(torrent_db.getTorrentID(infohash), random.sample(trackers, TRACKERS_PER_CALL))
+                 for infohash, _ in torrents]
+        start = time.time()
+        for torrent_id, tracker_list in calls:
+            add_tracker_mapping(torrent_db, session, torrent_id, tracker_list)
+        elapsed = (time.time() - start) * 1000 / NUM_TORRENTS
+
+        assert db.fetchone(u"SELECT count(*) FROM TorrentTrackerMapping") == NUM_TORRENTS * TRACKERS_PER_CALL
+        return elapsed
+
+
+def main():
+    random.seed(0)
+    torrents = create_torrents()
+    trackers = [u"udp://tracker%d.example.org:80" % i for i in xrange(NUM_TRACKERS)]
+
+    old_time = measure(torrents, trackers, old_add_tracker_mapping)
+    new_time = measure(torrents, trackers, lambda torrent_db, session, torrent_id, tracker_list:
+                       torrent_db.addTorrentTrackerMappingInBatch(torrent_id, tracker_list))
+    print "Adding %d trackers to a torrent: with torrent file rewrite %.3f ms, mappings only %.3f ms" % (
+        TRACKERS_PER_CALL, old_time, new_time)
+
+
+if __name__ == "__main__":
+    main()
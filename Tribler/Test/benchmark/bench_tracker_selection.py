@@ -0,0 +1,89 @@
+"""
+Measures selecting the torrents to check on a tracker.
+
+Usage: python -m Tribler.Test.benchmark.bench_tracker_selection
+
+Fills a new database with NUM_TORRENTS torrents that are each mapped to
+TRACKERS_PER_TORRENT out of NUM_TRACKERS trackers, with one in DUE_FRACTION of
+them due for a check. Compares the join getTorrentsOnTracker used to run with
+TorrentDBHandler.getTorrentsOnTracker, which scans the torrents due on the
+tracker in TorrentTrackerNextCheckIndex. Also reports the cost of keeping that
+index up to date when storing a check result.
+"""
+import os
+import random
+import time
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
+from Tribler.Core.CacheDB.sqlitecachedb import infohash2db
+from Tribler.Test.benchmark import benchmark_session
+
+
+NUM_TORRENTS = 200000
+NUM_TRACKERS = 100
+TRACKERS_PER_TORRENT = 3
+DUE_FRACTION = 0.1
+NUM_SELECTIONS = 20
+NUM_RESULTS = 5000
+
+OLD_SELECTION_SQL = u"""
+    SELECT T.torrent_id, T.infohash, T.last_tracker_check
+      FROM Torrent T, TrackerInfo TI, TorrentTrackerMapping TTM
+      WHERE TI.tracker = ?
+      AND TI.tracker_id = TTM.tracker_id AND T.torrent_id = TTM.torrent_id
+      AND next_tracker_check < ?"""
+
+
+def main():
+    random.seed(0)
+    now = int(time.time())
+    with benchmark_session() as session:
+        db = session.sqlite_db
+        trackers = [u"udp://tracker%d.example.org:80" % i for i in xrange(NUM_TRACKERS)]
+        db.executemany(u"INSERT INTO TrackerInfo (tracker) VALUES (?)", [(tracker,) for tracker in trackers])
+        tracker_ids = [tracker_id for tracker_id, in db.fetchall(u"SELECT tracker_id FROM TrackerInfo "
+                                                                 u"WHERE tracker LIKE 'udp://%'")]
+        db.executemany(u"INSERT INTO Torrent (torrent_id, infohash, name, next_tracker_check) VALUES (?,?,?,?)",
+                       [(i, infohash2db(os.urandom(20)), u"torrent %d" % i,
+                         now - 1 if random.random() < DUE_FRACTION else now + 3600)
+                        for i in xrange(1, NUM_TORRENTS + 1)])
+        db.executemany(u"INSERT INTO TorrentTrackerMapping (torrent_id, tracker_id) VALUES (?,?)",
+                       [(i, tracker_id) for i in xrange(1, NUM_TORRENTS + 1)
+                        for tracker_id in random.sample(tracker_ids, TRACKERS_PER_TORRENT)])
+        db.commit_now()
+        torrent_db = TorrentDBHandler(session)
+
+        selected = [random.choice(trackers) for _ in xrange(NUM_SELECTIONS)]
+        start = time.time()
+        for tracker in selected:
+            old_result = db.fetchall(OLD_SELECTION_SQL, (tracker, now))
+        old_time = (time.time() - start) * 1000 / NUM_SELECTIONS
+
+        start = time.time()
+        for tracker in selected:
+            new_result = torrent_db.getTorrentsOnTracker(tracker, now)
+        new_time = (time.time() - start) * 1000 / NUM_SELECTIONS
+        assert sorted(torrent_id for torrent_id, _, _ in old_result) == \
+            sorted(torrent_id for torrent_id, _, _ in new_result)
+
+        print "Selecting %d due torrents on a tracker: join %.2f ms, index %.2f ms" % (
+            len(new_result), old_time, new_time)
+
+        torrents = db.fetchall(u"SELECT torrent_id, infohash FROM Torrent ORDER BY random() LIMIT ?", (NUM_RESULTS,))
+
+        def store_results(next_check):
+            start = time.time()
+            for torrent_id, infohash in torrents:
+                torrent_db.updateTorrentCheckResult(torrent_id, infohash, 1, 1, now, next_check, u"good", 0)
+            db.commit_now()
+            return (time.time() - start) * 1e6 / NUM_RESULTS
+
+        with_trigger = store_results(now + 7200)
+        db.execute(u"DROP TRIGGER tracker_next_check_update")
+        without_trigger = store_results(now + 10800)
+        print "Storing a check result: %.1f us, %.1f us without updating the index" % (with_trigger,
+                                                                                       without_trigger)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import json
+import os
+
+from Tribler.Category.Category import Category
+from Tribler.Test.test_as_server import BaseTestCase, TESTS_DATA_DIR
+
+
+class TestCategory(BaseTestCase):
+
+    def setUp(self):
+        super(TestCategory, self).setUp()
+        Category.delInstance()
+        install_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.category = Category.getInstance(install_dir)
+
+    def tearDown(self):
+        Category.delInstance()
+        super(TestCategory, self).tearDown()
+
+    def test_golden(self):
+        """
+        The categories of a set of generated torrents should match the ones of the original classifier.
+        """
+        with open(os.path.join(TESTS_DATA_DIR, "category_golden.json")) as f:
+            golden = json.load(f)
+
+        for display_name, files_list, category in golden:
+            self.assertEqual(self.category.calculateCategoryNonDict(files_list, display_name, '', ''), category,
+                             display_name)
+
+    def test_calculate_categories(self):
+        torrents = [({'info': {'name': 'movie.avi', 'length': 700 * 1024 * 1024}}, u'movie.avi'),
+                    ({'info': {'name': 'song.mp3', 'length': 5 * 1024 * 1024}}, u'song.mp3')]
+        self.assertEqual(self.category.calculateCategories(torrents),
+                         [self.category.calculateCategory(torrent, name) for torrent, name in torrents])
@@ -0,0 +1,78 @@
+from Tribler.Core.Modules.channel_injector import ChannelTorrentInjector
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class MockTorrentDef(object):
+
+    def __init__(self, infohash):
+        self.infohash = infohash
+
+    def get_infohash(self):
+        return self.infohash
+
+    def get_name_as_unicode(self):
+        return u"torrent"
+
+    def get_trackers_as_single_tuple(self):
+        return ()
+
+
+class MockObject(object):
+    pass
+
+
+class TestChannelTorrentInjector(BaseTestCase):
+
+    def setUp(self):
+        super(TestChannelTorrentInjector, self).setUp()
+        self.added = []
+        self.published = []
+
+        session = MockObject()
+        session.lm = MockObject()
+        session.lm.torrent_store = {}
+        session.lm.rtorrent_handler = MockObject()
+        session.lm.rtorrent_handler.notify_possible_torrent_infohash = lambda infohash: None
+        session.lm.torrent_db = MockObject()
+        session.lm.torrent_db.addExternalTorrents = self.added.extend
+        channel_community = MockObject()
+        channel_community._disp_create_torrents = self.published.append
+
+        self.injector = ChannelTorrentInjector(session, channel_community, batch_size=3, publish_rate=1)
+        self.injector._last_refill = 0
+
+    def queue(self, count):
+        for i in xrange(count):
+            self.injector._parsed.append((MockTorrentDef(chr(i) * 20), u"other", (), "data", None, None))
+
+    def test_flush_batches(self):
+        self.queue(5)
+        self.injector._flush()
+        self.assertEqual(len(self.added), 3)
+        self.assertEqual([len(batch) for batch in self.published], [3])
+        self.assertEqual(len(self.injector.session.lm.torrent_store), 3)
+
+        # no tokens are left until publish_rate refills them
+        self.injector._flush()
+        self.assertEqual(len(self.published), 1)
+
+        self.injector._last_refill -= 2
+        self.injector._flush()
+        self.assertEqual([len(batch) for batch in self.published], [3, 2])
+        self.assertEqual(self.injector.get_statistics()[u'published'], 5)
+
+    def test_flush_failure(self):
+        def fail(_):
+            raise ValueError(u"database is locked")
+        self.injector.session.lm.torrent_db.addExternalTorrents = fail
+
+        self.queue(3)
+        self.injector._flush()
+        self.assertEqual(self.injector.get_statistics()[u'failed'], 3)
+
+        # later batches are still published
+        self.injector.session.lm.torrent_db.addExternalTorrents = self.added.extend
+        self.injector._last_refill -= 3
+        self.queue(2)
+        self.injector._flush()
+        self.assertEqual(self.injector.get_statistics()[u'published'], 2)
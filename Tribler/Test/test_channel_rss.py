@@ -0,0 +1,133 @@
+import json
+import os
+
+from twisted.internet.defer import fail, succeed
+
+from Tribler.Core.Modules import channel_rss
+from Tribler.Core.Modules.cache import SimpleCache
+from Tribler.Core.Modules.channel_rss import ChannelRssParser, RSSFeedParser
+from Tribler.Test.test_as_server import AbstractServer
+
+
+class MockFeed(dict):
+
+    def __init__(self, entries=(), **kwargs):
+        super(MockFeed, self).__init__(**kwargs)
+        self.entries = list(entries)
+
+
+class MockInjector(object):
+
+    def __init__(self):
+        self.injected = []
+
+    def inject(self, torrent_data, callback=None, errback=None):
+        self.injected.append((torrent_data, callback, errback))
+
+
+class TestSimpleCache(AbstractServer):
+
+    def setUp(self):
+        super(TestSimpleCache, self).setUp()
+        self.file_path = os.path.join(self.session_base_dir, u"cache.txt")
+
+    def test_save_load(self):
+        cache = SimpleCache(self.file_path)
+        cache.load()
+        cache.add(u"http://a")
+        cache.add(u"http://b")
+        cache.save()
+        cache.add(u"http://c")
+        cache.save()
+
+        cache = SimpleCache(self.file_path)
+        cache.load()
+        self.assertTrue(all(cache.has(key) for key in (u"http://a", u"http://b", u"http://c")))
+        self.assertFalse(cache.has(u"http://d"))
+
+    def test_convert_old_format(self):
+        with open(self.file_path, 'wb') as f:
+            json.dump([u"http://a", u"http://b"], f)
+
+        cache = SimpleCache(self.file_path)
+        cache.load()
+        self.assertTrue(cache.has(u"http://a") and cache.has(u"http://b"))
+
+        # the file is rewritten with one key per line, new keys are appended
+        cache.add(u"http://c")
+        cache.save()
+        with open(self.file_path, 'rb') as f:
+            self.assertEqual(sorted(json.loads(line) for line in f), [u"http://a", u"http://b", u"http://c"])
+
+
+class TestChannelRssParser(AbstractServer):
+
+    def setUp(self):
+        super(TestChannelRssParser, self).setUp()
+        self.rss_parser = ChannelRssParser(None, None, u"http://localhost/rss")
+        self.rss_parser._url_cache = SimpleCache(os.path.join(self.session_base_dir, u"cache.txt"))
+        self.rss_parser._injector = MockInjector()
+
+        self.fetched = []
+        self.old_get_page = channel_rss.getPage
+        channel_rss.getPage = lambda url: self.fetched.append(url) or succeed("torrent data")
+
+    def tearDown(self):
+        channel_rss.getPage = self.old_get_page
+        super(TestChannelRssParser, self).tearDown()
+
+    def test_conditional_request(self):
+        feed = MockFeed([{u'link': u"http://localhost/1.torrent", u'title': u"one"}], status=200, etag=u"abc",
+                        modified=u"Mon, 19 Oct 2015 10:00:00 GMT")
+        self.rss_parser._on_got_feed(feed, RSSFeedParser())
+        self.assertEqual(self.fetched, ["http://localhost/1.torrent"])
+        self.assertEqual(self.rss_parser._etag, u"abc")
+        self.assertEqual(self.rss_parser._modified, u"Mon, 19 Oct 2015 10:00:00 GMT")
+
+        # the validators are sent along with the next request
+        requests = []
+        old_parse = channel_rss.feedparser.parse
+        channel_rss.feedparser.parse = lambda url, etag=None, modified=None: requests.append((etag, modified))
+        try:
+            RSSFeedParser().fetch(self.rss_parser.rss_url, self.rss_parser._etag, self.rss_parser._modified)
+        finally:
+            channel_rss.feedparser.parse = old_parse
+        self.assertEqual(requests, [(u"abc", u"Mon, 19 Oct 2015 10:00:00 GMT")])
+
+        # a feed that has not been modified keeps the validators and fetches nothing
+        self.rss_parser._on_got_feed(MockFeed(status=304), RSSFeedParser())
+        self.assertEqual(len(self.fetched), 1)
+        self.assertEqual(self.rss_parser._etag, u"abc")
+
+    def scrape(self, feed):
+        # the feed is returned as it is unless the request carries its etag, then it has not been modified
+        if self.rss_parser._etag is not None and self.rss_parser._etag == feed.get(u'etag'):
+            feed = MockFeed(status=304)
+        self.rss_parser._on_got_feed(feed, RSSFeedParser())
+
+    def test_retry_failed_torrents(self):
+        feed = MockFeed([{u'link': u"http://localhost/1.torrent", u'title': u"one"}], status=200, etag=u"abc")
+        self.scrape(feed)
+        _, _, errback = self.rss_parser._injector.injected[0]
+        errback()
+        self.assertFalse(self.rss_parser._pending_urls)
+
+        # the torrent is fetched again on the next scrape
+        self.scrape(feed)
+        self.assertEqual(len(self.fetched), 2)
+
+        _, _, errback = self.rss_parser._injector.injected[1]
+        errback()
+        channel_rss.getPage = lambda url: fail(IOError(u"connection refused"))
+        self.scrape(feed)
+        self.assertFalse(self.rss_parser._pending_urls)
+
+        channel_rss.getPage = lambda url: self.fetched.append(url) or succeed("torrent data")
+        self.scrape(feed)
+        self.assertEqual(len(self.fetched), 3)
+
+        # once the torrent is injected, the feed is not modified anymore
+        _, callback, _ = self.rss_parser._injector.injected[-1]
+        callback()
+        self.scrape(feed)
+        self.assertEqual(len(self.fetched), 3)
@@ -0,0 +1,86 @@
+import os
+
+from twisted.internet.task import Clock
+
+from Tribler.Core.APIImplementation.CheckpointWriter import CheckpointWriter
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Test.test_as_server import AbstractServer
+
+
+class ThreadlessClock(Clock):
+
+    def callFromThread(self, f, *args, **kwargs):
+        f(*args, **kwargs)
+
+
+class ClockedCheckpointWriter(CheckpointWriter):
+    _reactor = ThreadlessClock()
+
+
+class TestCheckpointWriter(AbstractServer):
+
+    def setUp(self, annotate=True):
+        super(TestCheckpointWriter, self).setUp(annotate=annotate)
+        ClockedCheckpointWriter._reactor = ThreadlessClock()
+        self.clock = ClockedCheckpointWriter._reactor
+        self.writer = ClockedCheckpointWriter(self.session_base_dir, write_delay=1.0)
+
+    def create_pstate(self, progress):
+        pstate = CallbackConfigParser()
+        pstate.add_section('state')
+        pstate.set('state', 'engineresumedata', {'progress': progress, 'pieces': '\x01\x00'})
+        return pstate
+
+    def test_write_batch(self):
+        self.assertEqual(self.writer.write_batch({'a' * 20: self.create_pstate(0.5)}), 1)
+
+        filename = self.writer.get_filename('a' * 20)
+        pstate = CallbackConfigParser()
+        pstate.read_file(filename)
+        self.assertEqual(pstate.get('state', 'engineresumedata'), {'progress': 0.5, 'pieces': '\x01\x00'})
+        self.assertEqual(os.listdir(self.session_base_dir), [os.path.basename(filename)])
+
+    def test_write_unchanged(self):
+        self.writer.write_batch({'a' * 20: self.create_pstate(0.5)})
+        self.assertEqual(self.writer.write_batch({'a' * 20: self.create_pstate(0.5)}), 0)
+        self.assertEqual(self.writer.write_batch({'a' * 20: self.create_pstate(0.6)}), 1)
+
+        self.writer.set_written('b' * 20, self.create_pstate(0.5))
+        self.assertEqual(self.writer.write_batch({'b' * 20: self.create_pstate(0.5)}), 0)
+        self.assertEqual(self.writer.num_unchanged, 2)
+
+    def test_write_metainfo_changed(self):
+        metainfo = {'info': {'name': 'a', 'pieces': '\x00' * 20}, 'announce': 'http://tracker/announce'}
+        pstate = self.create_pstate(0.5)
+        pstate.set('state', 'metainfo', metainfo)
+        self.writer.write_batch({'a' * 20: pstate})
+        self.assertEqual(self.writer.write_batch({'a' * 20: pstate}), 0)
+
+        # the info dictionary is not copied, but changes to the rest of the metainfo are written
+        self.assertNotIn('info', dict(dict(self.writer._written['a' * 20])['state'])['metainfo'])
+        metainfo['announce-list'] = [['http://tracker/announce']]
+        self.assertEqual(self.writer.write_batch({'a' * 20: pstate}), 1)
+
+    def test_discard(self):
+        self.writer.save('a' * 20, self.create_pstate(0.5))
+        self.writer.discard('a' * 20)
+        self.assertEqual(self.writer.get_pending_count(), 0)
+        self.assertEqual(self.writer.write_batch({'a' * 20: self.create_pstate(0.5)}), 0)
+        self.assertFalse(os.path.exists(self.writer.get_filename('a' * 20)))
+
+    def test_save_batched(self):
+        self.writer.save('a' * 20, self.create_pstate(0.1))
+        self.writer.save('a' * 20, self.create_pstate(0.2))
+        self.writer.save('b' * 20, self.create_pstate(0.1))
+        self.assertEqual(self.writer.get_pending_count(), 2)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.assertEqual(self.clock.getDelayedCalls()[0].getTime(), 1.0)
+
+    def test_flush(self):
+        self.writer.save('a' * 20, self.create_pstate(0.1))
+        self.writer.flush()
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.assertEqual(self.clock.getDelayedCalls()[0].getTime(), 0)
+
+    def test_flush_nothing_pending(self):
+        self.assertTrue(self.writer.flush().called)
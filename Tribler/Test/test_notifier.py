@@ -0,0 +1,64 @@
+from threading import Event
+
+from Tribler.Core.CacheDB.Notifier import Notifier
+from Tribler.Core.simpledefs import NTFY_TORRENTS, NTFY_INSERT, NTFY_UPDATE, NTFY_CHANNELCAST
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class TestNotifier(BaseTestCase):
+
+    def setUp(self):
+        super(TestNotifier, self).setUp()
+        Notifier.delInstance()
+        self.notifier = Notifier.getInstance()
+        self.called = []
+
+    def tearDown(self):
+        Notifier.delInstance()
+        super(TestNotifier, self).tearDown()
+
+    def callback(self, *args):
+        self.called.append(args)
+
+    def test_notify(self):
+        self.notifier.add_observer(self.callback, NTFY_TORRENTS, [NTFY_INSERT])
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, "a", "b")
+        self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, "a")
+        self.notifier.notify(NTFY_CHANNELCAST, NTFY_INSERT, "a")
+        self.assertEqual(self.called, [(NTFY_TORRENTS, NTFY_INSERT, "a", "b")])
+
+    def test_notify_id(self):
+        self.notifier.add_observer(self.callback, NTFY_TORRENTS, [NTFY_INSERT], id="a")
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, "a")
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, "b")
+        self.assertEqual(self.called, [(NTFY_TORRENTS, NTFY_INSERT, "a")])
+
+    def test_remove_observer(self):
+        self.notifier.add_observer(self.callback, NTFY_TORRENTS, [NTFY_INSERT, NTFY_UPDATE])
+        self.notifier.remove_observer(self.callback)
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, "a")
+        self.assertEqual(self.called, [])
+        self.assertEqual(self.notifier.observers, {})
+
+    def test_coalesce(self):
+        delivered = Event()
+
+        def callback(events):
+            self.called.append(events)
+            delivered.set()
+
+        self.notifier.add_observer(callback, NTFY_TORRENTS, [NTFY_INSERT], cache=0.1)
+        for infohash in ("a", "b", "c"):
+            self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, infohash)
+
+        self.assertTrue(delivered.wait(5))
+        self.assertEqual([args[2] for args in self.called[0]], ["a", "b", "c"])
+        self.assertEqual(len(self.called), 1)
+
+    def test_event_rates(self):
+        for _ in xrange(10):
+            self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, "a")
+        rates = self.notifier.get_event_rates()
+        self.assertEqual(self.notifier.event_counts[NTFY_TORRENTS], 10)
+        self.assertGreater(rates[NTFY_TORRENTS], 0)
+        self.assertNotIn(NTFY_CHANNELCAST, rates)
@@ -0,0 +1,31 @@
+from Tribler.Core.Libtorrent.PieceBitfield import PieceBitfield
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class TestPieceBitfield(BaseTestCase):
+
+    def setUp(self):
+        self.bitfield = PieceBitfield([True, True, False, True, False, True])
+
+    def test_progress(self):
+        self.assertEqual(self.bitfield.get_progress([(0, 4)]), 0.75)
+        self.assertEqual(self.bitfield.get_progress([(0, 2), (3, 4)]), 1.0)
+        self.assertEqual(self.bitfield.get_progress([]), 1.0)
+
+    def test_progress_overlapping(self):
+        self.assertEqual(self.bitfield.get_progress([(0, 3), (1, 4)]), 0.75)
+
+    def test_progress_consecutive(self):
+        self.assertEqual(self.bitfield.get_progress([(0, 6)], consecutive=True), 2.0 / 6)
+        self.assertEqual(self.bitfield.get_progress([(3, 4), (0, 2)], consecutive=True), 1.0)
+
+    def test_progress_beyond_end(self):
+        self.assertEqual(self.bitfield.get_progress([(5, 8)]), 1.0 / 3)
+        self.assertEqual(self.bitfield.get_progress([(5, 8)], consecutive=True), 1.0 / 3)
+
+    def test_set_piece(self):
+        self.bitfield.set_piece(2)
+        self.bitfield.set_piece(10)
+        self.assertTrue(self.bitfield.has_piece(2))
+        self.assertFalse(self.bitfield.has_piece(10))
+        self.assertEqual(len(self.bitfield), 6)
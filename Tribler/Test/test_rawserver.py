@@ -0,0 +1,81 @@
+from twisted.internet.task import Clock
+
+from Tribler.Core.APIImplementation.TwistedRawServer import TwistedRawServer
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class ThreadlessClock(Clock):
+
+    def callFromThread(self, f, *args, **kwargs):
+        f(*args, **kwargs)
+
+
+class ClockedRawServer(TwistedRawServer):
+    _reactor = ThreadlessClock()
+
+
+class TestTwistedRawServer(BaseTestCase):
+
+    def setUp(self):
+        super(TestTwistedRawServer, self).setUp()
+        ClockedRawServer._reactor = ThreadlessClock()
+        self.clock = ClockedRawServer._reactor
+        self.rawserver = ClockedRawServer(granularity=0.1, wheel_size=16)
+        self.called = []
+
+    def tearDown(self):
+        self.rawserver.cancel_all_pending_tasks()
+        super(TestTwistedRawServer, self).tearDown()
+
+    def test_add_task(self):
+        self.rawserver.add_task(lambda: self.called.append(2), 0.5)
+        self.rawserver.add_task(lambda: self.called.append(1), 0.2)
+        self.clock.advance(0.3)
+        self.assertEqual(self.called, [1])
+        self.clock.pump([0.1] * 3)
+        self.assertEqual(self.called, [1, 2])
+        self.assertEqual(self.rawserver.get_pending_task_count(), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_batched(self):
+        for i in xrange(100):
+            self.rawserver.add_task(lambda i=i: self.called.append(i), 1.0)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.pump([0.1] * 11)
+        self.assertEqual(self.called, range(100))
+
+    def test_later_rotation(self):
+        self.rawserver.add_task(lambda: self.called.append(1), 2.0)
+        self.clock.pump([0.1] * 16)
+        self.assertEqual(self.called, [])
+        self.clock.pump([0.1] * 5)
+        self.assertEqual(self.called, [1])
+
+    def test_cancel_task(self):
+        task_id = self.rawserver.add_task(lambda: self.called.append(1), 0.2)
+        self.assertTrue(self.rawserver.cancel_task(task_id))
+        self.assertFalse(self.rawserver.cancel_task(task_id))
+        self.clock.pump([0.1] * 3)
+        self.assertEqual(self.called, [])
+
+    def test_idle_slots(self):
+        # the reactor is only woken up when the task is due
+        self.rawserver.add_task(lambda: self.called.append(2), 5.0)
+        self.assertEqual([call.getTime() for call in self.clock.getDelayedCalls()], [5.0])
+
+        # an earlier task moves the call forward
+        self.rawserver.add_task(lambda: self.called.append(1), 1.0)
+        self.assertEqual([call.getTime() for call in self.clock.getDelayedCalls()], [1.0])
+        self.clock.advance(1.0)
+        self.assertEqual(self.called, [1])
+        self.assertEqual([call.getTime() for call in self.clock.getDelayedCalls()], [5.0])
+        self.clock.advance(4.0)
+        self.assertEqual(self.called, [1, 2])
+
+    def test_no_delay(self):
+        self.rawserver.add_task(lambda: self.called.append(2), 0.05)
+        self.rawserver.add_task(lambda: self.called.append(1), 0)
+        self.clock.advance(0)
+        self.assertEqual(self.called, [1])
+        self.clock.advance(0.1)
+        self.assertEqual(self.called, [1, 2])
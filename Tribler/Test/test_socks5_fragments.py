@@ -0,0 +1,58 @@
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.tunnel.Socks5 import conversion
+from Tribler.community.tunnel.Socks5.server import UdpFragmentReassembler
+
+
+DESTINATION = ("1.2.3.4", 5678)
+
+
+def fragment(frag, payload, destination=DESTINATION):
+    data = conversion.encode_udp_packet(0, frag, conversion.ADDRESS_TYPE_IPV4, destination[0], destination[1],
+                                        payload)
+    frag, _, destination, offset = conversion.decode_udp_header(data)
+    return frag, destination, data, offset
+
+
+class TestUdpFragmentReassembler(BaseTestCase):
+
+    def setUp(self):
+        self.reassembler = UdpFragmentReassembler(max_size=10, timeout=5.0)
+
+    def test_decode_udp_header(self):
+        frag, destination, data, offset = fragment(0x81, "payload")
+        self.assertEqual(frag, 0x81)
+        self.assertEqual(destination, DESTINATION)
+        self.assertEqual(data[offset:], "payload")
+        self.assertEqual(conversion.decode_udp_packet(data).payload, "payload")
+
+    def test_reassemble(self):
+        self.assertIsNone(self.reassembler.feed(*fragment(1, "abc"), now=0))
+        self.assertIsNone(self.reassembler.feed(*fragment(2, "def"), now=1))
+        self.assertEqual(self.reassembler.feed(*fragment(0x83, "gh"), now=2), "abcdefgh")
+        self.assertEqual(self.reassembler.fragments, [])
+
+    def test_lower_frag_resets(self):
+        self.reassembler.feed(*fragment(1, "abc"), now=0)
+        self.reassembler.feed(*fragment(2, "def"), now=0)
+        self.assertIsNone(self.reassembler.feed(*fragment(1, "xyz"), now=0))
+        self.assertEqual(self.reassembler.feed(*fragment(0x82, "!"), now=0), "xyz!")
+
+    def test_timeout_resets(self):
+        self.reassembler.feed(*fragment(1, "abc"), now=0)
+        self.assertIsNone(self.reassembler.feed(*fragment(0x82, "def"), now=6))
+        self.assertEqual(self.reassembler.fragments, [])
+
+    def test_missing_fragment(self):
+        self.reassembler.feed(*fragment(1, "abc"), now=0)
+        self.assertIsNone(self.reassembler.feed(*fragment(3, "ghi"), now=0))
+        self.assertIsNone(self.reassembler.feed(*fragment(0x84, "j"), now=0))
+        self.assertEqual(self.reassembler.fragments, [])
+
+        # a sequence that does not start at the first fragment is dropped as well
+        self.assertIsNone(self.reassembler.feed(*fragment(2, "def"), now=0))
+        self.assertIsNone(self.reassembler.feed(*fragment(0x83, "ghi"), now=0))
+
+    def test_max_size(self):
+        self.reassembler.feed(*fragment(1, "abcdef"), now=0)
+        self.assertIsNone(self.reassembler.feed(*fragment(0x82, "ghijkl"), now=0))
+        self.assertEqual(self.reassembler.size, 0)
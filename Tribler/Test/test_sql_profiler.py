@@ -0,0 +1,43 @@
+from Tribler.Core.CacheDB.sql_profiler import SQLProfiler, normalize_sql
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class TestSQLProfiler(BaseTestCase):
+
+    def setUp(self):
+        self.explained = []
+        self.profiler = SQLProfiler(self.explain, slow_query_threshold=1.0)
+
+    def explain(self, sql, args):
+        self.explained.append(sql)
+        return [u"SCAN TABLE Torrent"]
+
+    def test_normalize(self):
+        self.assertEqual(normalize_sql(u"SELECT name FROM Torrent\n  WHERE torrent_id = 12 AND name = 'it''s'"),
+                         u"SELECT name FROM Torrent WHERE torrent_id = ? AND name = ?")
+        self.assertEqual(normalize_sql(u"SELECT * FROM Torrent WHERE torrent_id IN (?,?, ?) LIMIT 5"),
+                         u"SELECT * FROM Torrent WHERE torrent_id IN (?, ...) LIMIT ?")
+        self.assertEqual(normalize_sql(u"SELECT * FROM _ChannelTorrents2 WHERE num_seeders > -1.5"),
+                         u"SELECT * FROM _ChannelTorrents2 WHERE num_seeders > ?")
+
+    def test_statistics(self):
+        for i in xrange(100):
+            self.profiler.record(u"SELECT name FROM Torrent WHERE torrent_id = %d" % i, None, i / 1000.0, 1)
+        self.profiler.record(u"DELETE FROM Torrent", None, 0.5)
+
+        statistics = self.profiler.get_statistics()
+        self.assertEqual([query[u'template'] for query in statistics],
+                         [u"SELECT name FROM Torrent WHERE torrent_id = ?", u"DELETE FROM Torrent"])
+        self.assertEqual(statistics[0][u'count'], 100)
+        self.assertEqual(statistics[0][u'rows'], 100)
+        self.assertAlmostEqual(statistics[0][u'p99_time'], 0.099)
+        self.assertAlmostEqual(statistics[0][u'max_time'], 0.099)
+
+    def test_slow_query(self):
+        self.profiler.record(u"SELECT name FROM Torrent WHERE torrent_id = 1", None, 0.5)
+        self.assertEqual(self.explained, [])
+
+        self.profiler.record(u"SELECT name FROM Torrent WHERE torrent_id = 1", None, 1.5)
+        self.profiler.record(u"SELECT name FROM Torrent WHERE torrent_id = 2", None, 1.5)
+        self.profiler.record(u"COMMIT", None, 1.5)
+        self.assertEqual(self.explained, [u"SELECT name FROM Torrent WHERE torrent_id = 1"])
@@ -104,3 +104,53 @@ class TestSqliteCacheDB(AbstractServer):
         self.sqlite_test.update('person', "lastname == '4'", firstname=654, lastname=44)
         one = self.sqlite_test.fetchone("select firstname from person where lastname == 44")
         assert one == 654, one
+
+    @blocking_call_on_reactor_thread
+    def test_profiling(self):
+        self.test_insertmany()
+        self.assertIsNone(self.sqlite_test.get_profiling_statistics())
+
+        self.sqlite_test.set_profiling(True, slow_query_threshold=0)
+        self.sqlite_test.fetchall(u"SELECT firstname FROM person WHERE lastname == '1'")
+        self.sqlite_test.fetchall(u"SELECT firstname FROM person WHERE lastname == '2'")
+        self.sqlite_test.execute(u"DELETE FROM person WHERE lastname == ?", ('3',))
+        # callers read the rows from the result like from a cursor
+        firstname, = self.sqlite_test.execute(u"SELECT firstname FROM person WHERE lastname == ?", ('1',)).next()
+        self.assertEqual(firstname, '1')
+
+        statistics = dict((query[u'template'], query) for query in self.sqlite_test.get_profiling_statistics())
+        self.assertEqual(statistics[u"SELECT firstname FROM person WHERE lastname == ?"][u'count'], 3)
+        self.assertEqual(statistics[u"SELECT firstname FROM person WHERE lastname == ?"][u'rows'], 3)
+        self.assertEqual(statistics[u"DELETE FROM person WHERE lastname == ?"][u'count'], 1)
+
+    @blocking_call_on_reactor_thread
+    def test_getRandom(self):
+        self.sqlite_test.execute(u"CREATE TABLE number(id INTEGER PRIMARY KEY, value INTEGER);")
+        self.sqlite_test.executemany(u"INSERT INTO number (id, value) VALUES (?, ?)",
+                                     [(i, i % 10) for i in range(1, 1001)])
+        self.sqlite_test.execute(u"DELETE FROM number WHERE id > 200 AND id <= 800")
+
+        rows = self.sqlite_test.getRandom(u"number", (u"id", u"value"), u"id", u"number", limit=50)
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(len(set(rows)), 50)
+        self.assertTrue(all(value == row_id % 10 and (row_id <= 200 or row_id > 800) for row_id, value in rows))
+
+        # only 2 rows match, which are found by the fallback
+        rows = self.sqlite_test.getRandom(u"number", u"id", u"id", u"number", where=u"value == ? AND id < ?",
+                                          args=(3, 20), limit=5)
+        self.assertEqual(sorted(rows), [(3,), (13,)])
+
+        self.assertEqual(self.sqlite_test.getRandom(u"number", u"id", u"id", u"number", where=u"value > 10"), [])
+
+    @blocking_call_on_reactor_thread
+    def test_getRandom_distribution(self):
+        self.sqlite_test.execute(u"CREATE TABLE number(id INTEGER PRIMARY KEY, value INTEGER);")
+        self.sqlite_test.executemany(u"INSERT INTO number (id, value) VALUES (?, ?)",
+                                     [(i, i % 10) for i in range(1, 1001)])
+
+        # more ids are drawn than rows are returned, which should not favour the low ids
+        sampled = [row_id for _ in xrange(200)
+                   for row_id, in self.sqlite_test.getRandom(u"number", u"id", u"id", u"number", limit=10)]
+        self.assertEqual(len(sampled), 2000)
+        self.assertAlmostEqual(sum(sampled) / float(len(sampled)), 500.5, delta=40)
+        self.assertAlmostEqual(sum(1 for row_id in sampled if row_id > 500) / float(len(sampled)), 0.5, delta=0.1)
@@ -1,5 +1,5 @@
 from Tribler.Core.CacheDB.db_versions import LATEST_DB_VERSION
-from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, bin2str, db2infohash
 from Tribler.Core.Session import Session
 from Tribler.Core.SessionConfig import SessionStartupConfig
 from Tribler.Core.Upgrade.db_upgrader import DBUpgrader, VersionNoLongerSupportedError
@@ -51,6 +51,43 @@ class TestSqliteCacheDB(AbstractServer):
         db_migrator = DBUpgrader(self.session, self.sqlitedb, torrent_store=MockTorrentStore())
         self.assertRaises(VersionNoLongerSupportedError, db_migrator.start_migrate)
 
+    def test_upgrade_from_27(self):
+        """Version 28 stores the infohashes as BLOBs instead of base64 encoded text"""
+        dbpath = init_bak_tribler_sdb(u"bak_new_tribler.sdb", destination_path=self.getStateDir(), overwrite=True)
+
+        self.sqlitedb = SQLiteCacheDB(self.session)
+        self.sqlitedb.initialize(dbpath)
+
+        # turn the database back into a version 27 one
+        infohashes = dict((torrent_id, db2infohash(infohash)) for torrent_id, infohash in
+                          self.sqlitedb.fetchall(u"SELECT torrent_id, infohash FROM Torrent"))
+        self.sqlitedb.execute(u"DROP INDEX infohash_idx")
+        self.sqlitedb.execute(u"DROP INDEX ChannelVotesCountIndex")
+        for trigger in (u"insert", u"update", u"delete", u"channel_insert"):
+            self.sqlitedb.execute(u"DROP TRIGGER channel_votes_%s" % trigger)
+        self.sqlitedb.execute(u"""
+DROP TRIGGER tracker_next_check_update;
+CREATE TABLE _TorrentTrackerMapping AS SELECT torrent_id, tracker_id FROM TorrentTrackerMapping;
+DROP TABLE TorrentTrackerMapping;
+ALTER TABLE _TorrentTrackerMapping RENAME TO TorrentTrackerMapping;
+""")
+        self.sqlitedb.executemany(u"UPDATE Torrent SET infohash = ? WHERE torrent_id = ?",
+                                  [(bin2str(infohash), torrent_id) for torrent_id, infohash in infohashes.iteritems()])
+        self.sqlitedb.write_version(27)
+
+        db_migrator = DBUpgrader(self.session, self.sqlitedb, torrent_store=None)
+        db_migrator.start_migrate()
+
+        self.assertEqual(self.sqlitedb.version, LATEST_DB_VERSION)
+        upgraded = dict((torrent_id, db2infohash(infohash)) for torrent_id, infohash in
+                        self.sqlitedb.fetchall(u"SELECT torrent_id, infohash FROM Torrent"))
+        self.assertEqual(upgraded, infohashes)
+        self.assertEqual(self.sqlitedb.fetchone(u"SELECT count(*) FROM CollectedTorrent"),
+                         self.sqlitedb.fetchone(u"SELECT count(*) FROM Torrent WHERE is_collected == 1"))
+        # version 29 computes the eviction weights of the existing torrents
+        self.assertEqual(self.sqlitedb.fetchone(u"SELECT count(*) FROM Torrent WHERE eviction_date_weight IS NULL "
+                                                u"AND creation_date IS NOT NULL AND num_seeders IS NOT NULL"), 0)
+
     def test_upgrade_from_17(self):
         pass
         # TODO(emilon): Implement that one and 18 22 23
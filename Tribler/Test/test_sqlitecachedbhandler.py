@@ -8,12 +8,15 @@ from unittest.case import skip
 from twisted.internet import reactor
 
 from Tribler.Category.Category import Category
+from Tribler.Core.CacheDB import SqliteCacheDBHandler
 from Tribler.Core.CacheDB.SqliteCacheDBHandler import (TorrentDBHandler, MyPreferenceDBHandler, BasicDBHandler,
-                                                       PeerDBHandler)
-from Tribler.Core.CacheDB.sqlitecachedb import str2bin, SQLiteCacheDB
+                                                       PeerDBHandler, VoteCastDBHandler, ChannelCastDBHandler,
+                                                       SEARCH_TERMS_BATCH_SIZE)
+from Tribler.Core.CacheDB.sqlitecachedb import str2bin, SQLiteCacheDB, infohash2db, parse_matchinfo
 from Tribler.Core.Session import Session
 from Tribler.Core.SessionConfig import SessionStartupConfig
 from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.term_index import PrefixTrie
 from Tribler.Test.bak_tribler_sdb import TESTS_DATA_DIR, init_bak_tribler_sdb
 from Tribler.Test.test_as_server import AbstractServer
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
@@ -84,6 +87,73 @@ class TestSqliteBasicDBHandler(AbstractDB):
         assert size == 3987, size
 
 
+class TestSqliteCacheDBMaintenance(AbstractDB):
+
+    def count_orphans(self):
+        return self.sqlitedb.fetchone(u"SELECT count(*) FROM TorrentFiles WHERE torrent_id IN "
+                                      u"(SELECT torrent_id FROM CollectedTorrent)")
+
+    def count_nameless(self):
+        return self.sqlitedb.fetchone(u"SELECT count(*) FROM Torrent WHERE name IS NULL")
+
+    @blocking_call_on_reactor_thread
+    def test_delete_orphans(self):
+        collected_ids = [torrent_id for torrent_id, in
+                         self.sqlitedb.fetchall(u"SELECT torrent_id FROM CollectedTorrent LIMIT 50")]
+        self.sqlitedb.executemany(u"INSERT INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)",
+                                  [(torrent_id, u"file", 1) for torrent_id in collected_ids])
+        self.sqlitedb.execute_write(u"UPDATE Torrent SET name = NULL WHERE torrent_id IN "
+                                    u"(SELECT torrent_id FROM Torrent ORDER BY torrent_id DESC LIMIT 50)")
+        orphans = self.count_orphans()
+        nameless = self.count_nameless()
+        assert orphans >= 50 and nameless >= 50, (orphans, nameless)
+
+        max_torrent_id = self.sqlitedb.fetchone(u"SELECT max(torrent_id) FROM Torrent")
+        deleted = 0
+        for _ in xrange(max_torrent_id // 100 + 1):
+            deleted += self.sqlitedb._delete_orphans(100)
+        self.assertEqual(deleted, orphans)
+        self.assertEqual(self.count_orphans(), 0)
+        self.assertEqual(self.sqlitedb.get_maintenance_statistics()[u'orphans_deleted'], orphans)
+
+        # the torrents without a name are only deleted on exit, unless they are referenced
+        self.assertEqual(self.count_nameless(), nameless)
+        mypref_id, tracker_mapping_id = self.sqlitedb.fetchall(u"SELECT torrent_id FROM Torrent WHERE name IS NULL "
+                                                               u"AND torrent_id NOT IN (SELECT torrent_id FROM "
+                                                               u"_ChannelTorrents) LIMIT 2")
+        self.sqlitedb.execute(u"INSERT INTO MyPreference (torrent_id, destination_path, creation_time) "
+                              u"VALUES (?, '', 0)", mypref_id)
+        self.sqlitedb.execute(u"INSERT INTO TorrentTrackerMapping (torrent_id, tracker_id) VALUES (?, 1)",
+                              tracker_mapping_id)
+        self.sqlitedb.clean_db(exiting=True)
+        remaining = [torrent_id for torrent_id, in self.sqlitedb.fetchall(
+            u"SELECT torrent_id FROM Torrent WHERE name IS NULL AND "
+            u"torrent_id NOT IN (SELECT torrent_id FROM _ChannelTorrents)")]
+        self.assertEqual(sorted(remaining), sorted(mypref_id + tracker_mapping_id))
+
+    @blocking_call_on_reactor_thread
+    def test_maintenance(self):
+        self.assertFalse(self.sqlitedb.get_maintenance_statistics()[u'incremental_vacuum'])
+        self.sqlitedb.clean_db(vacuum=True)
+        statistics = self.sqlitedb.get_maintenance_statistics()
+        self.assertTrue(statistics[u'incremental_vacuum'])
+        self.assertEqual(statistics[u'free_pages'], 0)
+
+        self.sqlitedb.execute(u"DELETE FROM Peer")
+        free_pages = self.sqlitedb.get_maintenance_statistics()[u'free_pages']
+        assert free_pages > 2, free_pages
+        vacuumed = self.sqlitedb._incremental_vacuum(2)
+        assert 0 < vacuumed <= 2, vacuumed
+        self.assertEqual(self.sqlitedb.get_maintenance_statistics()[u'free_pages'], free_pages - vacuumed)
+
+        self.sqlitedb._last_checkpoint_time = 0
+        self.sqlitedb._maintain()
+        statistics = self.sqlitedb.get_maintenance_statistics()
+        assert statistics[u'free_pages'] < free_pages - vacuumed, statistics
+        self.assertEqual(len(statistics[u'last_checkpoint']), 3)
+        assert statistics[u'wal_size'] > 0, statistics
+
+
 class TestSqlitePeerDBHandler(AbstractDB):
 
     def setUp(self):
@@ -184,6 +254,13 @@ class TestTorrentDBHandler(AbstractDB):
 
         super(TestTorrentDBHandler, self).tearDown()
 
+    def load_search_terms(self, batch_size=SEARCH_TERMS_BATCH_SIZE):
+        # the reactor does not run the next batches during the tests
+        if self.tdb._search_terms_loading is None:
+            self.tdb.loadSearchTerms(batch_size)
+        while self.tdb._search_terms_loading is not None:
+            self.tdb._loadSearchTermsBatch(batch_size)
+
     @blocking_call_on_reactor_thread
     def test_hasTorrent(self):
         infohash_str = 'AA8cTG7ZuPsyblbRE7CyxsrKUCg='
@@ -266,6 +343,129 @@ class TestTorrentDBHandler(AbstractDB):
         assert m_torrent['name'] == 'Tribler_4.1.7_src', m_torrent['name']
         assert m_torrent['last_tracker_check'] == 0
 
+    @blocking_call_on_reactor_thread
+    def test_addExternalTorrents(self):
+        old_size = self.tdb.size()
+
+        single_tdef = TorrentDef.load(S_TORRENT_PATH_BACKUP)
+        multiple_tdef = TorrentDef.load(M_TORRENT_PATH_BACKUP)
+        self.tdb.addExternalTorrents([(single_tdef, {}), (multiple_tdef, {u"category": u"other"})])
+        assert self.tdb.size() == old_size + 2, old_size - self.tdb.size()
+
+        single_torrent_id = self.tdb.getTorrentID(single_tdef.get_infohash())
+        multiple_torrent_id = self.tdb.getTorrentID(multiple_tdef.get_infohash())
+        sname = self.tdb.getOne('name', torrent_id=single_torrent_id)
+        assert sname == 'Tribler_4.1.7_src.zip', sname
+        cat = self.tdb.getOne('category', torrent_id=multiple_torrent_id)
+        assert cat == u'other', cat
+
+        m_trackers = self.tdb.getTrackerListByInfohash(multiple_tdef.get_infohash())
+        assert len(m_trackers) == 8, m_trackers
+
+        # adding the same torrents again does not add any rows
+        self.tdb.addExternalTorrents([(single_tdef, {}), (multiple_tdef, {})])
+        assert self.tdb.size() == old_size + 2, old_size - self.tdb.size()
+
+    @blocking_call_on_reactor_thread
+    def test_searchNames(self):
+        self.tdb.channelcast_db = ChannelCastDBHandler(self.session)
+        keys = ['infohash', 'T.name', 'T.num_seeders']
+        results = self.tdb.searchNames([u'content'], local=False, keys=keys)
+        assert len(results) == 25, len(results)
+        num_seeders = [result[2] for result in results]
+        assert num_seeders == sorted(num_seeders, reverse=True), num_seeders
+        assert results[0][4]['swarmname'] == {u'content'}, results[0][4]
+
+        results = self.tdb.searchNames([u'content'], keys=keys, doSort=False)
+        assert len(results) == 4848, len(results)
+        assert all(isinstance(result[0], str) and len(result[0]) == 20 for result in results)
+
+        if self.tdb._db.matchinfo_format == u"pcy":
+            rows = self.tdb._db.fetchall(u"SELECT matchinfo(FullTextIndex, 'pcx'), matchinfo(FullTextIndex, 'pcy') "
+                                         u"FROM FullTextIndex WHERE FullTextIndex MATCH ?", (u'content 1',))
+            assert rows and all(parse_matchinfo(x) == parse_matchinfo(y) for x, y in rows)
+
+    @blocking_call_on_reactor_thread
+    def test_addTrackersToTorrent(self):
+        tdef = TorrentDef.load(S_TORRENT_PATH_BACKUP)
+        self.tdb.addExternalTorrent(tdef)
+        with open(S_TORRENT_PATH_BACKUP, 'rb') as torrent_file:
+            torrent_data = torrent_file.read()
+        assert self.tdb.addTrackersToTorrent(tdef.get_infohash(), torrent_data) is torrent_data
+
+        torrent_id = self.tdb.getTorrentID(tdef.get_infohash())
+        self.tdb.addTorrentTrackerMappingInBatch(torrent_id, [u'DHT', u'udp://tracker.example.org:80/', u'invalid'])
+        assert self.session.lm.tracker_manager.get_tracker_info(u'udp://tracker.example.org:80') is not None
+        trackers = self.tdb.getTrackerListByTorrentID(torrent_id)
+        assert u'udp://tracker.example.org:80' in trackers and u'invalid' not in trackers, trackers
+
+        merged_tdef = TorrentDef.load_from_memory(self.tdb.addTrackersToTorrent(tdef.get_infohash(), torrent_data))
+        assert merged_tdef.get_tracker_hierarchy() == [[tdef.get_tracker()], ['udp://tracker.example.org:80']], \
+            merged_tdef.get_tracker_hierarchy()
+
+        # a torrent file that cannot be decoded is returned as it is
+        assert self.tdb.addTrackersToTorrent(tdef.get_infohash(), "invalid") == "invalid"
+
+    @blocking_call_on_reactor_thread
+    def test_getTorrentsOnTracker(self):
+        tdef = TorrentDef.load(S_TORRENT_PATH_BACKUP)
+        self.tdb.addExternalTorrent(tdef)
+        torrent_id = self.tdb.getTorrentID(tdef.get_infohash())
+        tracker = self.tdb.getTrackerListByTorrentID(torrent_id)[0]
+
+        torrents = self.tdb.getTorrentsOnTracker(tracker, 100)
+        assert torrents == [(torrent_id, tdef.get_infohash(), 0)], torrents
+
+        # the next check time of a torrent is kept up to date on all its trackers
+        self.tdb.updateTorrentCheckResult(torrent_id, tdef.get_infohash(), 1, 1, 50, 200, u'good', 0)
+        assert self.tdb.getTorrentsOnTracker(tracker, 100) == []
+        torrents = self.tdb.getTorrentsOnTracker(tracker, 300)
+        assert torrents == [(torrent_id, tdef.get_infohash(), 50)], torrents
+        assert self.tdb.getTorrentsOnTracker(u'udp://unknown.example.org:80', 300) == []
+
+    @blocking_call_on_reactor_thread
+    def test_getAutoCompleteTerms(self):
+        self.load_search_terms()
+        assert self.tdb.getAutoCompleteTerms(u'Con', max_terms=7) == [u'content']
+        assert self.tdb.getAutoCompleteTerms(u'content', max_terms=7) == []
+
+        self.tdb.addExternalTorrent(TorrentDef.load(S_TORRENT_PATH_BACKUP))
+        terms = self.tdb.getAutoCompleteTerms(u'content tri', max_terms=7)
+        assert terms == [u'content tribler'], terms
+
+    @blocking_call_on_reactor_thread
+    def test_getSearchSuggestion(self):
+        self.load_search_terms()
+        assert self.tdb.getSearchSuggestion([u'content']) == []
+        assert self.tdb.getSearchSuggestion([u'Contnt', u'trbler']) == [u'content trbler']
+
+        # the keywords of newly indexed torrents can be suggested right away
+        self.tdb.addExternalTorrent(TorrentDef.load(S_TORRENT_PATH_BACKUP))
+        suggestions = self.tdb.getSearchSuggestion([u'Contnt', u'trbler'], limit=3)
+        assert suggestions == [u'content tribler'], suggestions
+
+    @blocking_call_on_reactor_thread
+    def test_loadSearchTerms(self):
+        assert self.tdb.getAutoCompleteTerms(u'Con', max_terms=7) == []
+        assert self.tdb.getSearchSuggestion([u'Contnt']) == []
+
+        # a torrent that is indexed while the terms are loading is counted once
+        self.tdb.loadSearchTerms(batch_size=1)
+        self.tdb.addExternalTorrent(TorrentDef.load(S_TORRENT_PATH_BACKUP))
+        self.load_search_terms(batch_size=1)
+
+        assert self.tdb.getAutoCompleteTerms(u'content tri', max_terms=7) == [u'content tribler']
+        assert self.tdb.getSearchSuggestion([u'trbler']) == [u'tribler']
+        assert self.tdb.autocomplete_trie.term_frequency[u'tribler'] == 1, self.tdb.autocomplete_trie.term_frequency
+
+        # the trie is the same as one that is built from all names at once
+        trie = PrefixTrie()
+        trie.add_terms(term for swarmname, in self.tdb._db.fetchall(u"SELECT swarmname FROM FullTextIndex")
+                       if swarmname for term in swarmname.lower().split())
+        self.assertEqual(self.tdb.autocomplete_trie.term_frequency, trie.term_frequency)
+        for prefix in (u"c", u"co", u"t", u"s"):
+            self.assertEqual(self.tdb.autocomplete_trie.get_completions(prefix, 10), trie.get_completions(prefix, 10))
+
     @blocking_call_on_reactor_thread
     def updateTorrent(self):
         s_infohash = unhexlify('44865489ac16e2f34ea0cd3043cfd970cc24ec09')
@@ -291,14 +491,58 @@ class TestTorrentDBHandler(AbstractDB):
         res = self.tdb.getNumberCollectedTorrents()
         assert res == 4848, res
 
-    @unittest.skip("TODO, the database thingie shouldn't be deleting files from the FS.")
     @blocking_call_on_reactor_thread
     def test_freeSpace(self):
         old_res = self.tdb.getNumberCollectedTorrents()
-        self.tdb.freeSpace(20)
+        assert self.tdb.freeSpace(20) == 20
         res = self.tdb.getNumberCollectedTorrents()
         assert old_res - res == 20
 
+        # the evicted torrents are the ones with the lowest weight
+        sql = u"""SELECT max(min(relevance, 2500) + min(500, num_leechers) + 4 * min(500, num_seeders)
+                  - max(0, min(500, (? - creation_date) / 86400.0))) FROM Torrent WHERE is_collected == %d
+                  AND torrent_id NOT IN (SELECT torrent_id FROM MyPreference)"""
+        now = time()
+        max_evicted = self.sqlitedb.fetchone(sql % 0, (now,))
+        min_collected = self.sqlitedb.fetchone(sql.replace(u"max(", u"min(", 1) % 1, (now,))
+        assert max_evicted <= min_collected, (max_evicted, min_collected)
+
+    @blocking_call_on_reactor_thread
+    def test_freeSpace_creation_dates(self):
+        now = time()
+        self.sqlitedb.execute(u"UPDATE Torrent SET num_seeders = 500 WHERE is_collected == 1")
+
+        def add_torrents():
+            # torrents created in the future, 1000 and 100 days ago, with weights 10, 100 - 500 and 50 - 100
+            torrents = [(infohash2db(os.urandom(20)), now + 10 * 86400, 10),
+                        (infohash2db(os.urandom(20)), now - 1000 * 86400, 100),
+                        (infohash2db(os.urandom(20)), now - 100 * 86400, 50)]
+            self.sqlitedb.executemany(u"INSERT INTO Torrent (infohash, name, creation_date, relevance, num_seeders, "
+                                      u"num_leechers, is_collected) VALUES (?, 'torrent', ?, 0, 0, ?, 1)", torrents)
+            return [str(torrent[0]) for torrent in torrents]
+
+        def get_collected():
+            return set(str(infohash) for infohash,
+                       in self.sqlitedb.fetchall(u"SELECT infohash FROM Torrent WHERE is_collected == 1"))
+
+        def evict_one():
+            collected = get_collected()
+            self.assertEqual(self.tdb.freeSpace(1), 1)
+            evicted, = collected - get_collected()
+            return evicted
+
+        future, old, young = add_torrents()
+        self.assertEqual([evict_one() for _ in xrange(3)], [old, young, future])
+
+        # the same order when the age classes are scanned through the weight indexes
+        old_small_class = SqliteCacheDBHandler.EVICTION_SMALL_CLASS
+        SqliteCacheDBHandler.EVICTION_SMALL_CLASS = 1
+        try:
+            future, old, young = add_torrents()
+            self.assertEqual([evict_one() for _ in xrange(3)], [old, young, future])
+        finally:
+            SqliteCacheDBHandler.EVICTION_SMALL_CLASS = old_small_class
+
 
 class TestMyPreferenceDBHandler(AbstractDB):
 
@@ -365,3 +609,69 @@ class TestMyPreferenceDBHandler(AbstractDB):
         for k in res:
             data = res[k]
             assert isinstance(data, basestring), "data is not destination_path: %s" % type(data)
+
+
+class TestVoteCastDBHandler(AbstractDB):
+
+    def setUp(self):
+        super(TestVoteCastDBHandler, self).setUp()
+
+        self.vdb = VoteCastDBHandler(self.session)
+        self.cdb = ChannelCastDBHandler(self.session)
+        self.vdb.channelcast_db = self.cdb
+        self.cdb.votecast_db = self.vdb
+
+        insert_channel = u"INSERT INTO _Channels (dispersy_cid, peer_id, name, modified) VALUES (?, ?, ?, ?)"
+        self.sqlitedb.executemany(insert_channel, [(buffer(u"cid%d" % i), -1, u"channel %d" % i, i)
+                                                   for i in xrange(3)])
+        self.channel_ids = [channel_id for channel_id, in
+                            self.sqlitedb.fetchall(u"SELECT id FROM _Channels ORDER BY modified")]
+
+    @blocking_call_on_reactor_thread
+    def tearDown(self):
+        self.vdb.close()
+        self.vdb = None
+        self.cdb.close()
+        self.cdb = None
+
+        super(TestVoteCastDBHandler, self).tearDown()
+
+    @blocking_call_on_reactor_thread
+    def test_vote_counts(self):
+        first, second, third = self.channel_ids
+        self.vdb.on_votes_from_dispersy([(first, 1, 1, 2, 1), (first, 2, 2, 2, 1), (second, 1, 3, -1, 1),
+                                         (second, 2, 4, 2, 1), (third, None, 5, -1, 1)])
+        assert self.vdb.getPosNegVotes(first) == (2, 0)
+        assert self.vdb.getPosNegVotes(second) == (1, 1)
+        assert self.vdb.getPosNegVotes(third) == (0, 1)
+
+        # a changed vote replaces the old one
+        self.vdb.on_votes_from_dispersy([(first, 2, 6, -1, 2), (third, None, 7, 2, 2)])
+        assert self.vdb.getPosNegVotes(first) == (1, 1)
+        assert self.vdb.getPosNegVotes(third) == (1, 0)
+
+        self.vdb.on_remove_votes_from_dispersy([(3, first, 1), (3, second, 3)], False)
+        assert self.vdb.getPosNegVotes(first) == (0, 1)
+        assert self.vdb.getPosNegVotes(second) == (1, 0)
+
+        # channels created after their votes arrived count them too
+        self.vdb.on_votes_from_dispersy([(first + 100, 1, 8, 2, 1)])
+        self.sqlitedb.execute(u"INSERT INTO _Channels (id, dispersy_cid, peer_id, name) VALUES (?, ?, ?, ?)",
+                              (first + 100, buffer(u"cid100"), -1, u"channel 100"))
+        assert self.vdb.getPosNegVotes(first + 100) == (1, 0)
+
+    @blocking_call_on_reactor_thread
+    def test_getAllChannels(self):
+        first, second, third = self.channel_ids
+        self.vdb.on_votes_from_dispersy([(first, 1, 1, 2, 1), (first, 2, 2, 2, 1), (second, 1, 3, 2, 1),
+                                         (third, None, 4, -1, 1)])
+
+        # the most favorite channels first, the latest modified one first among equals, my spam last
+        channel_ids = [channel[0] for channel in self.cdb.getAllChannels()]
+        assert channel_ids == [first, second, third], channel_ids
+
+        self.vdb.on_votes_from_dispersy([(first, 1, 5, 0, 2), (first, 2, 6, 0, 2)])
+        channel_ids = [channel[0] for channel in self.cdb.getAllChannels()]
+        assert channel_ids == [second, first, third], channel_ids
+        channel_ids = [channel[0] for channel in self.cdb.getMostPopularChannels()]
+        assert channel_ids == [second, first], channel_ids
@@ -0,0 +1,83 @@
+import json
+import os
+import time
+from threading import currentThread
+
+from Tribler.Core.Modules.startup import ComponentInitializer, StartupProfiler
+from Tribler.Test.test_as_server import AbstractServer
+
+
+class TestComponentInitializer(AbstractServer):
+
+    def setUp(self, annotate=True):
+        super(TestComponentInitializer, self).setUp(annotate=annotate)
+        self.profiler = StartupProfiler()
+        self.initializer = ComponentInitializer(self.profiler)
+        self.initialized = []
+
+    def add(self, name, depends=(), critical=True, duration=0.0, thread_safe=False):
+        def init():
+            time.sleep(duration)
+            self.initialized.append((name, currentThread().getName()))
+        self.initializer.add(name, init, depends=depends, critical=critical, thread_safe=thread_safe)
+
+    def test_dependencies(self):
+        self.add(u"c", depends=[u"a", u"b"])
+        self.add(u"b", depends=[u"a", u"disabled"])
+        self.add(u"a")
+        self.initializer.run()
+        self.assertEqual([name for name, _ in self.initialized], [u"a", u"b", u"c"])
+
+    def test_concurrent(self):
+        self.add(u"a", duration=0.2, thread_safe=True)
+        self.add(u"b", duration=0.2, thread_safe=True)
+        self.add(u"c", duration=0.2)
+        start = time.time()
+        self.initializer.run()
+        self.assertLess(time.time() - start, 0.35)
+        self.assertEqual(set(self.initialized), {(u"a", u"Initialize-a"), (u"b", u"Initialize-b"),
+                                                 (u"c", currentThread().getName())})
+
+    def test_not_thread_safe(self):
+        self.add(u"a")
+        self.add(u"b")
+        self.add(u"c", depends=[u"d"])
+        self.add(u"d", duration=0.1, thread_safe=True)
+        self.initializer.run()
+        # the components that are not thread safe run one after the other on the calling thread
+        self.assertEqual(self.initialized, [(u"a", currentThread().getName()), (u"b", currentThread().getName()),
+                                            (u"d", u"Initialize-d"), (u"c", currentThread().getName())])
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError()
+        self.initializer.add(u"a", fail)
+        self.add(u"b", depends=[u"a"])
+        self.assertRaises(RuntimeError, self.initializer.run)
+        self.assertEqual(self.initialized, [])
+
+    def test_deferred(self):
+        self.add(u"a")
+        self.add(u"checker", critical=False)
+        self.initializer.run()
+        self.assertTrue(self.initializer.has_deferred())
+        self.assertEqual([name for name, _ in self.initialized], [u"a"])
+
+        self.initializer.run_deferred()
+        self.assertFalse(self.initializer.has_deferred())
+        self.assertEqual([name for name, _ in self.initialized], [u"a", u"checker"])
+
+    def test_report(self):
+        self.add(u"a", duration=0.05)
+        self.add(u"checker", critical=False)
+        self.initializer.run()
+        self.initializer.run_deferred()
+
+        filename = os.path.join(self.session_base_dir, u"startup_profile.json")
+        self.profiler.write_report(filename)
+        with open(filename, 'rb') as fp:
+            report = json.load(fp)
+        self.assertEqual([(step[u'name'], step[u'deferred']) for step in report[u'steps']],
+                         [(u"a", False), (u"checker", True)])
+        self.assertGreaterEqual(report[u'steps'][0][u'wall_time'], 0.05)
+        self.assertGreaterEqual(report[u'total_time'], report[u'core_time'])
@@ -0,0 +1,45 @@
+from Tribler.Core.Utilities.term_index import PrefixTrie, TrigramIndex, levenshtein
+from Tribler.Test.test_as_server import BaseTestCase
+
+
+class TestTrigramIndex(BaseTestCase):
+
+    def test_levenshtein(self):
+        self.assertEqual(levenshtein(u"kitten", u"sitting"), 3)
+        self.assertEqual(levenshtein(u"", u"abc"), 3)
+
+    def test_closest_terms(self):
+        index = TrigramIndex()
+        index.add_terms([u"ubuntu", u"desktop", u"1404", u"xx"])
+        index.add_terms([u"ubuntu", u"server"])
+        index.add_terms([u"kubuntu"])
+
+        self.assertEqual(len(index), 4)
+        self.assertNotIn(u"1404", index)
+        self.assertEqual(index.get_closest_terms(u"ubunto", limit=2), [(1, u"ubuntu"), (2, u"kubuntu")])
+        self.assertEqual(index.get_closest_terms(u"dekstop"), [(2, u"desktop")])
+        self.assertEqual(index.get_closest_terms(u"windows"), [])
+
+
+class TestPrefixTrie(BaseTestCase):
+
+    def test_completions(self):
+        trie = PrefixTrie(top_size=2)
+        trie.add_terms([u"ubuntu", u"ubuntu", u"uboot", u"ubiquity", u"ubiquity", u"ubiquity"])
+
+        self.assertEqual(trie.get_completions(u"ub", 5), [u"ubiquity", u"ubuntu"])
+        self.assertEqual(trie.get_completions(u"ubo", 5), [u"uboot"])
+        self.assertEqual(trie.get_completions(u"ubx", 5), [])
+
+        # uboot overtakes ubuntu
+        trie.add_terms([u"uboot"] * 3)
+        self.assertEqual(trie.get_completions(u"u", 1), [u"uboot"])
+        self.assertEqual(trie.get_completions(u"ubu", 5), [u"ubuntu"])
+
+    def test_prune(self):
+        trie = PrefixTrie(max_terms=8)
+        trie.add_terms([u"common"] * 3 + [u"rare%d" % i for i in xrange(8)])
+
+        self.assertEqual(len(trie), 6)
+        self.assertEqual(trie.get_completions(u"com", 5), [u"common"])
+        self.assertEqual(len(trie.get_completions(u"rare", 10)), 5)
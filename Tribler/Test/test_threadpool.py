@@ -5,9 +5,9 @@ import unittest
 
 import sys
 import time
-from threading import RLock, enumerate as enumerate_threads
+from threading import Event, RLock, enumerate as enumerate_threads
 
-from Tribler.Core.APIImplementation.ThreadPool import ThreadPool
+from Tribler.Core.APIImplementation.ThreadPool import ThreadPool, POLICY_DROP, POLICY_MERGE, POLICY_SERIAL
 from Tribler.Test.test_as_server import AbstractServer
 
 
@@ -130,6 +130,109 @@ class TestThreadPool(AbstractServer):
         time.sleep(1)
         self.test_joinAll()
 
+    def queue_blocked(self, tp, *tasks):
+        """
+        Queue tasks on a pool while its only thread is busy, so they are all waiting when it becomes available.
+        """
+        started = Event()
+        release = Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        tp.queueTask(block)
+        started.wait()
+        for task in tasks:
+            tp.queueTask(*task[0], **task[1])
+        release.set()
+
+    def test_priority(self):
+        self.exp = [1, 2, 3]
+        tp = ThreadPool(1)
+        self.queue_blocked(tp, ((self.do_task, (1,)), {}), ((self.do_task, (2,)), {}),
+                           ((self.do_task, (3,)), {'priority': 1}))
+        tp.joinAll()
+        self.assertEqual(self.got, [3, 1, 2])
+
+    def test_merge(self):
+        self.exp = [2, 3]
+        tp = ThreadPool(1)
+        self.queue_blocked(tp, ((self.do_task, (1,)), {'policy': POLICY_MERGE, 'key': 'a'}),
+                           ((self.do_task, (2,)), {'policy': POLICY_MERGE, 'key': 'a'}),
+                           ((self.do_task, (3,)), {'policy': POLICY_MERGE, 'key': 'b'}))
+        tp.joinAll()
+        self.assertEqual(tp.getStatistics()['merged'], 1)
+        self.assertEqual(tp.getStatistics()['tasks']['do_task']['count'], 2)
+
+    def test_merge_serial(self):
+        self.exp = [1, 2]
+        tp = ThreadPool(4)
+        started = Event()
+        release = Event()
+
+        def slow_task(val):
+            started.set()
+            release.wait()
+            self.do_task(val)
+
+        tp.queueTask(slow_task, (1,), policy=POLICY_MERGE, key='a')
+        started.wait()
+        # the other threads are idle, but the task with the same key waits for the running one
+        tp.queueTask(self.do_task, (2,), policy=POLICY_MERGE, key='a')
+        time.sleep(.5)
+        self.assertEqual(self.got, [])
+        self.assertEqual(tp.getQueueSize(), 1)
+        release.set()
+        tp.joinAll()
+        self.assertEqual(self.got, [1, 2])
+
+    def test_serial(self):
+        self.exp = range(1, 21)
+        tp = ThreadPool(4)
+
+        def task(val):
+            # give the other threads a chance to overtake this task
+            time.sleep(.01 * (val % 3))
+            self.do_task(val)
+
+        for val in self.exp:
+            tp.queueTask(task, (val,), policy=POLICY_SERIAL, key='a')
+        tp.joinAll()
+        self.assertEqual(self.got, self.exp)
+
+    def test_joinAll_drop_tasks(self):
+        tp = ThreadPool(1)
+        started = Event()
+        release = Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        tp.queueTask(block)
+        started.wait()
+        tp.queueTask(self.do_task, (1,))
+        tp.queueTask(self.do_task, (2,), policy=POLICY_MERGE, key='a')
+        tp.queueTask(self.do_task, (3,), policy=POLICY_SERIAL, key='b')
+        tp.queueTask(self.do_task, (4,), policy=POLICY_SERIAL, key='b')
+        tp.joinAll(waitForTasks=False, waitForThreads=False)
+        self.assertEqual(tp.getQueueSize(), 0)
+        release.set()
+        time.sleep(.5)
+        # the queued tasks are dropped and the pool does not accept new ones
+        self.assertFalse(tp.queueTask(self.do_task, (5,)))
+        self.assertEqual(self.got, [])
+
+    def test_drop(self):
+        self.exp = [1, 2]
+        tp = ThreadPool(1, maxQueueSize=2)
+        self.queue_blocked(tp, ((self.do_task, (1,)), {'policy': POLICY_DROP}),
+                           ((self.do_task, (2,)), {'policy': POLICY_DROP}),
+                           ((self.do_task, (3,)), {'policy': POLICY_DROP}))
+        tp.joinAll()
+        self.assertEqual(tp.getStatistics()['dropped'], 1)
+
     def do_task1(self):
         self.gotlock.acquire()
         self.got.append(1)
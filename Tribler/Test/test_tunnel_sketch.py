@@ -0,0 +1,63 @@
+from Tribler.Test.test_as_server import BaseTestCase
+from Tribler.community.tunnel.sketch import LRUSet, SlidingCountMinSketch
+from Tribler.community.tunnel.tunnel_community import TunnelSettings
+
+
+class TestSlidingCountMinSketch(BaseTestCase):
+
+    def setUp(self):
+        self.settings = TunnelSettings()
+        self.sketch = SlidingCountMinSketch(self.settings.packet_sketch_epsilon, self.settings.packet_sketch_delta,
+                                            self.settings.packet_window)
+
+    def test_estimate(self):
+        for _ in xrange(10):
+            self.sketch.increment(("1.2.3.4", 80), now=0)
+        self.assertEqual(self.sketch.estimate(("1.2.3.4", 80), now=0), 10)
+        self.assertEqual(self.sketch.estimate(("4.3.2.1", 80), now=0), 0)
+
+    def test_decay(self):
+        for _ in xrange(10):
+            self.sketch.increment(("1.2.3.4", 80), now=0)
+        self.assertEqual(self.sketch.estimate(("1.2.3.4", 80), now=90), 5)
+        self.assertEqual(self.sketch.estimate(("1.2.3.4", 80), now=120), 0)
+
+    def test_memory_usage(self):
+        self.assertEqual(self.sketch.memory_usage, 2 * 2 * self.sketch.width * self.sketch.depth)
+        self.assertLess(self.sketch.memory_usage, 16 * 1024)
+
+    def test_error_bound(self):
+        # an honest exit socket: many destinations that did not reply once and a few just under the limit
+        limit = self.settings.max_packets_without_reply
+        for i in xrange(4000):
+            self.sketch.increment(("10.0.%d.%d" % (i >> 8 & 255, i & 255), 1), now=0)
+        for i in xrange(100):
+            for _ in xrange(limit - 1):
+                self.sketch.increment(("20.0.0.%d" % i, 1), now=0)
+
+        overestimated = sum(1 for i in xrange(50000)
+                            if self.sketch.estimate(("11.0.%d.%d" % (i >> 8 & 255, i & 255), 1), now=0) >= limit)
+        self.assertEqual(overestimated, 0)
+
+
+class TestLRUSet(BaseTestCase):
+
+    def test_bounded(self):
+        replies = LRUSet(1000)
+        for i in xrange(1500):
+            replies.add(("10.0.%d.%d" % (i >> 8 & 255, i & 255), 1))
+        self.assertEqual(len(replies), 1000)
+        self.assertNotIn(("10.0.0.0", 1), replies)
+        self.assertIn(("10.0.5.219", 1), replies)
+
+        # destinations that never replied are never trusted
+        self.assertFalse(any(("11.0.%d.%d" % (i >> 8 & 255, i & 255), 1) in replies for i in xrange(1000)))
+
+    def test_touch(self):
+        replies = LRUSet(2)
+        replies.add("a")
+        replies.add("b")
+        replies.add("a")
+        replies.add("c")
+        self.assertIn("a", replies)
+        self.assertNotIn("b", replies)
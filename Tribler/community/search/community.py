@@ -592,7 +592,7 @@ class SearchCommunity(Community):
         torrent_data = self.tribler_session.get_collected_torrent(infohash)
         if torrent_data is not None:
             try:
-                torrentdef = TorrentDef.load_from_memory(torrent_data)
+                torrentdef = TorrentDef.load_from_memory(torrent_data, header_only=True)
                 files = torrentdef.get_files_as_unicode_with_length()
 
                 meta = self.get_meta_message(u"torrent")
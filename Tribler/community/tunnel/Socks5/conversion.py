@@ -207,26 +207,34 @@ def encode_reply(version, rep, rsv, address_type, bind_address, bind_port):
     return data
 
 
-def decode_udp_packet(data):
+def decode_udp_header(data):
     """
-    Decodes a SOCKS5 UDP packet
+    Decodes the header of a SOCKS5 UDP packet without copying its payload
     @param str data: the raw packet data
-    @return: An UdpRequest object containing the parsed data
-    @rtype: UdpRequest
+    @return: Tuple (frag, address_type, (host, port), payload_offset)
+    @rtype: (int, int, (str, int), int)
     """
-    offset = 0
-    (rsv, frag, address_type) = struct.unpack_from("!HBB", data, offset)
-    offset += 4
+    frag, address_type = struct.unpack_from("!xxBB", data, 0)
 
-    offset, destination_address = __decode_address(address_type, offset, data)
+    offset, destination_address = __decode_address(address_type, 4, data)
 
     destination_port, = struct.unpack_from("!H", data, offset)
-    offset += 2
 
-    payload = data[offset:]
+    return frag, address_type, (destination_address, destination_port), offset + 2
+
+
+def decode_udp_packet(data):
+    """
+    Decodes a SOCKS5 UDP packet
+    @param str data: the raw packet data
+    @return: An UdpRequest object containing the parsed data
+    @rtype: UdpRequest
+    """
+    rsv, = struct.unpack_from("!H", data, 0)
+    frag, address_type, destination, offset = decode_udp_header(data)
 
-    return UdpRequest(rsv, frag, address_type, destination_address,
-                      destination_port, payload)
+    return UdpRequest(rsv, frag, address_type, destination[0],
+                      destination[1], data[offset:])
 
 
 def encode_udp_packet(rsv, frag, address_type, address, port, payload):
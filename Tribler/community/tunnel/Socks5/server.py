@@ -1,4 +1,5 @@
 import logging
+import time
 
 from twisted.internet import reactor
 from twisted.internet.protocol import Protocol, DatagramProtocol, connectionDone, Factory
@@ -21,11 +22,80 @@ class ConnectionState(object):
     TCP_RELAY = 'TCP_RELAY'
 
 
+class UdpFragmentReassembler(object):
+
+    """
+    Reassembly queue for fragmented SOCKS5 UDP datagrams, as described in
+    section 7 of RFC 1928.
+
+    A single fragment sequence is kept per UDP association. The queue is
+    reinitialized when its timer expires, when a fragment with a lower FRAG
+    value than the highest one seen arrives, or when the queued payload would
+    exceed max_size bytes. A sequence only starts at FRAG 1 and is dropped
+    when a fragment is missing, so a datagram is never forwarded without its
+    head or middle. Fragments are stored as (data, offset) pairs, so payloads
+    are only copied once, when the datagram is complete.
+    """
+
+    def __init__(self, max_size=65535, timeout=5.0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.reset()
+
+    def reset(self):
+        self.destination = None
+        self.fragments = []
+        self.highest = 0
+        self.size = 0
+        self.started = 0
+
+    def feed(self, frag, destination, data, offset, now=None):
+        """
+        Add a fragment to the reassembly queue
+        @param int frag: the FRAG field of the datagram
+        @param (str, int) destination: the destination of the datagram
+        @param str data: the raw datagram
+        @param int offset: the offset of the payload in data
+        @return: the reassembled payload if this fragment completed the sequence, None otherwise
+        @rtype: str|None
+        """
+        now = time.time() if now is None else now
+        position = frag & 0x7f
+
+        if self.fragments and (now - self.started > self.timeout or position < self.highest or
+                               destination != self.destination):
+            self.reset()
+
+        if not self.fragments:
+            if position != 1:
+                return None
+            self.destination = destination
+            self.started = now
+        elif position != self.highest + 1:
+            self.reset()
+            return None
+
+        self.size += len(data) - offset
+        if self.size > self.max_size:
+            self.reset()
+            return None
+
+        self.fragments.append((data, offset))
+        self.highest = position
+
+        if frag & 0x80:
+            payload = ''.join(chunk[start:] for chunk, start in self.fragments)
+            self.reset()
+            return payload
+        return None
+
+
 class SocksUDPConnection(DatagramProtocol):
 
     def __init__(self, socksconnection, remote_udp_address):
         self._logger = logging.getLogger(self.__class__.__name__)
         self.socksconnection = socksconnection
+        self.reassembler = UdpFragmentReassembler()
 
         if remote_udp_address != ("0.0.0.0", 0):
             self.remote_udp_address = remote_udp_address
@@ -49,21 +119,24 @@ class SocksUDPConnection(DatagramProtocol):
             self.remote_udp_address = source
 
         if self.remote_udp_address == source:
-            request = conversion.decode_udp_packet(data)
-            if request.frag == 0:
-                circuit = self.socksconnection.select(request.destination)
-
-                if not circuit:
-                    self._logger.debug(
-                        "No circuits available, dropping %d bytes to %s", len(request.payload), request.destination)
-                elif circuit.state != CIRCUIT_STATE_READY:
-                    self._logger.debug(
-                        "Circuit is not ready, dropping %d bytes to %s", len(request.payload), request.destination)
-                else:
-                    self._logger.debug("Sending data over circuit destined for %s:%d", *request.destination)
-                    circuit.tunnel_data(request.destination, request.payload)
+            frag, _, destination, offset = conversion.decode_udp_header(data)
+            if frag == 0:
+                payload = data[offset:]
+            else:
+                payload = self.reassembler.feed(frag, destination, data, offset)
+                if payload is None:
+                    return
+
+            # Socks5Connection.select caches the selected circuit per destination
+            circuit = self.socksconnection.select(destination)
+
+            if not circuit:
+                self._logger.debug("No circuits available, dropping %d bytes to %s", len(payload), destination)
+            elif circuit.state != CIRCUIT_STATE_READY:
+                self._logger.debug("Circuit is not ready, dropping %d bytes to %s", len(payload), destination)
             else:
-                self._logger.debug("No support for fragmented data, dropping")
+                self._logger.debug("Sending data over circuit destined for %s:%d", *destination)
+                circuit.tunnel_data(destination, payload)
         else:
             self._logger.debug("Ignoring data from %s:%d, is not %s:%d",
                                source[0], source[1], self.remote_udp_address[0], self.remote_udp_address[1])
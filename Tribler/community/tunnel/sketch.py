@@ -0,0 +1,124 @@
+import math
+import random
+import time
+
+from array import array
+from collections import OrderedDict
+
+MAX_COUNT = 0xffff
+MERSENNE_PRIME = 2 ** 61 - 1
+
+
+class SlidingCountMinSketch(object):
+
+    """
+    Count-min sketch over a sliding time window, used to keep per-address
+    packet counters in a fixed amount of memory.
+
+    The sketch keeps two generations of counters. Every window seconds the
+    current generation becomes the previous one and a fresh one is started.
+    Estimates add the previous generation weighted by how much of it still
+    falls within the window, so counts decay instead of being reset at once.
+
+    With probability 1 - delta an estimate exceeds the real count by at most
+    epsilon times the number of increments in the window. Estimates never
+    underestimate. Counters saturate at MAX_COUNT.
+    """
+
+    def __init__(self, epsilon=0.01, delta=0.01, window=60.0):
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1.0 / delta)))
+        self.window = float(window)
+
+        # every row hashes with its own (a * hash(key) + b) mod MERSENNE_PRIME, so that keys colliding in one row
+        # are unlikely to collide in the others
+        self._row_hashes = [(random.randint(1, MERSENNE_PRIME - 1), random.randint(0, MERSENNE_PRIME - 1))
+                            for _ in xrange(self.depth)]
+
+        self._current = array('H', [0]) * (self.width * self.depth)
+        self._previous = array('H', [0]) * (self.width * self.depth)
+        self._started = None
+
+    @property
+    def memory_usage(self):
+        """
+        The number of bytes used by the counters, which does not depend on
+        the number of keys that have been added.
+        @rtype: int
+        """
+        return (len(self._current) + len(self._previous)) * self._current.itemsize
+
+    def _rotate(self, now):
+        if self._started is None:
+            self._started = now
+
+        elapsed = now - self._started
+        if elapsed >= self.window:
+            if elapsed >= 2 * self.window:
+                self._previous = array('H', [0]) * len(self._current)
+            else:
+                self._previous = self._current
+            self._current = array('H', [0]) * len(self._previous)
+            self._started = now - elapsed % self.window
+
+    def _indices(self, key):
+        h = hash(key)
+        width = self.width
+        return [row * width + (a * h + b) % MERSENNE_PRIME % width for row, (a, b) in enumerate(self._row_hashes)]
+
+    def increment(self, key, now=None):
+        """
+        Count one occurrence of key, using a conservative update so that only
+        the smallest counters are raised.
+        @return: the new estimate for key within the current generation
+        @rtype: int
+        """
+        self._rotate(time.time() if now is None else now)
+
+        current = self._current
+        indices = self._indices(key)
+        value = min(min(current[index] for index in indices) + 1, MAX_COUNT)
+        for index in indices:
+            if current[index] < value:
+                current[index] = value
+        return value
+
+    def estimate(self, key, now=None):
+        """
+        Estimate the number of occurrences of key within the sliding window
+        @rtype: float
+        """
+        now = time.time() if now is None else now
+        self._rotate(now)
+
+        indices = self._indices(key)
+        current = min(self._current[index] for index in indices)
+        previous = min(self._previous[index] for index in indices)
+        return current + previous * max(0.0, 1.0 - (now - self._started) / self.window)
+
+
+class LRUSet(object):
+
+    """
+    Set of at most capacity keys. When it is full, adding a key forgets the
+    key that was added or touched the longest time ago.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        """
+        Add key, or mark it as the most recently used key if it is already in the set
+        """
+        self._keys.pop(key, None)
+        self._keys[key] = None
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
@@ -7,7 +7,7 @@ CREATE TABLE MetadataMessage (
   dispersy_id            INTEGER NOT NULL,
   this_global_time       INTEGER NOT NULL,
   this_mid               TEXT NOT NULL,
-  infohash               TEXT NOT NULL,
+  infohash               BLOB NOT NULL,
   previous_mid           TEXT,
   previous_global_time   INTEGER
 );
@@ -51,7 +51,7 @@ CREATE UNIQUE INDEX permid_idx
 
 CREATE TABLE Torrent (
   torrent_id       integer PRIMARY KEY AUTOINCREMENT NOT NULL,
-  infohash		   text NOT NULL,
+  infohash		   blob NOT NULL,
   name             text,
   length           integer,
   creation_date    integer,
@@ -68,13 +68,52 @@ CREATE TABLE Torrent (
   is_collected     integer DEFAULT 0,
   last_tracker_check    integer DEFAULT 0,
   tracker_check_retries integer DEFAULT 0,
-  next_tracker_check    integer DEFAULT 0
+  next_tracker_check    integer DEFAULT 0,
+  eviction_weight       numeric,
+  eviction_date_weight  numeric
 );
 
 CREATE UNIQUE INDEX infohash_idx
   ON Torrent
   (infohash);
 
+-- freeSpace evicts the collected torrents with the lowest weight
+--   min(relevance, 2500) + min(500, num_leechers) + 4 * min(500, num_seeders) - min(500, age in days)
+-- eviction_weight holds the first part, eviction_date_weight adds the creation date in days to it. Torrents
+-- older than 500 days are ordered by eviction_weight and younger ones by eviction_date_weight. Age classes
+-- that hold few torrents are read through eviction_creation_date_idx instead.
+CREATE INDEX eviction_weight_idx
+  ON Torrent
+  (eviction_weight) WHERE is_collected == 1;
+
+CREATE INDEX eviction_date_weight_idx
+  ON Torrent
+  (eviction_date_weight) WHERE is_collected == 1;
+
+CREATE INDEX eviction_creation_date_idx
+  ON Torrent
+  (creation_date) WHERE is_collected == 1;
+
+CREATE TRIGGER eviction_weight_insert AFTER INSERT ON Torrent
+BEGIN
+  UPDATE Torrent SET
+    eviction_weight = CASE WHEN NEW.creation_date IS NOT NULL THEN
+      min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders) END,
+    eviction_date_weight = min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders)
+                           + NEW.creation_date / 86400.0
+  WHERE torrent_id = NEW.torrent_id;
+END;
+
+CREATE TRIGGER eviction_weight_update AFTER UPDATE OF relevance, num_leechers, num_seeders, creation_date ON Torrent
+BEGIN
+  UPDATE Torrent SET
+    eviction_weight = CASE WHEN NEW.creation_date IS NOT NULL THEN
+      min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders) END,
+    eviction_date_weight = min(NEW.relevance, 2500) + min(500, NEW.num_leechers) + 4 * min(500, NEW.num_seeders)
+                           + NEW.creation_date / 86400.0
+  WHERE torrent_id = NEW.torrent_id;
+END;
+
 ----------------------------------------
 
 CREATE TABLE TrackerInfo (
@@ -88,11 +127,31 @@ CREATE TABLE TrackerInfo (
 CREATE TABLE TorrentTrackerMapping (
   torrent_id  integer NOT NULL,
   tracker_id  integer NOT NULL,
+  next_check  integer DEFAULT 0,
   FOREIGN KEY (torrent_id) REFERENCES Torrent(torrent_id),
   FOREIGN KEY (tracker_id) REFERENCES TrackerInfo(tracker_id),
   PRIMARY KEY (torrent_id, tracker_id)
 );
 
+-- next_check is the next_tracker_check of the torrent, so that the torrents due for a check on a tracker can be
+-- found with a range scan of TorrentTrackerNextCheckIndex
+CREATE INDEX TorrentTrackerNextCheckIndex
+  ON TorrentTrackerMapping
+  (tracker_id, next_check);
+
+CREATE TRIGGER tracker_next_check_insert AFTER INSERT ON TorrentTrackerMapping
+BEGIN
+  UPDATE TorrentTrackerMapping SET
+    next_check = (SELECT next_tracker_check FROM Torrent WHERE torrent_id = NEW.torrent_id)
+  WHERE torrent_id = NEW.torrent_id AND tracker_id = NEW.tracker_id;
+END;
+
+CREATE TRIGGER tracker_next_check_update AFTER UPDATE OF next_tracker_check ON Torrent
+WHEN NEW.next_tracker_check IS NOT OLD.next_tracker_check
+BEGIN
+  UPDATE TorrentTrackerMapping SET next_check = NEW.next_tracker_check WHERE torrent_id = NEW.torrent_id;
+END;
+
 ----------------------------------------
 
 CREATE VIEW CollectedTorrent AS SELECT * FROM Torrent WHERE is_collected == 1;
@@ -115,6 +174,9 @@ CREATE TABLE IF NOT EXISTS _Channels (
 );
 CREATE VIEW Channels AS SELECT * FROM _Channels WHERE deleted_at IS NULL;
 
+-- listing channels orders them by their number of votes, which the channel_votes triggers keep up to date
+CREATE INDEX IF NOT EXISTS ChannelVotesCountIndex ON _Channels(nr_favorite, nr_spam);
+
 CREATE TABLE IF NOT EXISTS _ChannelTorrents (
   id                        integer         PRIMARY KEY ASC,
   dispersy_id               integer,
@@ -270,6 +332,36 @@ CREATE VIEW ChannelVotes AS SELECT * FROM _ChannelVotes WHERE deleted_at IS NULL
 CREATE INDEX IF NOT EXISTS ChaVotIndex ON _ChannelVotes(channel_id);
 CREATE INDEX IF NOT EXISTS VotChaIndex ON _ChannelVotes(voter_id);
 
+-- nr_favorite and nr_spam of _Channels count the votes of 2 and -1 in ChannelVotes
+CREATE TRIGGER channel_votes_insert AFTER INSERT ON _ChannelVotes WHEN NEW.deleted_at IS NULL
+BEGIN
+  UPDATE _Channels SET nr_favorite = nr_favorite + (NEW.vote == 2), nr_spam = nr_spam + (NEW.vote == -1)
+  WHERE id = NEW.channel_id;
+END;
+
+CREATE TRIGGER channel_votes_update AFTER UPDATE OF channel_id, vote, deleted_at ON _ChannelVotes
+BEGIN
+  UPDATE _Channels SET nr_favorite = nr_favorite - (OLD.vote == 2), nr_spam = nr_spam - (OLD.vote == -1)
+  WHERE id = OLD.channel_id AND OLD.deleted_at IS NULL;
+  UPDATE _Channels SET nr_favorite = nr_favorite + (NEW.vote == 2), nr_spam = nr_spam + (NEW.vote == -1)
+  WHERE id = NEW.channel_id AND NEW.deleted_at IS NULL;
+END;
+
+CREATE TRIGGER channel_votes_delete AFTER DELETE ON _ChannelVotes WHEN OLD.deleted_at IS NULL
+BEGIN
+  UPDATE _Channels SET nr_favorite = nr_favorite - (OLD.vote == 2), nr_spam = nr_spam - (OLD.vote == -1)
+  WHERE id = OLD.channel_id;
+END;
+
+-- votes can arrive before the channel they are cast on
+CREATE TRIGGER channel_votes_channel_insert AFTER INSERT ON _Channels
+BEGIN
+  UPDATE _Channels SET
+    nr_favorite = (SELECT count(*) FROM ChannelVotes WHERE channel_id = NEW.id AND vote == 2),
+    nr_spam = (SELECT count(*) FROM ChannelVotes WHERE channel_id = NEW.id AND vote == -1)
+  WHERE id = NEW.id;
+END;
+
 CREATE TABLE IF NOT EXISTS TorrentFiles (
   torrent_id            integer NOT NULL,
   path                  text    NOT NULL,
@@ -302,7 +394,7 @@ COMMIT TRANSACTION create_table;
 
 BEGIN TRANSACTION init_values;
 
-INSERT INTO MyInfo VALUES ('version', 27);
+INSERT INTO MyInfo VALUES ('version', 31);
 
 INSERT INTO MetaDataTypes ('name') VALUES ('name');
 INSERT INTO MetaDataTypes ('name') VALUES ('description');